@@ -10,12 +10,12 @@ from typing import (
 
 from pydantic import BaseModel
 from ryz import log
-from ryz.core import Coded, Err, Ok, Res, aresultify, resultify
+from ryz.core import Code, Coded, Err, Ok, Res, aresultify, resultify
 from ryz.singleton import Singleton
 
 from orwynn import env, middleware
 from orwynn.cfg import Cfg, CfgPack, CfgPackUtils, TCfg
-from orwynn.middleware import Middleware, Next
+from orwynn.middleware import Middleware, MiddlewareSpec, Next
 from orwynn.sys import Sys, SysInp, SysSpec
 from orwynn.yon.server import (
     Bus,
@@ -27,6 +27,7 @@ from orwynn.yon.server import (
 
 __all__ =[
     "Middleware",
+    "MiddlewareSpec",
     "Next",
     "App",
     "AppCfg",
@@ -103,6 +104,12 @@ class AppCfg(Cfg):
     subclasses.
     """
     middlewares: list[Middleware] = []
+    """
+    Middlewares applied to every system, in the given order.
+
+    Wrap a middleware in [`MiddlewareSpec`] to apply it only to systems of
+    certain msg types or codes.
+    """
 
 class App(Singleton):
     _SYS_SIGNATURE_PARAMS_LEN: int = 2
@@ -262,24 +269,39 @@ class App(Singleton):
             extra={}
         )
 
+        code = Code.get_from_type(spec.msgtype).unwrap()
         unsub = (await self._bus.sub(
             spec.msgtype,
-            self._wrap_sys_as_sub(spec.fn, inp)
+            self._wrap_sys_as_sub(
+                spec.fn,
+                inp,
+                middleware.select(self._cfg.middlewares, spec.msgtype, code)
+            )
         ))
         return unsub.unwrap()
 
     def _wrap_sys_as_sub(
         self,
         sys: Sys,
-        inp: SysInp
+        inp: SysInp,
+        middlewares: list[Middleware]
     ) -> SubFn:
-        # we copy inp here so pipes can skip copying. It's highly recommended
-        # for pipes to not create side effects with the inp objects since it's
-        # allowed to be changed throughout pipeline.
-        inp = inp.model_copy()
+        # the chain is compiled once per system, not per each incoming msg
+        chain = middleware.construct(
+            middlewares,
+            sys,
+            self._bus.trace_ctx_span if self._bus.is_tracing_enabled()
+                else None
+        )
         async def inner(msg: Msg) -> Res[Msg]:
-            inp.msg = msg
-            return await middleware.construct(self._cfg.middlewares, sys)(inp)
+            # inp is copied per call, since calls of the same system may run
+            # concurrently. Pipes can skip copying, though it's highly
+            # recommended for them to not create side effects with the inp
+            # objects since it's allowed to be changed throughout pipeline.
+            return await chain(inp.model_copy(update={"msg": msg}))
+        # named after the system, e.g. for metrics
+        inner.__module__ = sys.__module__
+        inner.__qualname__ = getattr(sys, "__qualname__", inner.__qualname__)
         return inner
 
 SysInp.model_rebuild()
@@ -1,23 +1,92 @@
-from typing import Awaitable, Callable
+from contextlib import AbstractContextManager
+from typing import Any, Awaitable, Callable, Iterable
 
 from ryz.core import Res
 
 from orwynn.sys import Sys, SysInp
+from orwynn.yon.server.metrics import get_subfn_name
 from orwynn.yon.server.msg import Msg
 
 Next = Callable[[SysInp], Awaitable[Res[Msg]]]
 Middleware = Callable[[SysInp, Next], Awaitable[Res[Msg]]]
+Trace = Callable[[str], AbstractContextManager[Any]]
+
+class MiddlewareSpec:
+    """
+    Middleware restricted to certain msgs.
+
+    The middleware is applied only to systems which msg type is listed in
+    `msgtypes`, or which msg code is listed in `codes`. If both are None, the
+    middleware is applied to all systems.
+
+    The spec is itself a middleware, so it can be passed wherever regular
+    middlewares are accepted.
+    """
+    def __init__(
+        self,
+        fn: Middleware,
+        msgtypes: Iterable[type] | None = None,
+        codes: Iterable[str] | None = None
+    ):
+        self.fn = fn
+        self.msgtypes = set(msgtypes) if msgtypes is not None else None
+        self.codes = set(codes) if codes is not None else None
+
+    async def __call__(self, inp: SysInp, next: Next) -> Res[Msg]:
+        return await self.fn(inp, next)
+
+    def is_applicable(self, msgtype: type, code: str) -> bool:
+        if self.msgtypes is None and self.codes is None:
+            return True
+        return \
+            (self.msgtypes is not None and msgtype in self.msgtypes) \
+            or (self.codes is not None and code in self.codes)
+
+def select(
+    middlewares: Iterable[Middleware], msgtype: type, code: str
+) -> list[Middleware]:
+    """
+    Selects middlewares applicable to the msg type with the code.
+
+    Middlewares not wrapped in [`MiddlewareSpec`] are always applicable.
+    """
+    return [
+        m for m in middlewares
+        if not isinstance(m, MiddlewareSpec)
+            or m.is_applicable(msgtype, code)
+    ]
 
 def construct(
-    middlewares: list[Middleware], sys: Sys
+    middlewares: list[Middleware], sys: Sys, trace: Trace | None = None
 ) -> Next:
+    """
+    Compiles middlewares and the system into a single call chain.
+
+    The chain is built once, so the returned fn can be reused for any number
+    of calls.
+
+    If `trace` is given, each middleware call is wrapped into a span opened
+    by it, see [`Bus::trace_ctx_span`].
+    """
+    chain: Next = sys
+    for middleware in reversed(middlewares):
+        # unwrap specs to not pay for the extra call on each msg
+        fn = \
+            middleware.fn if isinstance(middleware, MiddlewareSpec) \
+            else middleware
+        chain = \
+            _link(fn, chain) if trace is None \
+            else _link_traced(fn, chain, trace)
+    return chain
+
+def _link(middleware: Middleware, next: Next) -> Next:
+    async def inner(inp: SysInp) -> Res[Msg]:
+        return await middleware(inp, next)
+    return inner
+
+def _link_traced(middleware: Middleware, next: Next, trace: Trace) -> Next:
+    name = f"yon middleware {get_subfn_name(middleware)}"
     async def inner(inp: SysInp) -> Res[Msg]:
-        if len(middlewares) == 0:
-            return await sys(inp)
-        middleware = middlewares[0]
-        next_middlewares = middlewares[1:]
-        return await middleware(
-            inp,
-            construct(next_middlewares, sys)
-        )
+        with trace(name):
+            return await middleware(inp, next)
     return inner
@@ -7,6 +7,7 @@ Yon server implementation for Python.
 
 import asyncio
 import contextlib
+import time
 import typing
 from asyncio import Queue
 from contextvars import ContextVar
@@ -15,35 +16,79 @@ from typing import (
     Any,
     Callable,
     ClassVar,
+    Coroutine,
     Generic,
     Iterable,
+    Iterator,
     Protocol,
+    Sequence,
     runtime_checkable,
 )
 
 from pydantic import BaseModel
 from ryz import log
 from ryz.core import Code, Coded, Err, Ok, Res, aresultify, ecode
-from ryz.ptr import ptr
 from ryz.singleton import Singleton
 from ryz.uuid import uuid4
 
+from orwynn.yon.server import metrics, wire
+from orwynn.yon.server.codec import (
+    Codec,
+    JsonCodec,
+    MsgspecCodec,
+    OrjsonCodec,
+    get_default_codec,
+)
+from orwynn.yon.server.decode import Decoder, decode_rbmsg
+from orwynn.yon.server.fieldfilter import FieldFilter, FilterIndex, In
+from orwynn.yon.server.groups import GroupIndex
+from orwynn.yon.server.metrics import Metrics
 from orwynn.yon.server.msg import (
     Bmsg,
+    Envelope,
+    InpQueueHigh,
+    InpQueueLow,
     Msg,
+    SetWireFmt,
     TMsg_contra,
     Welcome,
     ok,
 )
+from orwynn.yon.server.netlog import NetLogger, NetLogSink
+from orwynn.yon.server.pending import PendingReq, PendingReqs
+from orwynn.yon.server.retain import RetainCache, RetainOpts
+from orwynn.yon.server.sid import (
+    SidStrategy,
+    from_net_sid,
+    set_sid_strategy,
+)
+from orwynn.yon.server.subtrie import SubTrie, is_pattern, match_pattern
+from orwynn.yon.server.tcp import Tcp, TcpServer
+from orwynn.yon.server.timer import TimerWheel
+from orwynn.yon.server.tracing import (
+    FileSpanExporter,
+    MemorySpanExporter,
+    Span,
+    SpanCtx,
+    SpanKind,
+    Tracer,
+)
 from orwynn.yon.server.transport import (
     ActiveTransport,
     Con,
     ConArgs,
+    InpOverloadPolicy,
     OnRecvFn,
     OnSendFn,
+    Outbox,
+    OutboxItem,
+    SlowConPolicy,
     Transport,
 )
-from orwynn.yon.server.udp import Udp
+from orwynn.yon.server.udp import Udp, UdpEndpoint
+from orwynn.yon.server.uds import Uds, UdsServer
+from orwynn.yon.server.watch import ConWatcher
+from orwynn.yon.server.wire import WireFmt
 from orwynn.yon.server.ws import Ws
 
 __all__ = [
@@ -52,16 +97,40 @@ __all__ = [
     "ok",
     "SubOpts",
     "PubOpts",
+    "RetainOpts",
+    "In",
 
     "Msg",
+    "SetWireFmt",
+    "InpQueueHigh",
+    "InpQueueLow",
 
     "StaticCodeid",
+    "BusEcode",
+    "WireFmt",
+    "SidStrategy",
+
+    "Codec",
+    "JsonCodec",
+    "OrjsonCodec",
+    "MsgspecCodec",
+
+    "Tracer",
+    "MemorySpanExporter",
+    "FileSpanExporter",
 
     "Con",
     "ConArgs",
     "Transport",
+    "SlowConPolicy",
+    "InpOverloadPolicy",
     "Ws",
     "Udp",
+    "UdpEndpoint",
+    "Tcp",
+    "TcpServer",
+    "Uds",
+    "UdsServer",
     "OnSendFn",
     "OnRecvFn",
 ]
@@ -72,6 +141,14 @@ class StaticCodeid:
     """
     Welcome = 0
     Ok = 1
+    SetWireFmt = 2
+
+class BusEcode:
+    """
+    Error codes registered by the bus in addition to the generic ones.
+    """
+    Overload = "overload_err"
+    Timeout = "timeout_err"
 
 @runtime_checkable
 class SubFn(Protocol, Generic[TMsg_contra]):
@@ -87,6 +164,22 @@ class PubOpts(BaseModel):
     Defaults to only ctx consid, if it exists.
     """
 
+    target_groups: list[str] | None = None
+    """
+    Groups of cons to publish to, see [`Bus.join_group`].
+
+    Combined with `target_consids`, each con receives the msg once. If set,
+    ctx consid isn't used as the default target.
+    """
+
+    target_tokens: list[str] | None = None
+    """
+    Tokens of cons to publish to, e.g. to reach all sessions of a user, see
+    [`Bus.set_con_tokens`].
+
+    Combined with other targets the same way as `target_groups`.
+    """
+
     lsid: str | None = None
     """
     Lsid to be used in the msg.
@@ -116,6 +209,20 @@ class PubOpts(BaseModel):
 
 class SubOpts(BaseModel):
     recv_last_msg: bool = True
+    """
+    Whether to receive msgs retained for the code right on subscription.
+
+    Msgs are retained only for codes opted in with `BusCfg.retained_codes`
+    or [`Bus.set_code_retention`].
+    """
+    field_filters: dict[str, Any] | None = None
+    """
+    Fields of msgs mapped to values they must be equal to, or to [`In`] of
+    values they must be one of. The subfn is called only for msgs matching
+    all of the filters, see [`fieldfilter`].
+
+    Not supported for code patterns.
+    """
 
 _yon_ctx = ContextVar("yon", default={})
 
@@ -153,6 +260,70 @@ class BusCfg(BaseModel):
 
     log_net_send: bool = True
     log_net_recv: bool = True
+    log_net_sample_rates: dict[str, float] | None = None
+    """
+    Share of net rbmsgs logged per code, from 0 to 1. Codes not listed are
+    logged always.
+    """
+    log_net_max_payload_len: int = 512
+    """
+    Max length of a logged net rbmsg. Longer ones are truncated.
+    """
+    log_net_queue_size: int = 10000
+    """
+    Max number of net log lines waiting for the background log thread.
+    Exceeding lines are dropped.
+    """
+
+    collect_metrics: bool = False
+    """
+    Whether to collect bus metrics, see [`Bus::get_metrics`].
+
+    Subfns subscribed while enabled are timed on each call.
+    """
+
+    tracer: Tracer | None = None
+    """
+    Tracer recording spans of msgs handling, see [`tracing`]. None disables
+    tracing.
+    """
+
+    sid_strategy: str = SidStrategy.Uuid
+    """
+    How sids of msgs are generated, see [`SidStrategy`].
+
+    The strategy is process-wide, since msgs may be created before they
+    reach the bus.
+    """
+
+    timer_tick: float = 0.1
+    """
+    Precision in seconds of bus timers, such as `PubOpts.pubr_timeout`.
+    """
+
+    retained_codes: dict[str, RetainOpts] | None = None
+    """
+    Codes which last published msgs are retained for subscribers with
+    `SubOpts.recv_last_msg`, see [`RetainOpts`].
+    """
+    retain_max_bytes: int = 16 * 1024 * 1024
+    """
+    Total estimated size of retained msgs of all codes.
+
+    Once exceeded, least recently used msgs are evicted.
+    """
+
+    concurrent_codes: dict[str, int] | None = None
+    """
+    Codes which subfns are called concurrently for a single msg, mapped to
+    the max number of subfns of the code running at the same time.
+
+    Zero or less means no limit. Subfns of codes not listed here are called
+    one after another, in order of subscription.
+    """
+
+    class Config:
+        arbitrary_types_allowed = True
 
 class Bus(Singleton):
     """
@@ -170,7 +341,8 @@ class Bus(Singleton):
     )
     DEFAULT_CODE_ORDER: ClassVar[list[str]] = [
         "yon::server::welcome",
-        "yon::ok"
+        "yon::ok",
+        "yon::set_wire_fmt"
     ]
 
     def __init__(self):
@@ -185,23 +357,58 @@ class Bus(Singleton):
 
     def set_con_tokens(
             self, consid: str, tokens: list[str]) -> Res[None]:
+        """
+        Sets tokens of the con, indexing the con by them.
+
+        Tokens set directly on the con aren't indexed.
+        """
         con = self._sid_to_con.get(consid, None)
         if con is None:
             return Err(f"no con with sid {consid}")
+        self._token_index.leave_all(consid)
+        for token in tokens:
+            self._token_index.join(consid, token)
         con.set_tokens(tokens)
         return Ok(None)
 
+    def get_token_consids(self, token: str) -> tuple[str, ...]:
+        return self._token_index.get_consids(token)
+
     def set_con_name(
         self,
         consid: str,
         name: str
     ) -> Res[None]:
+        """
+        Sets name of the con, indexing the con by it.
+
+        Names are unique among active cons.
+        """
         con = self._sid_to_con.get(consid, None)
         if con is None:
             return Err(f"no con with sid {consid}")
+        owner = self._name_to_consid.get(name, None)
+        if owner is not None and owner != consid:
+            return Err(f"con name {name} is taken by con {owner}")
+        self._forget_con_name(con)
+        self._name_to_consid[name] = consid
         con.set_name(name)
         return Ok()
 
+    def get_consid_by_name(self, name: str) -> Res[str]:
+        consid = self._name_to_consid.get(name, None)
+        if consid is None:
+            return Err(f"no con with name {name}", ecode.NotFound)
+        return Ok(consid)
+
+    def _forget_con_name(self, con: Con):
+        name = con.get_name()
+        if (
+            isinstance(name, Ok)
+            and self._name_to_consid.get(name.ok, None) == con.sid
+        ):
+            del self._name_to_consid[name.ok]
+
     def get_con_name(
         self, consid: str
     ) -> Res[str]:
@@ -223,16 +430,68 @@ class Bus(Singleton):
             return consid_res
         return self.set_con_tokens(consid_res.ok, tokens)
 
+    def join_group(self, consid: str, group: str) -> Res[None]:
+        """
+        Adds the con to a named group, such as a chat room.
+
+        Msgs published with the group in `PubOpts.target_groups` are sent to
+        all of its cons. Cons leave their groups on disconnect.
+        """
+        if consid not in self._sid_to_con:
+            return Err(f"no con with sid {consid}")
+        self._groups.join(consid, group)
+        return Ok(None)
+
+    def leave_group(self, consid: str, group: str) -> Res[None]:
+        if not self._groups.leave(consid, group):
+            return Err(f"con {consid} is not in group {group}")
+        return Ok(None)
+
+    def get_group_consids(self, group: str) -> tuple[str, ...]:
+        return self._groups.get_consids(group)
+
+    def get_con_groups(self, consid: str) -> list[str]:
+        return self._groups.get_groups(consid)
+
+    def join_ctx_group(self, group: str) -> Res[None]:
+        consid_res = self.get_ctx_consid()
+        if isinstance(consid_res, Err):
+            return consid_res
+        return self.join_group(consid_res.ok, group)
+
+    def leave_ctx_group(self, group: str) -> Res[None]:
+        consid_res = self.get_ctx_consid()
+        if isinstance(consid_res, Err):
+            return consid_res
+        return self.leave_group(consid_res.ok, group)
+
     async def close_con(self, consid: str) -> Res[None]:
         con = self._sid_to_con.get(consid, None)
         if con is None:
             return Err(f"no con with sid {consid}")
-        if con.is_closed:
+        if con.is_closed():
             return Err("already closed")
-        if consid in self._sid_to_con:
-            del self._sid_to_con[consid]
+        self._forget_con(con)
         return await aresultify(con.close())
 
+    def _forget_con(self, con: Con):
+        """
+        Drops all bus state of the con.
+        """
+        if con.sid in self._sid_to_con:
+            del self._sid_to_con[con.sid]
+        self._groups.leave_all(con.sid)
+        self._token_index.leave_all(con.sid)
+        self._forget_con_name(con)
+        outbox = self._consid_to_outbox.pop(con.sid, None)
+        if outbox is not None:
+            outbox.close()
+        self._con_watcher.unwatch(con.sid)
+        for req in self._pending_reqs.pop_for_con(con.sid):
+            self._cancel_pending_req(
+                req, Err(f"con {con} disconnected", ecode.NotFound)
+            )
+
     def get_ctx(self) -> dict:
         return _yon_ctx.get().copy()
 
@@ -245,35 +504,85 @@ class Bus(Singleton):
         self._init_transports()
 
         self._sid_to_con: dict[str, Con] = {}
+        self._consid_to_outbox: dict[str, Outbox] = {}
+        self._groups = GroupIndex()
+        # cons sharing a token are indexed the same way as group members
+        self._token_index = GroupIndex()
+        self._name_to_consid: dict[str, str] = {}
 
         self._subsid_to_code: dict[str, str] = {}
         self._subsid_to_subfn: dict[str, SubFn] = {}
         self._code_to_subfns: dict[str, list[SubFn]] = {}
-        self._code_to_last_mbody: dict[str, Msg] = {}
+        self._sub_trie = SubTrie()
+        """
+        Subscriptions to code patterns, see [`subtrie`].
+        """
+        self._code_to_filter_index: dict[str, FilterIndex] = {}
+        """
+        Subscriptions with `SubOpts.field_filters`.
+        """
+        self._code_to_concurrency_sem: dict[
+            str, asyncio.Semaphore | None
+        ] = {}
+        """
+        Codes with concurrent fan-out enabled. None semaphore means no limit
+        on number of concurrent subfns.
+        """
+        for code, limit in (cfg.concurrent_codes or {}).items():
+            self.set_code_concurrency(code, limit)
 
         self._preserialized_welcome_msg: dict = {}
 
-        self._lsid_to_subfn: dict[str, SubFn] = {}
+        self._timer_wheel = TimerWheel(cfg.timer_tick)
+        self._timer_wheel_task = asyncio.create_task(self._timer_wheel.run())
+        self._pending_reqs = PendingReqs(self._timer_wheel)
         """
         Subscribers awaiting arrival of linked message.
         """
-        self._lsids_to_del_on_next_pubfn: set[str] = set()
+        self._retain_cache = RetainCache(
+            self._timer_wheel, cfg.retain_max_bytes
+        )
+        for code, retain_opts in (cfg.retained_codes or {}).items():
+            self.set_code_retention(code, retain_opts)
+        self._net_logger: NetLogger | None = None
+        if cfg.log_net_send or cfg.log_net_recv:
+            self._net_logger = NetLogger(
+                NetLogSink(max_queue_size=cfg.log_net_queue_size),
+                self._get_cached_code_or_none,
+                cfg.log_net_sample_rates,
+                cfg.log_net_max_payload_len
+            )
+        self._metrics: Metrics | None = None
+        if cfg.collect_metrics:
+            self._metrics = Metrics()
+        self._tracer = cfg.tracer
+        set_sid_strategy(cfg.sid_strategy).unwrap()
+        self._sid_strategy = cfg.sid_strategy
+        self._con_watcher = ConWatcher(
+            self._timer_wheel, self._on_con_idle, self._on_con_ping
+        )
 
         self._is_initd = True
         self._is_post_initd = False
 
         self._rpc_tasks: set[asyncio.Task] = set()
+        self._bg_tasks: set[asyncio.Task] = set()
 
         self._cached_codes: list[str] = []
         """
         Since order of codes doesn't change, we can maintain a list of
         codes, and renew it on each [`Bus._set_welcome`] call.
         """
+        self._codeid_to_decoder: list[Decoder | None] = []
+
         (await self.reg_regular_codes(
             # by yon protocol, welcome msg is always the first, to be
             # recognizable without knowing code ids
             Welcome,
             ok,
+            SetWireFmt,
+            InpQueueHigh,
+            InpQueueLow,
             *(cfg.reg_regular_codes if cfg.reg_regular_codes else []),
             _set_welcome=False
         )).unwrap()
@@ -287,6 +596,8 @@ class Bus(Singleton):
             ecode.Panic,
             ecode.Unsupported,
             ecode.Val,
+            BusEcode.Overload,
+            BusEcode.Timeout,
             *(cfg.reg_ecodes if cfg.reg_ecodes else []),
             _set_welcome=False
         )).unwrap()
@@ -297,10 +608,41 @@ class Bus(Singleton):
         # set welcome only once after registering all types of codes
         (await self._set_welcome()).unwrap()
 
+        (await self.sub(
+            SetWireFmt,
+            self._on_set_wire_fmt,
+            SubOpts(recv_last_msg=False)
+        )).unwrap()
+
     @property
     def is_initd(self) -> bool:
         return self._is_initd
 
+    def set_code_retention(self, code: str, opts: RetainOpts | None):
+        """
+        Sets how last published msgs of the code are retained for
+        subscribers with `SubOpts.recv_last_msg`.
+
+        None disables the retention, which is the default, and drops msgs
+        already retained for the code.
+        """
+        self._retain_cache.set_opts(code, opts)
+
+    def set_code_concurrency(self, code: str, limit: int | None):
+        """
+        Sets how subfns of the code are called for a single msg.
+
+        If limit is None, subfns are called sequentially, in order of
+        subscription, which is the default. Otherwise, subfns are called
+        concurrently, with at most `limit` of them running at the same time
+        for the code (zero or less means no limit).
+        """
+        if limit is None:
+            self._code_to_concurrency_sem.pop(code, None)
+            return
+        self._code_to_concurrency_sem[code] = \
+            asyncio.Semaphore(limit) if limit > 0 else None
+
     @classmethod
     async def get_regd_type(cls, code: str) -> Res[type]:
         return await Code.get_regd_type_by_code(code)
@@ -338,6 +680,19 @@ class Bus(Singleton):
             return await self._set_welcome()
         return Ok()
 
+    async def _on_set_wire_fmt(self, msg: SetWireFmt) -> Res[None]:
+        consid_res = self.get_ctx_consid()
+        if isinstance(consid_res, Err):
+            return consid_res
+        con = self._sid_to_con.get(consid_res.ok, None)
+        if con is None:
+            return Err(f"no con with sid {consid_res.ok}")
+        if msg.fmt not in WireFmt.All:
+            return Err(f"unsupported wire fmt {msg.fmt}", ecode.Unsupported)
+        con.set_wire_fmt(msg.fmt)
+        con.set_is_sid_int(msg.is_sid_int)
+        return Ok()
+
     def get_ecodes(self) -> list[str]:
         return self._ecodes.copy()
 
@@ -354,11 +709,21 @@ class Bus(Singleton):
         if not bus._is_initd: # noqa: SLF001
             return
 
+        bus._timer_wheel_task.cancel() # noqa: SLF001
+        if bus._tracer is not None: # noqa: SLF001
+            # exporters may join writer threads, which mustn't block the
+            # loop
+            await asyncio.to_thread(bus._tracer.close) # noqa: SLF001
+        if bus._net_logger is not None: # noqa: SLF001
+            await bus._net_logger.aclose() # noqa: SLF001
         for atransport in bus._con_type_to_atransport.values(): # noqa: SLF001
-            atransport.inp_queue_processor.cancel()
-            atransport.out_queue_processor.cancel()
+            for task in atransport.inp_queue_processors:
+                task.cancel()
+            for task in atransport.out_queue_processors:
+                task.cancel()
 
         Code.destroy()
+        set_sid_strategy(SidStrategy.Uuid).unwrap()
 
         Bus.try_discard()
 
@@ -373,7 +738,7 @@ class Bus(Singleton):
                 " => close con")
             with contextlib.suppress(Exception):
                 await con.close()
-        atransport = typing.cast(ActiveTransport, atransport)
+            return
 
         if con.sid in self._sid_to_con:
             log.err("con with such sid already active => skip")
@@ -381,9 +746,22 @@ class Bus(Singleton):
 
         log.info(f"accept new con {con}", 2)
         self._sid_to_con[con.sid] = con
+        self._consid_to_outbox[con.sid] = Outbox(
+            con, atransport.transport.max_out_queue_size
+        )
+        con.set_codec(atransport.codec)
+        self._con_watcher.watch(
+            con,
+            atransport.transport.inactivity_timeout,
+            atransport.transport.ping_interval
+        )
 
         try:
-            await con.send(self._preserialized_welcome_msg)
+            await con.send_raw(wire.encode(
+                self._preserialized_welcome_msg,
+                atransport.codec,
+                con.get_wire_fmt()
+            ))
             await self._read_ws(con, atransport)
         except Exception as err:
             await log.atrack(err, f"during con {con} main loop => close")
@@ -393,8 +771,7 @@ class Bus(Singleton):
                     await con.close()
                 except Exception as err:
                     await log.atrack(err, f"during con {con} closing")
-            if con.sid in self._sid_to_con:
-                del self._sid_to_con[con.sid]
+            self._forget_con(con)
 
     async def sub(
         self,
@@ -408,6 +785,13 @@ class Bus(Singleton):
         Once the message is occured within the bus, the provided action is
         called.
 
+        Instead of an exact code, a pattern of codes can be given, such as
+        "myapp::telemetry::*" or "**", see [`subtrie`].
+
+        Subfns of a msg are called in groups, each in order of subscription:
+        subfns without field filters, subfns which field filters match, and
+        pattern subfns.
+
         # Args
 
         * `subfn` - Function to fire once the messsage has arrived.
@@ -426,22 +810,82 @@ class Bus(Singleton):
         else:
             code = msgtype_or_code
 
-        if code not in self.get_cached_codes():
-            return Err(f"code \"{code}\" is not regd")
+        field_filter = None
+        if opts.field_filters is not None:
+            if is_pattern(code):
+                return Err(
+                    f"field filters of pattern \"{code}\"",
+                    ecode.Unsupported
+                )
+            r = FieldFilter.compile(opts.field_filters)
+            if isinstance(r, Err):
+                return r
+            field_filter = r.ok
+
+        if self._metrics is not None:
+            subfn = self._metrics.time_subfn(subfn)
 
-        if code not in self._code_to_subfns:
-            self._code_to_subfns[code] = []
-        self._code_to_subfns[code].append(subfn)
         subsid = uuid4()
+        r = self._add_sub(code, subsid, subfn, field_filter)
+        if isinstance(r, Err):
+            return r
         self._subsid_to_subfn[subsid] = subfn
         self._subsid_to_code[subsid] = code
 
-        if opts.recv_last_msg and code in self._code_to_last_mbody:
-            last_body = self._code_to_last_mbody[code]
-            await self._call_subfn(subfn, last_body)
+        if opts.recv_last_msg:
+            await self._pass_retained_msgs(subfn, r.ok, field_filter)
 
         return Ok(self._unsub_wrapper(subsid))
 
+    def _add_sub(
+        self,
+        code: str,
+        subsid: str,
+        subfn: SubFn,
+        field_filter: FieldFilter | None
+    ) -> Res[list[str]]:
+        """
+        Indexes the subfn by the code or pattern.
+
+        Returns regd codes which retained msgs are passed to the subfn.
+        """
+        if is_pattern(code):
+            # patterns may match codes regd later, so they aren't checked
+            r = self._sub_trie.add(code, subsid, subfn)
+            if isinstance(r, Err):
+                return r
+            return Ok([
+                c for c in self._cached_codes if match_pattern(code, c)
+            ])
+
+        if code not in self.get_cached_codes():
+            return Err(f"code \"{code}\" is not regd")
+        if field_filter is not None:
+            if code not in self._code_to_filter_index:
+                self._code_to_filter_index[code] = FilterIndex()
+            self._code_to_filter_index[code].add(subsid, subfn, field_filter)
+            return Ok([code])
+        if code not in self._code_to_subfns:
+            self._code_to_subfns[code] = []
+        self._code_to_subfns[code].append(subfn)
+        return Ok([code])
+
+    async def _pass_retained_msgs(
+        self,
+        subfn: SubFn,
+        codes: list[str],
+        field_filter: FieldFilter | None
+    ):
+        for code in codes:
+            for last_bmsg in self._retain_cache.get(code):
+                if field_filter is not None and not field_filter.match(
+                    last_bmsg.msg
+                ):
+                    continue
+                # the retained msg was already responded to, so the subfn
+                # return is only tracked
+                await self._call_subfn(subfn, last_bmsg, is_ret_pubd=False)
+
     def _unsub_wrapper(self, subsid: str) -> Callable:
         def inner():
             self.unsub(subsid)
@@ -452,15 +896,27 @@ class Bus(Singleton):
             log.err(f"sub with id {subsid} not found")
             return
 
-        assert self._subsid_to_code[subsid] in self._code_to_subfns
-
-        msg_type = self._subsid_to_code[subsid]
-
-        assert subsid in self._subsid_to_code, "all maps must be synced"
         assert subsid in self._subsid_to_subfn, "all maps must be synced"
-        del self._subsid_to_code[subsid]
-        del self._subsid_to_subfn[subsid]
-        del self._code_to_subfns[msg_type]
+        code = self._subsid_to_code.pop(subsid)
+        subfn = self._subsid_to_subfn.pop(subsid)
+        if self._sub_trie.remove(subsid):
+            return
+        index = self._code_to_filter_index.get(code, None)
+        if index is not None and index.remove(subsid):
+            if not index:
+                del self._code_to_filter_index[code]
+            return
+
+        assert code in self._code_to_subfns, "all maps must be synced"
+        subfns = self._code_to_subfns[code]
+        # the same subfn may be subscribed several times, so only one of its
+        # entries is removed
+        for i, code_subfn in enumerate(subfns):
+            if code_subfn is subfn:
+                del subfns[i]
+                break
+        if not subfns:
+            del self._code_to_subfns[code]
 
     def unsub_many(
         self,
@@ -477,36 +933,32 @@ class Bus(Singleton):
         """
         Publishes a message and awaits for the response.
 
-        If the response is Exception, it is wrapped to res::Err.
+        If the response is Exception, it is wrapped to res::Err. If
+        `PubOpts.pubr_timeout` expires, an err with `BusEcode.Timeout` is
+        returned. If all target cons disconnect before the response arrives,
+        an err with `ecode.NotFound` is returned.
         """
-        aevt = asyncio.Event()
-        p: ptr[Msg] = ptr(target=None)
+        fut: asyncio.Future[Msg] = asyncio.get_running_loop().create_future()
 
-        def wrapper(aevt: asyncio.Event, ptr: ptr[Msg]):
-            async def fn(msg: Msg) -> Res[None]:
-                aevt.set()
-                p.target = msg
-                return Ok()
-            return fn
+        async def fn(msg: Msg) -> Res[None]:
+            if not fut.done():
+                fut.set_result(msg)
+            return Ok()
 
         if opts.subfn is not None:
             log.warn("don't pass PubOpts.subfn to pubr, it gets overwritten")
-        opts.subfn = wrapper(aevt, ptr)
-        pub_res = await self.pub(msg, opts)
+        pub_res = await self.pub(msg, opts.model_copy(update={"subfn": fn}))
         if isinstance(pub_res, Err):
             return pub_res
-        if opts.pubr_timeout is None:
-            await aevt.wait()
-        else:
-            try:
-                await asyncio.wait_for(aevt.wait(), opts.pubr_timeout)
-            except asyncio.TimeoutError as err:
-                return Err.from_native(err)
-
-        if (isinstance(p.target, Exception)):
-            return Err.from_native(p.target)
+        # the timeout is tracked by the pending reqs registry, which
+        # passes an err to the subfn on expiration
+        r = await fut
 
-        return Ok(p.target)
+        if isinstance(r, Err):
+            return r
+        if isinstance(r, Exception):
+            return Err.from_native(r)
+        return Ok(r)
 
     def get_ctx_key(self, key: str) -> Res[Any]:
         val = _yon_ctx.get().get(key, None)
@@ -514,6 +966,41 @@ class Bus(Singleton):
             return Ok(val)
         return Err(f"\"{key}\" entry in yon ctx", ecode.NotFound)
 
+    def is_tracing_enabled(self) -> bool:
+        return self._tracer is not None
+
+    def get_ctx_span_ctx(self) -> SpanCtx | None:
+        """
+        Gets ctx of the current trace span, if tracing is enabled.
+        """
+        return _yon_ctx.get().get("span", None)
+
+    @contextlib.contextmanager
+    def trace_ctx_span(
+        self, name: str, attrs: dict[str, Any] | None = None
+    ) -> Iterator[Span | None]:
+        """
+        Traces a block as a child span of the current one.
+
+        Spans of msgs published within the block are children of the block's
+        span. Yields None if tracing is disabled.
+        """
+        if self._tracer is None:
+            yield None
+            return
+        span = self._tracer.start(name, self.get_ctx_span_ctx(), attrs=attrs)
+        ctx_dict = _yon_ctx.get().copy()
+        ctx_dict["span"] = span.ctx
+        ctx_token = _yon_ctx.set(ctx_dict)
+        try:
+            yield span
+        except Exception:
+            self._tracer.end(span, is_err=True)
+            raise
+        finally:
+            _yon_ctx.reset(ctx_token)
+        self._tracer.end(span)
+
     def get_ctx_consid(self) -> Res[str]:
         return self.get_ctx_key("consid")
 
@@ -528,6 +1015,11 @@ class Bus(Singleton):
             return Err(f"no such codeid {codeid}", ecode.NotFound)
         return Ok(self._cached_codes[codeid])
 
+    def _get_cached_code_or_none(self, codeid: int) -> str | None:
+        if 0 <= codeid < len(self._cached_codes):
+            return self._cached_codes[codeid]
+        return None
+
     def get_cached_codeid_by_code(self, code: str) -> Res[int]:
         """
         Get a codeid of a registered code or error code.
@@ -545,8 +1037,10 @@ class Bus(Singleton):
         """
         Publishes message to the bus.
         """
-        if isinstance(msg, Bmsg):
+        if isinstance(msg, Envelope):
             bmsg = msg
+        elif isinstance(msg, Bmsg):
+            bmsg = Envelope.from_bmsg(msg)
         else:
             r = self._new_bmsg(msg, opts)
             if isinstance(r, Err):
@@ -556,18 +1050,41 @@ class Bus(Singleton):
 
     async def _pub_bmsg(
         self,
-        bmsg: Bmsg,
+        bmsg: Envelope,
         opts: PubOpts = PubOpts()
     ) -> Res[None]:
         code = bmsg.skip__code
         if opts.subfn is not None:
-            if bmsg.sid in self._lsid_to_subfn:
+            if bmsg.sid in self._pending_reqs:
                 return Err(f"{bmsg} for pubr", ecode.AlreadyProcessed)
-            self._lsid_to_subfn[bmsg.sid] = opts.subfn
-
-        self._code_to_last_mbody[code] = bmsg.msg
-
-        await self._exec_pub_send_order(bmsg, opts)
+            self._pending_reqs.add(
+                bmsg.sid,
+                opts.subfn,
+                bmsg.skip__target_consids if opts.send_to_net else None,
+                opts.pubr_timeout,
+                self._on_pending_req_expire
+            )
+
+        if self._metrics is not None:
+            self._metrics.get_code(code).pub_count += 1
+
+        if self._tracer is None:
+            await self._exec_pub_send_order(bmsg, opts)
+            return Ok()
+
+        span = self._tracer.start(
+            f"yon pub {code}",
+            bmsg.skip__span_ctx or self.get_ctx_span_ctx(),
+            attrs={"yon.code": code, "yon.msid": bmsg.sid}
+        )
+        # everything caused by the msg is traced as children of its pub
+        bmsg.skip__span_ctx = span.ctx
+        try:
+            await self._exec_pub_send_order(bmsg, opts)
+        except Exception:
+            self._tracer.end(span, is_err=True)
+            raise
+        self._tracer.end(span)
         return Ok()
 
     def _unpack_lsid(self, lsid: str | None) -> Res[str | None]:
@@ -587,7 +1104,7 @@ class Bus(Singleton):
         self,
         msg: Msg,
         opts: PubOpts = PubOpts()
-    ) -> Res[Bmsg]:
+    ) -> Res[Envelope]:
         if isinstance(msg, Err):
             is_err = True
             code = msg.code
@@ -604,7 +1121,9 @@ class Bus(Singleton):
         lsid = r.ok
 
         target_consids = None
-        if opts.target_consids:
+        if opts.target_groups is not None or opts.target_tokens is not None:
+            target_consids = self._resolve_target_consids(opts)
+        elif opts.target_consids:
             target_consids = opts.target_consids
         else:
             # try to get ctx consid, otherwise left as none
@@ -613,52 +1132,148 @@ class Bus(Singleton):
                 assert isinstance(consid_res.ok, str)
                 target_consids = [consid_res.ok]
 
-        return Ok(Bmsg(
-            lsid=lsid,
+        return Ok(Envelope(
             skip__code=code,
-            is_err=is_err,
             msg=msg,
+            lsid=lsid,
+            is_err=is_err,
             skip__target_consids=target_consids
         ))
 
-    async def _exec_pub_send_order(self, bmsg: Bmsg, opts: PubOpts):
+    def _resolve_target_consids(self, opts: PubOpts) -> Sequence[str]:
+        # group and token snapshots are reused as they are, without copying
+        consids: Sequence[str] | None = opts.target_consids
+        if opts.target_groups is not None:
+            consids = self._groups.resolve(opts.target_groups, consids)
+        if opts.target_tokens is not None:
+            consids = self._token_index.resolve(opts.target_tokens, consids)
+        return consids or ()
+
+    async def _exec_pub_send_order(self, bmsg: Envelope, opts: PubOpts):
         # SEND ORDER
         #
         #   1. Net
         #   2. Inner
         #   3. As a response
 
+        raw_size = None
         if opts.send_to_net:
-            await self._pub_bmsg_to_net(bmsg)
-        if opts.send_to_inner and bmsg.skip__code in self._code_to_subfns:
+            raw_size = await self._pub_bmsg_to_net(bmsg)
+        # retained before inner subfns are called, so they already see the
+        # msg as the last one
+        await self._retain_cache.put(bmsg.skip__code, bmsg, raw_size).atrack(
+            f"during {bmsg} retention"
+        )
+        if opts.send_to_inner:
             await self._send_to_inner_bus(bmsg)
         if bmsg.lsid:
             await self._send_as_linked(bmsg)
 
-    async def _send_to_inner_bus(self, msg: Bmsg):
-        subfns = self._code_to_subfns[msg.skip__code]
+    async def _send_to_inner_bus(self, msg: Envelope):
+        subfns = self._get_subfns(msg)
         if not subfns:
             return
+        if msg.skip__code in self._code_to_concurrency_sem:
+            await self._fanout_to_subfns(subfns.copy(), msg)
+            return
         for subfn in subfns:
             await self._call_subfn(subfn, msg)
 
-    async def _pub_bmsg_to_net(self, bmsg: Bmsg):
+    def _get_subfns(self, msg: Envelope) -> list[SubFn]:
+        code = msg.skip__code
+        subfns = self._code_to_subfns.get(code, [])
+        index = self._code_to_filter_index.get(code, None)
+        if index is not None:
+            filtered_subfns = index.match(msg.msg)
+            if filtered_subfns:
+                subfns = [*subfns, *filtered_subfns]
+        if not self._sub_trie:
+            return subfns
+        pattern_subfns = self._sub_trie.match(code)
+        if not pattern_subfns:
+            return subfns
+        return [*subfns, *pattern_subfns]
+
+    async def _fanout_to_subfns(self, subfns: list[SubFn], msg: Envelope):
+        """
+        Calls subfns concurrently.
+
+        Each raised err is tracked and published as the subfn's response, so
+        a failing subfn doesn't affect the others.
+        """
+        sem = self._code_to_concurrency_sem.get(msg.skip__code, None)
+
+        async def call(subfn: SubFn):
+            try:
+                if sem is None:
+                    await self._call_subfn(subfn, msg)
+                else:
+                    async with sem:
+                        await self._call_subfn(subfn, msg)
+            except Exception as exc:
+                err = exc if isinstance(exc, Err) else Err.from_native(exc)
+                await err.atrack(f"during concurrent subfn=<{subfn}> call")
+                # ctx of the failed subfn is still set within this task, so
+                # the err is addressed the same way as a regular response
+                await (await self.pub(err, PubOpts(lsid=msg.sid))).atrack(
+                    f"during subfn=<{subfn}> err=<{err}> publication"
+                )
+
+        # each subfn is called within its own task, so ctx set by one subfn
+        # won't leak to others
+        await asyncio.gather(*(call(subfn) for subfn in subfns))
+
+    async def _pub_bmsg_to_net(self, bmsg: Envelope) -> int | None:
+        """
+        Returns size of the encoded rbmsg, or None if it wasn't encoded.
+        """
         if bmsg.skip__target_consids:
             codeid = self.get_cached_codeid_by_code(bmsg.skip__code)
             if isinstance(codeid, Err):
                 await codeid.atrack(f"codeid retrieval for {bmsg}")
-                return
+                return None
             codeid = codeid.ok
-            rbmsg = await bmsg.serialize_to_net(codeid)
+            span = None
+            if self._tracer is not None:
+                span = self._tracer.start("yon ser", bmsg.skip__span_ctx)
+            start = time.perf_counter()
+            rbmsg = bmsg.serialize_to_net(codeid)
+            ser_time = time.perf_counter() - start
+            if span is not None:
+                self._tracer.end(span, is_err=isinstance(rbmsg, Err))
             if isinstance(rbmsg, Err):
                 rbmsg = None
             else:
                 rbmsg = rbmsg.ok
             if rbmsg is None:
-                return
-            await self._pub_rbmsg_to_net(rbmsg, bmsg.skip__target_consids)
+                return None
+            enc_time, raw_size = await self._pub_rbmsg_to_net(
+                rbmsg, bmsg.skip__target_consids, bmsg.skip__span_ctx
+            )
+            if self._metrics is not None:
+                self._metrics.get_code(bmsg.skip__code).ser_time.observe(
+                    ser_time + enc_time
+                )
+            return raw_size
+        return None
 
-    async def _pub_rbmsg_to_net(self, rbmsg: dict, consids: Iterable[str]):
+    async def _pub_rbmsg_to_net(
+        self,
+        rbmsg: dict,
+        consids: Iterable[str],
+        span_ctx: SpanCtx | None = None
+    ) -> tuple[float, int | None]:
+        """
+        Encodes rbmsg and puts it to outboxes of the target cons.
+
+        Returns time spent on encoding, in seconds, and size of the last
+        encoded buffer, or None if no con was targeted.
+        """
+        # rbmsg is encoded once per codec, wire fmt and sid representation,
+        # and the same immutable buffer is passed to every target con
+        enc_to_raw: dict[tuple[int, str, bool], bytes | None] = {}
+        enc_time = 0.0
+        raw_size = None
         for consid in consids:
             if consid not in self._sid_to_con:
                 log.err(
@@ -672,22 +1287,172 @@ class Bus(Singleton):
                 log.err("broken state of con_type_to_atransport => skip")
                 continue
             atransport = self._con_type_to_atransport[con_type]
-            await atransport.out_queue.put((con, rbmsg))
+            enc = (
+                id(atransport.codec), con.get_wire_fmt(), con.is_sid_int()
+            )
+            if enc not in enc_to_raw:
+                start = time.perf_counter()
+                try:
+                    raw = wire.encode(
+                        rbmsg, atransport.codec, enc[1], is_sid_int=enc[2]
+                    )
+                except Exception as err:
+                    # an unencodable rbmsg is dropped for the cons, and the
+                    # publisher isn't affected
+                    await log.atrack(err, f"during rbmsg {rbmsg} encode")
+                    raw = None
+                else:
+                    raw_size = len(raw)
+                enc_time += time.perf_counter() - start
+                enc_to_raw[enc] = raw
+            raw = enc_to_raw[enc]
+            if raw is None:
+                continue
+            await self._put_to_outbox(
+                atransport, consid, rbmsg, raw, enc[1], span_ctx=span_ctx
+            )
+        return enc_time, raw_size
 
-    async def _send_as_linked(self, msg: Bmsg):
+    async def _put_to_outbox(
+        self,
+        atransport: ActiveTransport,
+        consid: str,
+        rbmsg: dict,
+        raw: bytes,
+        fmt: str,
+        *,
+        span_ctx: SpanCtx | None = None
+    ):
+        outbox = self._consid_to_outbox.get(consid, None)
+        if outbox is None or outbox.is_closed:
+            log.err(f"no outbox for con {consid} => skip")
+            return
+
+        if outbox.is_full():
+            policy = atransport.transport.slow_con_policy
+            if policy == SlowConPolicy.DropOldest:
+                log.warn(f"outbox of con {consid} is full => drop oldest")
+                outbox.items.popleft()
+            elif policy == SlowConPolicy.Disconnect:
+                log.warn(f"outbox of con {consid} is full => disconnect")
+                # closing may wait for the slow con, so the publisher isn't
+                # held by it
+                self._spawn_bg(self.close_con(consid))
+                return
+            else:
+                await outbox.wait_space()
+                if outbox.is_closed:
+                    return
+
+        outbox.items.append((rbmsg, raw, fmt, span_ctx))
+        if not outbox.is_scheduled:
+            outbox.is_scheduled = True
+            transport = atransport.transport
+            if (
+                transport.out_batch_max_count > 1
+                and transport.out_batch_flush_delay > 0
+            ):
+                # the delay is counted from the first queued rbmsg, so it's
+                # added to latency once, however many cons wait for writers
+                asyncio.get_running_loop().call_later(
+                    transport.out_batch_flush_delay,
+                    atransport.out_queue.put_nowait,
+                    outbox
+                )
+            else:
+                atransport.out_queue.put_nowait(outbox)
+
+    async def _send_as_linked(self, msg: Envelope):
         if not msg.lsid:
             return
-        subfn = self._lsid_to_subfn.get(msg.lsid, None)
-        if subfn is not None:
-            await self._call_subfn(subfn, msg)
+        req = self._pending_reqs.pop(msg.lsid, msg.skip__consid)
+        if req is not None:
+            await self._call_subfn(req.subfn, msg)
+
+    def _on_con_idle(self, con: Con):
+        log.info(f"con {con} is inactive => close", 2)
+        self._spawn_bg(self.close_con(con.sid))
+
+    def _on_con_ping(self, con: Con):
+        async def ping():
+            try:
+                await con.ping()
+            except Exception as err:
+                await log.atrack(err, f"during con {con} ping")
+        self._spawn_bg(ping())
 
-    def _try_del_subfn(self, lsid: str) -> bool:
-        if lsid not in self._lsid_to_subfn:
-            return False
-        del self._lsid_to_subfn[lsid]
-        return True
+    def _spawn_bg(self, coro: Coroutine):
+        task = asyncio.create_task(coro)
+        self._bg_tasks.add(task)
+        task.add_done_callback(self._bg_tasks.discard)
 
-    def _gen_ctx_dict_for_msg(self, bmsg: Bmsg) -> dict:
+    def get_metrics(self) -> dict[str, Any]:
+        """
+        Gets snapshot of bus metrics.
+
+        Contains:
+            * "codes" - per code counts of published msgs and msgs received
+                from the net, and histograms of msg (de)serialization time
+            * "subfns" - per subfn histograms of call latency
+            * "transports" - per transport sizes of inp queue shards and of
+                out queue, and number of cons
+            * "cons" - per con outbox size and sent/received bytes
+
+        Histograms are dicts of bucket upper bounds, counts of observations
+        per bucket (the last bucket is unbounded), sum and count of
+        observations.
+
+        Empty dict is returned if `BusCfg.collect_metrics` is disabled.
+        """
+        if self._metrics is None:
+            return {}
+        snapshot = self._metrics.snapshot()
+        snapshot["transports"] = {
+            con_type.__name__: {
+                "inp_queue_sizes": [
+                    queue.qsize() for queue in atransport.inp_queues
+                ],
+                "out_queue_size": atransport.out_queue.qsize(),
+                "cons_count": sum(
+                    type(con) is con_type
+                    for con in self._sid_to_con.values()
+                )
+            }
+            for con_type, atransport in self._con_type_to_atransport.items()
+        }
+        snapshot["cons"] = {}
+        for consid, con in self._sid_to_con.items():
+            outbox = self._consid_to_outbox.get(consid, None)
+            snapshot["cons"][consid] = {
+                "outbox_size": len(outbox.items) if outbox else 0,
+                "sent_bytes": con.get_sent_bytes(),
+                "recv_bytes": con.get_recv_bytes()
+            }
+        return snapshot
+
+    def get_metrics_prometheus(self) -> str:
+        """
+        Gets snapshot of bus metrics in Prometheus text exposition format.
+        """
+        return metrics.to_prometheus(self.get_metrics())
+
+    def get_pending_reqs_count(self) -> int:
+        """
+        Gets number of published msgs awaiting linked responses.
+        """
+        return len(self._pending_reqs)
+
+    def _on_pending_req_expire(self, req: PendingReq):
+        self._cancel_pending_req(
+            req, Err(f"pubr timeout for msg {req.sid}", BusEcode.Timeout)
+        )
+
+    def _cancel_pending_req(self, req: PendingReq, err: Err):
+        # the subfn is notified directly, without publishing its return, since
+        # there is no response msg to link to
+        self._spawn_bg(req.subfn(err))
+
+    def _gen_ctx_dict_for_msg(self, bmsg: Envelope) -> dict:
         ctx_dict = _yon_ctx.get().copy()
 
         ctx_dict["msid"] = bmsg.sid
@@ -696,16 +1461,53 @@ class Bus(Singleton):
 
         return ctx_dict
 
-    async def _call_subfn(self, subfn: SubFn, bmsg: Bmsg):
+    async def _call_subfn(
+        self, subfn: SubFn, bmsg: Envelope, *, is_ret_pubd: bool = True
+    ):
         """
         Calls subfn and pubs any response captured (including errors).
 
-        Note that even None response is published as ok(None).
+        Note that even None response is published as ok(None). If
+        "is_ret_pubd" is false, the response is not published, and returned
+        errors are only tracked.
         """
-        _yon_ctx.set(self._gen_ctx_dict_for_msg(bmsg))
+        ctx_dict = self._gen_ctx_dict_for_msg(bmsg)
+        span = None
+        if self._tracer is not None:
+            span = self._tracer.start(
+                f"yon subfn {metrics.get_subfn_name(subfn)}",
+                bmsg.skip__span_ctx
+            )
+            ctx_dict["span"] = span.ctx
+        # ctx is reset once the subfn is done, since subfns may be called
+        # right in the publisher's task
+        ctx_token = _yon_ctx.set(ctx_dict)
+        try:
+            await self._call_subfn_in_ctx(subfn, bmsg, is_ret_pubd)
+        except Exception:
+            if span is not None:
+                self._tracer.end(span, is_err=True)
+            raise
+        finally:
+            _yon_ctx.reset(ctx_token)
+        if span is not None:
+            self._tracer.end(span)
+
+    async def _call_subfn_in_ctx(
+        self, subfn: SubFn, bmsg: Envelope, is_ret_pubd: bool = True
+    ):
         ret = await subfn(bmsg.msg)
         msg = self._parse_subfn_ret_to_msg(subfn, ret)
+        if not is_ret_pubd:
+            if isinstance(msg, Err):
+                await msg.atrack(f"during {bmsg} pass to subfn=<{subfn}>")
+            return
         if msg is None:
+            # ok msgs aren't acknowledged, otherwise subfns of ok, such as
+            # ones subscribed by "**" pattern, would respond to each other
+            # endlessly
+            if bmsg.skip__code == ok.code():
+                return
             # returned None is always converted to `ok()` to ensure the caller
             # receives the response
             msg = ok()
@@ -713,7 +1515,8 @@ class Bus(Singleton):
         # by default all subsriber's body are intended to be linked to
         # initial message, so we attach this message ctx msid
         lsid = _yon_ctx.get().get("subfn_lsid", "$ctx::msid")
-        pub_opts = PubOpts(lsid=lsid)
+        # opts are built from trusted values, so validation is skipped
+        pub_opts = PubOpts.model_construct(lsid=lsid)
         await (await self.pub(msg, pub_opts)).atrack(
             f"during subfn=<{subfn}> return msg=<{msg}> publication"
         )
@@ -742,80 +1545,335 @@ class Bus(Singleton):
         ctx_dict = _yon_ctx.get().copy()
         ctx_dict["subfn__lsid"] = lsid
 
-    async def _recv_from_con(
+    async def _read_ws(self, con: Con, atransport: ActiveTransport):
+        # all rbmsgs of a con go to the same shard to be processed in order
+        shard = atransport.get_inp_shard(con.sid)
+        async for rbmsg in con:
+            self._con_watcher.touch(con.sid)
+            await self._put_to_inp_queue(atransport, shard, con, rbmsg)
+
+    async def _put_to_inp_queue(
         self,
+        atransport: ActiveTransport,
+        shard: int,
         con: Con,
-        atransport: ActiveTransport
-    ) -> dict:
-        try:
-            return await asyncio.wait_for(
-                con.recv(),
-                atransport.transport.inactivity_timeout)
-        except TimeoutError as err:
-            raise TimeoutError(
-                f"inactivity of con {con} for transport {atransport}"
-            ) from err
+        rbmsg: dict
+    ):
+        transport = atransport.transport
+        queue = atransport.inp_queues[shard]
+        if queue.maxsize <= 0:
+            queue.put_nowait((con, rbmsg))
+            return
 
-    async def _read_ws(self, con: Con, atransport: ActiveTransport):
-        async for rbmsg in con:
-            log.info(f"receive: {rbmsg}", 2)
-            atransport.inp_queue.put_nowait((con, rbmsg))
+        if (
+            shard not in atransport.inp_high_shards
+            and queue.qsize() >= atransport.get_inp_high_size()
+        ):
+            atransport.inp_high_shards.add(shard)
+            self._pub_inp_watermark(InpQueueHigh, atransport, shard)
+
+        policy = transport.inp_overload_policy
+        if (
+            policy == InpOverloadPolicy.Shed
+            and shard in atransport.inp_high_shards
+            and self._get_inp_priority(transport, rbmsg)
+                < transport.inp_shed_min_priority
+        ):
+            await self._reject_inp_rbmsg(con, rbmsg, "shed")
+            return
+        if policy == InpOverloadPolicy.Reject and queue.full():
+            await self._reject_inp_rbmsg(con, rbmsg, "full")
+            return
+        # otherwise we stop reading the con until there is space in the queue
+        await queue.put((con, rbmsg))
+
+    def _get_inp_priority(self, transport: Transport, rbmsg: dict) -> int:
+        codeid = rbmsg.get("codeid", None)
+        if not isinstance(codeid, int):
+            return 0
+        code = self.get_cached_code_by_codeid(codeid)
+        if isinstance(code, Err):
+            return 0
+        return transport.inp_code_priorities.get(code.ok, 0)
+
+    async def _reject_inp_rbmsg(self, con: Con, rbmsg: dict, reason: str):
+        log.warn(f"overloaded inp queue for con {con} => {reason} rbmsg", 2)
+        # int sids of cons which negotiated them are converted back too
+        lsid = from_net_sid(rbmsg.get("sid", None))
+        if lsid is None:
+            return
+        await (await self.pub(
+            Err(f"inp queue overload: {reason}", BusEcode.Overload),
+            PubOpts(
+                lsid=lsid,
+                target_consids=[con.sid],
+                send_to_inner=False
+            )
+        )).atrack(f"during overload err publication to con {con}")
+
+    def _pub_inp_watermark(
+        self,
+        msgtype: type[InpQueueHigh] | type[InpQueueLow],
+        atransport: ActiveTransport,
+        shard: int
+    ):
+        """
+        Publishes the watermark in background, so subfns of it don't block
+        reading of the con or processing of the shard.
+        """
+        msg = msgtype(
+            con_type=atransport.transport.con_type.__name__,
+            shard=shard,
+            size=atransport.inp_queues[shard].qsize()
+        )
+
+        async def pub():
+            await (await self.pub(msg, PubOpts(send_to_net=False))).atrack(
+                f"during {msgtype} publication"
+            )
+
+        self._spawn_bg(pub())
 
     async def _proc_inp_queue(
         self,
-        transport: Transport,
-        queue: Queue[tuple[Con, dict]]
+        atransport: ActiveTransport,
+        shard: int,
+        sem: asyncio.Semaphore | None
     ):
+        """
+        Processes rbmsgs of a single inp shard one by one.
+
+        If sem is given, it limits number of shards processing rbmsgs at the
+        same time.
+        """
+        transport = atransport.transport
+        queue = atransport.inp_queues[shard]
         while True:
             con, rbmsg = await queue.get()
-            if self._cfg.log_net_recv:
-                code = self.get_cached_code_by_codeid(rbmsg["codeid"])
-                if isinstance(code, Ok):
-                    code = code.ok
-                else:
-                    code = "unknown"
-                log.info(
-                    "NET::RECV "
-                    f"| \"{code}\" from {con.get_display()} | {rbmsg}"
-                )
-            if transport.on_recv:
-                with contextlib.suppress(Exception):
-                    # we don't pass whole con to avoid control leaks
-                    await transport.on_recv(con.sid, rbmsg)
-            bmsg = await self._parse_rbmsg(rbmsg, con)
-            if isinstance(bmsg, Err):
-                await bmsg.atrack()
+            if (
+                shard in atransport.inp_high_shards
+                and queue.qsize() <= atransport.get_inp_low_size()
+            ):
+                atransport.inp_high_shards.discard(shard)
+                self._pub_inp_watermark(InpQueueLow, atransport, shard)
+            if sem is None:
+                await self._proc_inp_rbmsg(transport, con, rbmsg)
                 continue
+            async with sem:
+                await self._proc_inp_rbmsg(transport, con, rbmsg)
+
+    async def _proc_inp_rbmsg(
+        self,
+        transport: Transport,
+        con: Con,
+        rbmsg: dict
+    ):
+        if self._cfg.log_net_recv and self._net_logger is not None:
+            self._net_logger.recv(con, rbmsg)
+        if transport.on_recv:
+            with contextlib.suppress(Exception):
+                # we don't pass whole con to avoid control leaks
+                await transport.on_recv(con.sid, rbmsg)
+        if self._tracer is not None:
+            await self._proc_inp_rbmsg_traced(con, rbmsg, self._tracer)
+            return
+        bmsg = self._parse_rbmsg(rbmsg, con)
+        if isinstance(bmsg, Err):
+            await bmsg.atrack()
+            return
+        try:
             await self._accept_net_bmsg(bmsg.ok)
+        except Exception as err:
+            # the shard must keep processing other rbmsgs
+            await log.atrack(err, f"during accept of net bmsg {bmsg.ok}")
+
+    async def _proc_inp_rbmsg_traced(
+        self,
+        con: Con,
+        rbmsg: dict,
+        tracer: Tracer
+    ):
+        code = self._get_cached_code_or_none(rbmsg.get("codeid", -1))
+        span = tracer.start(
+            f"yon recv {code}",
+            kind=SpanKind.Server,
+            attrs={"yon.code": str(code), "yon.consid": con.sid}
+        )
+        deser_span = tracer.start("yon deser", span.ctx)
+        bmsg = self._parse_rbmsg(rbmsg, con)
+        tracer.end(deser_span, is_err=isinstance(bmsg, Err))
+        if isinstance(bmsg, Err):
+            tracer.end(span, is_err=True)
+            await bmsg.atrack()
+            return
+        bmsg.ok.skip__span_ctx = span.ctx
+        try:
+            await self._accept_net_bmsg(bmsg.ok)
+        except Exception as err:
+            tracer.end(span, is_err=True)
+            await log.atrack(err, f"during accept of net bmsg {bmsg.ok}")
+            return
+        tracer.end(span)
 
     async def _proc_out_queue(
         self,
         transport: Transport,
-        queue: Queue[tuple[Con, dict]]
+        queue: Queue[Outbox]
     ):
+        """
+        Writes rbmsgs of outboxes ready to be sent.
+
+        Several processors may serve the same queue. Each takes one outbox at
+        a time, sends up to a batch of its rbmsgs, and puts the outbox back
+        to the queue end if it has more, so cons are served round-robin.
+
+        A send exceeding `Transport.out_send_timeout` is left to finish in
+        the background, so a stalled con doesn't hold the processor.
+        """
         while True:
-            con, rbmsg = await queue.get()
-            if self._cfg.log_net_send:
-                code = self.get_cached_code_by_codeid(rbmsg["codeid"])
-                if isinstance(code, Err):
-                    await code.atrack(
-                        f"rbmsg=<{rbmsg}> code retrieval on net send"
-                    )
-                    continue
-                code = code.ok
-                log.info(
-                    f"NET::SEND | \"{code}\" to {con.get_display()} | {rbmsg}"
+            outbox = await queue.get()
+            # popped right away, so rbmsgs being written aren't affected by
+            # the slow con policy
+            items = outbox.pop_many(max(transport.out_batch_max_count, 1))
+            write = self._write_outbox(transport, outbox.con, items)
+            if transport.out_send_timeout is None:
+                await write
+            else:
+                task = asyncio.create_task(write)
+                done, _ = await asyncio.wait(
+                    {task}, timeout=transport.out_send_timeout
                 )
-            if transport.on_send:
-                with contextlib.suppress(Exception):
-                    await transport.on_send(con.sid, rbmsg)
-            await con.send(rbmsg)
+                if not done:
+                    self._on_out_send_timeout(transport, queue, outbox, task)
+                    continue
+            self._reschedule_outbox(queue, outbox)
+
+    def _on_out_send_timeout(
+        self,
+        transport: Transport,
+        queue: Queue[Outbox],
+        outbox: Outbox,
+        task: asyncio.Task
+    ):
+        con = outbox.con
+        if transport.slow_con_policy == SlowConPolicy.Disconnect:
+            log.warn(f"send to con {con} timed out => disconnect")
+            self._spawn_bg(self.close_con(con.sid))
+        else:
+            # the outbox stays scheduled, so it's not written by others
+            # until the send is done, and meanwhile fills up under
+            # the slow con policy
+            log.warn(f"send to con {con} timed out => wait in background")
+        self._bg_tasks.add(task)
+        task.add_done_callback(self._bg_tasks.discard)
+        task.add_done_callback(
+            lambda _: self._reschedule_outbox(queue, outbox)
+        )
+
+    def _reschedule_outbox(self, queue: Queue[Outbox], outbox: Outbox):
+        if outbox.items and not outbox.is_closed:
+            queue.put_nowait(outbox)
+        else:
+            outbox.is_scheduled = False
 
-    async def _accept_net_bmsg(self, bmsg: Bmsg):
+    async def _write_outbox(
+        self,
+        transport: Transport,
+        con: Con,
+        items: list[OutboxItem]
+    ):
+        raws: list[tuple[bytes, str]] = []
+        unreliable_raws: list[tuple[bytes, str]] = []
+        spans: list[Span] = []
+        for rbmsg, raw, fmt, span_ctx in items:
+            await self._prepare_net_send(transport, con, rbmsg)
+            if (
+                transport.unreliable_codes
+                and self._get_cached_code_or_none(
+                    rbmsg.get("codeid", -1)
+                ) in transport.unreliable_codes
+            ):
+                unreliable_raws.append((raw, fmt))
+            else:
+                raws.append((raw, fmt))
+            if self._tracer is not None and span_ctx is not None:
+                spans.append(self._tracer.start(
+                    "yon send",
+                    span_ctx,
+                    SpanKind.Client,
+                    {"yon.consid": con.sid}
+                ))
+        await self._send_out_batches(
+            con, self._split_out_batch(transport, raws)
+        )
+        await self._send_out_unreliable(con, unreliable_raws)
+        for span in spans:
+            self._tracer.end(span)
+
+    async def _send_out_batches(
+        self, con: Con, batches: list[tuple[list[bytes], str]]
+    ):
+        try:
+            for batch, fmt in batches:
+                if len(batch) == 1:
+                    await con.send_raw(batch[0], fmt)
+                else:
+                    await con.send_raw_batch(batch, fmt)
+        except Exception as err:
+            await log.atrack(err, f"during send to con {con}")
+
+    async def _send_out_unreliable(
+        self, con: Con, raws: list[tuple[bytes, str]]
+    ):
+        try:
+            for raw, fmt in raws:
+                await con.send_raw_unreliable(raw, fmt)
+        except Exception as err:
+            await log.atrack(err, f"during unreliable send to con {con}")
+
+    async def _prepare_net_send(
+        self, transport: Transport, con: Con, rbmsg: dict
+    ):
+        """
+        Logs and reports rbmsg about to be sent.
+        """
+        if self._cfg.log_net_send and self._net_logger is not None:
+            self._net_logger.send(con, rbmsg)
+        if transport.on_send:
+            with contextlib.suppress(Exception):
+                await transport.on_send(con.sid, rbmsg)
+
+    def _split_out_batch(
+        self, transport: Transport, raws: list[tuple[bytes, str]]
+    ) -> list[tuple[list[bytes], str]]:
+        """
+        Splits rbmsgs to batches, each of rbmsgs in the same wire fmt.
+        """
+        batches: list[tuple[list[bytes], str]] = []
+        batch: list[bytes] = []
+        batch_fmt = ""
+        batch_size = 0
+        for raw, fmt in raws:
+            if batch and (
+                fmt != batch_fmt
+                or len(batch) >= transport.out_batch_max_count
+                or batch_size + len(raw) > transport.out_batch_max_bytes
+            ):
+                batches.append((batch, batch_fmt))
+                batch = []
+                batch_size = 0
+            batch.append(raw)
+            batch_fmt = fmt
+            batch_size += len(raw)
+        if batch:
+            batches.append((batch, batch_fmt))
+        return batches
+
+    async def _accept_net_bmsg(self, bmsg: Envelope):
         # publish to inner bus with no duplicate net resending
         pub = await self._pub_bmsg(
             bmsg,
-            PubOpts(send_to_net=False)
+            PubOpts.model_construct(send_to_net=False)
         )
         if isinstance(pub, Err):
             await (
@@ -825,15 +1883,21 @@ class Bus(Singleton):
                 )
             ).atrack()
 
-    async def _parse_rbmsg(
-        self, rbmsg: dict, con: Con
-    ) -> Res[Bmsg]:
-        msid: str | None = rbmsg.get("sid", None)
-        if not msid:
-            return Err("msg without sid")
+    def _parse_rbmsg(self, rbmsg: dict, con: Con) -> Res[Envelope]:
         # msgs coming from net receive conection sid
-        rbmsg["skip__consid"] = con.sid
-        bmsg = await Bmsg.deserialize_from_net(rbmsg)
+        if self._metrics is None:
+            return decode_rbmsg(
+                rbmsg, self._codeid_to_decoder, con.get_codec(), con.sid
+            )
+
+        start = time.perf_counter()
+        bmsg = decode_rbmsg(
+            rbmsg, self._codeid_to_decoder, con.get_codec(), con.sid
+        )
+        if isinstance(bmsg, Ok):
+            code_metrics = self._metrics.get_code(bmsg.ok.skip__code)
+            code_metrics.recv_count += 1
+            code_metrics.deser_time.observe(time.perf_counter() - start)
         return bmsg
 
     def _init_transports(self):
@@ -853,18 +1917,35 @@ class Bus(Singleton):
                     " => skip")
                 continue
 
-            inp_queue = Queue(transport.max_inp_queue_size)
-            out_queue = Queue(transport.max_out_queue_size)
-            inp_task = asyncio.create_task(self._proc_inp_queue(
-                transport, inp_queue))
-            out_task = asyncio.create_task(self._proc_out_queue(
-                transport, out_queue))
+            inp_shards = max(transport.inp_shards, 1)
+            inp_queues = [
+                Queue(transport.max_inp_queue_size)
+                for _ in range(inp_shards)
+            ]
+            inp_sem = \
+                asyncio.Semaphore(transport.inp_workers) \
+                if 0 < transport.inp_workers < inp_shards \
+                else None
+            # each outbox is queued at most once, so the queue is bounded by
+            # the number of cons
+            out_queue = Queue()
+            out_tasks = [
+                asyncio.create_task(self._proc_out_queue(
+                    transport, out_queue))
+                for _ in range(max(transport.out_writers, 1))
+            ]
             atransport = ActiveTransport(
                 transport=transport,
-                inp_queue=inp_queue,
+                codec=transport.codec or get_default_codec(),
+                inp_queues=inp_queues,
                 out_queue=out_queue,
-                inp_queue_processor=inp_task,
-                out_queue_processor=out_task)
+                inp_queue_processors=[],
+                out_queue_processors=out_tasks)
+            atransport.inp_queue_processors = [
+                asyncio.create_task(self._proc_inp_queue(
+                    atransport, shard, inp_sem))
+                for shard in range(inp_shards)
+            ]
             self._con_type_to_atransport[transport.con_type] = atransport
 
     async def _set_welcome(self) -> Res[None]:
@@ -875,17 +1956,47 @@ class Bus(Singleton):
         # we always put error codes after the regular ones
         codes.extend(self._ecodes)
         self._cached_codes = codes.copy()
-        welcome = Welcome(codes=codes)
-        self._preserialized_welcome_msg = (await Bmsg(
+        self._sub_trie.clear_cache()
+        decoders = await self._build_decoders(codes)
+        if isinstance(decoders, Err):
+            return decoders
+        self._codeid_to_decoder = decoders.ok
+        welcome = Welcome(codes=codes, sid_strategy=self._sid_strategy)
+        self._preserialized_welcome_msg = Envelope(
             skip__code=Welcome.code(),
             msg=welcome
-        ).serialize_to_net(StaticCodeid.Welcome)).unwrap()
+        ).serialize_to_net(StaticCodeid.Welcome).unwrap()
         rewelcome_res = await self._rewelcome_all_cons()
         if isinstance(rewelcome_res, Err):
             return rewelcome_res
         return Ok(None)
 
+    async def _build_decoders(
+        self, codes: list[str]
+    ) -> Res[list[Decoder | None]]:
+        """
+        Builds decoders of received msgs, indexed by codeid.
+
+        Ecodes and inp watermarks have no decoders, since clients cannot
+        send errs, and watermarks are only published by the bus itself.
+        """
+        undecodable_codes = {
+            *self._ecodes, InpQueueHigh.code(), InpQueueLow.code()
+        }
+        decoders: list[Decoder | None] = []
+        for code in codes:
+            if code in undecodable_codes:
+                decoders.append(None)
+                continue
+            msgtype = await Code.get_regd_type_by_code(code)
+            if isinstance(msgtype, Err):
+                return msgtype
+            decoders.append(Decoder(code, msgtype.ok))
+        return Ok(decoders)
+
     async def _rewelcome_all_cons(self) -> Res[None]:
-        return Ok(await self._pub_rbmsg_to_net(
+        await self._pub_rbmsg_to_net(
             self._preserialized_welcome_msg,
-            self._sid_to_con.keys()))
+            # cons may (dis)connect while the welcome is sent
+            tuple(self._sid_to_con))
+        return Ok(None)
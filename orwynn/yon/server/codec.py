@@ -0,0 +1,119 @@
+"""
+Codecs converting rbmsgs to bytes and back.
+
+Stdlib json codec is always available and is used by default. Faster
+backends are opt-in per transport, see [`get_fastest_codec`], since their
+json differs from stdlib one for some values, such as ints over 64 bits.
+"""
+import json
+from typing import Any, Protocol, runtime_checkable
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+__all__ = [
+    "Codec",
+    "JsonCodec",
+    "OrjsonCodec",
+    "MsgspecCodec",
+    "get_default_codec",
+    "get_fastest_codec",
+]
+
+@runtime_checkable
+class Codec(Protocol):
+    name: str
+    is_json: bool
+    """
+    Whether the codec produces json, so json bodies can be validated
+    directly from bytes, see [`decode::Decoder`].
+    """
+
+    def encode(self, obj: Any) -> bytes: ...
+    def decode(self, data: bytes | str) -> Any: ...
+
+class JsonCodec:
+    name = "json"
+    is_json = True
+
+    def encode(self, obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    def decode(self, data: bytes | str) -> Any:
+        return json.loads(data)
+
+class OrjsonCodec:
+    """
+    Codec backed by orjson.
+
+    Objects orjson can't encode, such as ints over 64 bits, are encoded by
+    stdlib json. Note that such ints are decoded as floats.
+    """
+    name = "orjson"
+    is_json = True
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("orjson is not installed")
+
+    def encode(self, obj: Any) -> bytes:
+        try:
+            # non-str keys are coerced to str same as stdlib json does
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            return _JSON_CODEC.encode(obj)
+
+    def decode(self, data: bytes | str) -> Any:
+        return orjson.loads(data)
+
+class MsgspecCodec:
+    """
+    Codec backed by msgspec.
+
+    Objects msgspec can't encode, such as dicts with keys of mixed or
+    non-scalar types, are encoded by stdlib json.
+    """
+    name = "msgspec"
+    is_json = True
+
+    def __init__(self):
+        if msgspec is None:
+            raise ImportError("msgspec is not installed")
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+
+    def encode(self, obj: Any) -> bytes:
+        try:
+            return self._encoder.encode(obj)
+        except TypeError:
+            return _JSON_CODEC.encode(obj)
+
+    def decode(self, data: bytes | str) -> Any:
+        return self._decoder.decode(data)
+
+_JSON_CODEC = JsonCodec()
+
+def get_default_codec() -> Codec:
+    """
+    Gets the codec used by transports which don't set one.
+    """
+    return JsonCodec()
+
+def get_fastest_codec() -> Codec:
+    """
+    Gets the fastest available codec.
+
+    Order of preference: orjson, msgspec, stdlib json.
+    """
+    if orjson is not None:
+        return OrjsonCodec()
+    if msgspec is not None:
+        return MsgspecCodec()
+    return JsonCodec()
@@ -0,0 +1,148 @@
+"""
+Decoders of msgs received from the net.
+
+A decoder is built once per regd code, and decoders are indexed by codeid,
+so decoding of a received rbmsg doesn't look up the code nor the msg type.
+"""
+from typing import Any, Callable
+
+from pydantic import BaseModel
+from ryz.core import Code, Err, Ok, Res
+
+from orwynn.yon.server.codec import Codec
+from orwynn.yon.server.msg import Envelope, Msg
+from orwynn.yon.server.sid import from_net_sid
+
+
+class Decoder:
+    """
+    Builds msgs of a single code from rbmsg bodies.
+
+    Bodies are either already decoded objects, as for json wire format, or
+    raw bytes left by the wire, as for bin format. For pydantic models, raw
+    json bodies are validated directly, without the intermediate objects.
+    """
+    __slots__ = ("_from_json", "_from_obj", "code", "msgtype")
+
+    def __init__(self, code: str, msgtype: type) -> None:
+        self.code = code
+        self.msgtype = msgtype
+        self._from_obj: Callable[[Any], Msg]
+        self._from_json: Callable[[bytes], Msg] | None = None
+
+        deserialize_custom = getattr(msgtype, "deserialize", None)
+        if issubclass(msgtype, BaseModel):
+            self._from_obj = self._validate_model
+            self._from_json = msgtype.model_validate_json
+        elif deserialize_custom is not None:
+            self._from_obj = deserialize_custom
+        else:
+            # for arbitrary types: just pass body as init first arg
+            self._from_obj = msgtype
+
+    def decode(self, body: Any, codec: Codec) -> Res[Msg]:
+        # msg comes from the net, so any err of its construction is reported
+        try:
+            if isinstance(body, (bytes, memoryview)):
+                if self._from_json is not None and codec.is_json:
+                    return Ok(self._from_json(body))
+                body = codec.decode(body)
+            return Ok(self._from_obj(body))
+        except Exception as err:
+            return Err.from_native(err)
+
+    def _validate_model(self, body: Any) -> Msg:
+        # for case of rbmsg with empty body field, we'll try to initialize
+        # the type without any fields (empty dict)
+        if body is None:
+            body = {}
+        elif not isinstance(body, dict):
+            raise TypeError(
+                f"if custom type ({self.msgtype}) is a BaseModel, body"
+                f" {body} must be a dict, got type {type(body)}"
+            )
+        return self.msgtype.model_validate(body)
+
+def decode_rbmsg(
+    rbmsg: dict,
+    codeid_to_decoder: list[Decoder | None],
+    codec: Codec,
+    consid: str | None
+) -> Res[Envelope]:
+    """
+    Decodes a received rbmsg into an envelope.
+
+    The rbmsg isn't modified.
+    """
+    decoder = _get_decoder(rbmsg, codeid_to_decoder)
+    if isinstance(decoder, Err):
+        return decoder
+    return _decode_rbmsg_with(rbmsg, decoder.ok, codec, consid)
+
+async def decode_rbmsg_by_regd_code(
+    rbmsg: dict, codec: Codec, consid: str | None
+) -> Res[Envelope]:
+    """
+    Same as [`decode_rbmsg`], but builds the decoder from the regd code of
+    the rbmsg's codeid.
+
+    Meant for rbmsgs decoded outside of the bus, which has decoders already
+    built.
+    """
+    codeid = rbmsg.get("codeid", None)
+    if not isinstance(codeid, int):
+        return Err(f"invalid codeid {codeid}")
+    if rbmsg.get("is_err", None) is not None:
+        # client cannot send error messages
+        return Err("must not deserialize error messages")
+    code = await Code.get_regd_code_by_id(codeid)
+    if isinstance(code, Err):
+        return code
+    msgtype = await Code.get_regd_type_by_code(code.ok)
+    if isinstance(msgtype, Err):
+        return msgtype
+    return _decode_rbmsg_with(
+        rbmsg, Decoder(code.ok, msgtype.ok), codec, consid
+    )
+
+def _decode_rbmsg_with(
+    rbmsg: dict, decoder: Decoder, codec: Codec, consid: str | None
+) -> Res[Envelope]:
+    # sids may come as ints from cons which negotiated int sids
+    sid = from_net_sid(rbmsg.get("sid", None))
+    if sid is None:
+        return Err("msg without sid")
+    lsid = rbmsg.get("lsid", None)
+    if lsid is not None:
+        lsid = from_net_sid(lsid)
+        if lsid is None:
+            return Err(f"invalid lsid {rbmsg['lsid']}")
+
+    msg = decoder.decode(rbmsg.get("msg", None), codec)
+    if isinstance(msg, Err):
+        return msg
+    return Ok(Envelope(
+        skip__code=decoder.code,
+        msg=msg.ok,
+        sid=sid,
+        lsid=lsid,
+        skip__consid=consid
+    ))
+
+def _get_decoder(
+    rbmsg: dict, codeid_to_decoder: list[Decoder | None]
+) -> Res[Decoder]:
+    codeid = rbmsg.get("codeid", None)
+    if (
+        not isinstance(codeid, int)
+        or codeid < 0
+        or codeid >= len(codeid_to_decoder)
+    ):
+        return Err(f"invalid codeid {codeid}")
+    decoder = codeid_to_decoder[codeid]
+    if decoder is None:
+        return Err(f"codeid {codeid} cannot be received")
+    if rbmsg.get("is_err", None) is not None:
+        # client cannot send error messages
+        return Err("must not deserialize error messages")
+    return Ok(decoder)
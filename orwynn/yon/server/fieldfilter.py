@@ -0,0 +1,183 @@
+"""
+Declarative filters of subscriptions on msg fields.
+
+Filters are given as `SubOpts.field_filters`, mapping a field name to either
+a value the field must be equal to, or [`In`] of values the field must be
+one of. A msg matches the filters if all of its fields match.
+
+Filtered subscriptions of a code are indexed by [`FilterIndex`] with hash
+maps on the filtered fields, so for each msg only matching subfns are
+found, without checking every subscription.
+"""
+from typing import Any, Callable, Iterable
+
+from ryz.core import Err, Ok, Res
+
+_MISSING = object()
+
+class In:
+    """
+    Membership filter: the field must be equal to one of the values.
+    """
+    __slots__ = ("values",)
+
+    def __init__(self, values: Iterable[Any]) -> None:
+        self.values = tuple(values)
+
+    def __repr__(self) -> str:
+        return f"In({list(self.values)!r})"
+
+def get_field(msg: Any, field: str) -> Any:
+    """
+    Gets field of a msg, or `_MISSING` if the msg doesn't have it.
+    """
+    if isinstance(msg, dict):
+        return msg.get(field, _MISSING)
+    return getattr(msg, field, _MISSING)
+
+class FieldFilter:
+    """
+    Compiled field filters, with allowed values of each field.
+    """
+    __slots__ = ("field_to_values",)
+
+    def __init__(self, field_to_values: dict[str, frozenset]) -> None:
+        self.field_to_values = field_to_values
+
+    @classmethod
+    def compile(cls, field_filters: dict[str, Any]) -> Res["FieldFilter"]:
+        if not field_filters:
+            return Err("field filters must not be empty")
+        field_to_values: dict[str, frozenset] = {}
+        for field, value in field_filters.items():
+            values = value.values if isinstance(value, In) else (value,)
+            try:
+                field_to_values[field] = frozenset(values)
+            except TypeError:
+                return Err(
+                    f"values of field \"{field}\" filter must be hashable,"
+                    f" got {value!r}"
+                )
+        return Ok(cls(field_to_values))
+
+    def match(self, msg: Any) -> bool:
+        for field, values in self.field_to_values.items():
+            value = get_field(msg, field)
+            if value is _MISSING:
+                return False
+            try:
+                if value not in values:
+                    return False
+            except TypeError:
+                # unhashable values never match
+                return False
+        return True
+
+    def without(self, field: str) -> "FieldFilter":
+        return FieldFilter({
+            f: values
+            for f, values in self.field_to_values.items()
+            if f != field
+        })
+
+class _Entry:
+    __slots__ = ("field", "order", "rest", "subfn", "subsid", "values")
+
+    def __init__(
+        self,
+        order: int,
+        subsid: str,
+        subfn: Callable,
+        *,
+        field: str,
+        values: frozenset,
+        rest: FieldFilter
+    ) -> None:
+        self.order = order
+        self.subsid = subsid
+        self.subfn = subfn
+        self.field = field
+        """
+        Field by which the entry is indexed.
+        """
+        self.values = values
+        self.rest = rest
+        """
+        Filters of other fields, checked once the indexed field matches.
+        """
+
+class FilterIndex:
+    """
+    Filtered subscriptions of a single code.
+
+    Each subscription is indexed by one of its fields, under every allowed
+    value of the field. Finding subfns for a msg costs a hash lookup per
+    distinct indexed field, plus a check of other fields for the found
+    subscriptions only.
+    """
+    def __init__(self) -> None:
+        self._field_to_value_to_entries: dict[
+            str, dict[Any, list[_Entry]]
+        ] = {}
+        self._subsid_to_entry: dict[str, _Entry] = {}
+        self._next_order = 0
+
+    def __len__(self) -> int:
+        return len(self._subsid_to_entry)
+
+    def add(self, subsid: str, subfn: Callable, field_filter: FieldFilter):
+        # the first field is chosen for indexing, for subscriptions of a
+        # code usually filter by the same key fields
+        field, values = next(iter(field_filter.field_to_values.items()))
+        entry = _Entry(
+            self._next_order,
+            subsid,
+            subfn,
+            field=field,
+            values=values,
+            rest=field_filter.without(field)
+        )
+        self._next_order += 1
+        self._subsid_to_entry[subsid] = entry
+        value_to_entries = self._field_to_value_to_entries.setdefault(
+            field, {}
+        )
+        for value in values:
+            value_to_entries.setdefault(value, []).append(entry)
+
+    def remove(self, subsid: str) -> bool:
+        entry = self._subsid_to_entry.pop(subsid, None)
+        if entry is None:
+            return False
+        value_to_entries = self._field_to_value_to_entries[entry.field]
+        for value in entry.values:
+            entries = value_to_entries[value]
+            entries.remove(entry)
+            if not entries:
+                del value_to_entries[value]
+        if not value_to_entries:
+            del self._field_to_value_to_entries[entry.field]
+        return True
+
+    def match(self, msg: Any) -> list[Callable]:
+        """
+        Gets subfns which filters match the msg, in order of subscription.
+        """
+        found: list[_Entry] = []
+        for field, value_to_entries in \
+                self._field_to_value_to_entries.items():
+            value = get_field(msg, field)
+            if value is _MISSING:
+                continue
+            try:
+                entries = value_to_entries.get(value, None)
+            except TypeError:
+                # unhashable values never match
+                continue
+            if entries:
+                found.extend(
+                    entry for entry in entries if entry.rest.match(msg)
+                )
+        if len(found) > 1:
+            found.sort(key=lambda entry: entry.order)
+        return [entry.subfn for entry in found]
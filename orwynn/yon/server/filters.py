@@ -1,4 +1,4 @@
-from yon.server import Bus
+from orwynn.yon.server import Bus
 
 __all__ = [
     "disable_subfn_lsid"
@@ -0,0 +1,79 @@
+"""
+Named groups of cons, such as chat rooms, to publish to at once.
+"""
+from typing import Iterable
+
+
+class GroupIndex:
+    """
+    Cons indexed by groups they've joined, and groups indexed by cons.
+
+    Consids of a group are returned as an immutable snapshot, which is kept
+    until the group changes. Publishing to a group many times thus doesn't
+    rebuild the target list, and the snapshot stays valid while the bus
+    awaits sending to its cons.
+    """
+    def __init__(self) -> None:
+        # dicts are used as ordered sets, so cons are sent to in order of
+        # joining
+        self._group_to_consids: dict[str, dict[str, None]] = {}
+        self._consid_to_groups: dict[str, set[str]] = {}
+        self._group_to_snapshot: dict[str, tuple[str, ...]] = {}
+
+    def join(self, consid: str, group: str):
+        consids = self._group_to_consids.setdefault(group, {})
+        if consid in consids:
+            return
+        consids[consid] = None
+        self._consid_to_groups.setdefault(consid, set()).add(group)
+        self._group_to_snapshot.pop(group, None)
+
+    def leave(self, consid: str, group: str) -> bool:
+        consids = self._group_to_consids.get(group, None)
+        if consids is None or consid not in consids:
+            return False
+        del consids[consid]
+        if not consids:
+            del self._group_to_consids[group]
+        self._group_to_snapshot.pop(group, None)
+
+        groups = self._consid_to_groups[consid]
+        groups.discard(group)
+        if not groups:
+            del self._consid_to_groups[consid]
+        return True
+
+    def leave_all(self, consid: str):
+        """
+        Removes the con from all of its groups.
+        """
+        for group in self._consid_to_groups.get(consid, set()).copy():
+            self.leave(consid, group)
+
+    def get_consids(self, group: str) -> tuple[str, ...]:
+        snapshot = self._group_to_snapshot.get(group, None)
+        if snapshot is not None:
+            return snapshot
+        consids = self._group_to_consids.get(group, None)
+        if consids is None:
+            return ()
+        snapshot = tuple(consids)
+        self._group_to_snapshot[group] = snapshot
+        return snapshot
+
+    def get_groups(self, consid: str) -> list[str]:
+        return list(self._consid_to_groups.get(consid, ()))
+
+    def resolve(
+        self, groups: Iterable[str], consids: Iterable[str] | None = None
+    ) -> tuple[str, ...]:
+        """
+        Gets consids of all the groups and the extra consids, each once.
+        """
+        groups = list(groups)
+        if len(groups) == 1 and not consids:
+            return self.get_consids(groups[0])
+        resolved: dict[str, None] = dict.fromkeys(consids or ())
+        for group in groups:
+            resolved.update(dict.fromkeys(self.get_consids(group)))
+        return tuple(resolved)
@@ -0,0 +1,67 @@
+"""
+Writing of text lines by a background thread, for targets such as logs and
+files, which otherwise would block the event loop.
+"""
+import asyncio
+import queue
+import threading
+from typing import Callable
+
+from ryz import log
+
+
+class LineSink:
+    """
+    Writes text lines from a background thread.
+
+    Lines are passed through a bounded queue. Once the queue is full, new
+    lines are dropped and counted, so a slow target never stalls the bus.
+    """
+    def __init__(
+        self,
+        write: Callable[[str], None],
+        max_queue_size: int = 10000,
+        thread_name: str = "yon-sink"
+    ) -> None:
+        self._write = write
+        self._queue: queue.Queue[str | None] = queue.Queue(max_queue_size)
+        self._dropped_count = 0
+        self._thread = threading.Thread(
+            target=self._run, name=thread_name, daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def dropped_count(self) -> int:
+        return self._dropped_count
+
+    def put(self, line: str):
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self._dropped_count += 1
+
+    def close(self, timeout: float | None = 1.0):
+        """
+        Writes the queued lines and stops the thread.
+        """
+        # the sentinel must get in even if the queue is full
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    async def aclose(self, timeout: float | None = 1.0):
+        """
+        Same as "close", but waits for the thread without blocking the event
+        loop.
+        """
+        await asyncio.to_thread(self.close, timeout)
+
+    def _run(self):
+        while True:
+            line = self._queue.get()
+            if line is None:
+                return
+            try:
+                self._write(line)
+            except Exception as err:
+                log.track(err, f"during {self._thread.name} line write")
@@ -0,0 +1,240 @@
+"""
+Metrics of the bus.
+
+Counters and histograms are plain slotted objects created once per code and
+subfn, so recording a value on the hot path is a few attribute updates.
+Gauges, such as queue sizes, aren't recorded at all, but read from the bus
+state on each snapshot.
+"""
+import functools
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Iterable
+
+DEFAULT_LATENCY_BOUNDS: tuple[float, ...] = (
+    0.00001,
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1,
+    5,
+)
+"""
+Default upper bounds of histogram buckets, in seconds.
+"""
+
+class Histogram:
+    __slots__ = ("bounds", "count", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        """
+        Number of observations per bucket. The last bucket holds
+        observations above all bounds.
+        """
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "bounds": list(self.bounds),
+            "counts": self.counts.copy(),
+            "sum": self.sum,
+            "count": self.count
+        }
+
+class CodeMetrics:
+    __slots__ = ("deser_time", "pub_count", "recv_count", "ser_time")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.pub_count = 0
+        self.recv_count = 0
+        """
+        Number of msgs received from the net.
+        """
+        self.ser_time = Histogram(bounds)
+        """
+        Time of serializing msgs to be sent to the net, including their
+        encoding in each wire fmt of the target cons.
+        """
+        self.deser_time = Histogram(bounds)
+        """
+        Time of deserializing msgs received from the net.
+        """
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "pub_count": self.pub_count,
+            "recv_count": self.recv_count,
+            "ser_time": self.ser_time.snapshot(),
+            "deser_time": self.deser_time.snapshot()
+        }
+
+class Metrics:
+    """
+    Registry of per code and per subfn metrics.
+    """
+    def __init__(
+        self,
+        latency_bounds: tuple[float, ...] = DEFAULT_LATENCY_BOUNDS
+    ) -> None:
+        self._latency_bounds = latency_bounds
+        self._code_to_metrics: dict[str, CodeMetrics] = {}
+        # keyed by name, not by subfn, so several subs of the same function,
+        # or closures recreated per sub, share the histogram
+        self._subfn_name_to_latency: dict[str, Histogram] = {}
+
+    def get_code(self, code: str) -> CodeMetrics:
+        metrics = self._code_to_metrics.get(code, None)
+        if metrics is None:
+            metrics = CodeMetrics(self._latency_bounds)
+            self._code_to_metrics[code] = metrics
+        return metrics
+
+    def get_subfn_latency(self, subfn: Callable) -> Histogram:
+        """
+        Gets latency histogram of a subfn.
+
+        Subfns sharing a name, e.g. several subs of the same function, share
+        the histogram.
+        """
+        name = get_subfn_name(subfn)
+        latency = self._subfn_name_to_latency.get(name, None)
+        if latency is None:
+            latency = Histogram(self._latency_bounds)
+            self._subfn_name_to_latency[name] = latency
+        return latency
+
+    def time_subfn(
+        self, subfn: Callable[[Any], Awaitable[Any]]
+    ) -> Callable[[Any], Awaitable[Any]]:
+        """
+        Wraps a subfn to observe its latency on each call.
+
+        The histogram is resolved here, once per sub, so a call only
+        observes it.
+        """
+        latency = self.get_subfn_latency(subfn)
+
+        @functools.wraps(subfn)
+        async def timed(msg: Any) -> Any:
+            start = time.perf_counter()
+            ret = await subfn(msg)
+            latency.observe(time.perf_counter() - start)
+            return ret
+
+        return timed
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "codes": {
+                code: metrics.snapshot()
+                for code, metrics in self._code_to_metrics.items()
+            },
+            "subfns": {
+                name: latency.snapshot()
+                for name, latency in self._subfn_name_to_latency.items()
+            }
+        }
+
+def get_subfn_name(subfn: Callable) -> str:
+    module = getattr(subfn, "__module__", None)
+    qualname = getattr(subfn, "__qualname__", None)
+    if qualname is None:
+        return repr(subfn)
+    return f"{module}.{qualname}" if module else qualname
+
+def to_prometheus(snapshot: dict[str, Any]) -> str:
+    """
+    Formats a bus metrics snapshot, see [`Bus::get_metrics`], in Prometheus
+    text exposition format.
+
+    Per con metrics are left out, since con sids as labels would make
+    series count unbounded. Cons are counted per transport instead.
+    """
+    lines: list[str] = []
+    codes = snapshot.get("codes", {})
+    _add_family(lines, "yon_code_pub_total", "counter", (
+        ({"code": code}, m["pub_count"]) for code, m in codes.items()
+    ))
+    _add_family(lines, "yon_code_recv_total", "counter", (
+        ({"code": code}, m["recv_count"]) for code, m in codes.items()
+    ))
+    _add_histogram_family(lines, "yon_code_ser_seconds", (
+        ({"code": code}, m["ser_time"]) for code, m in codes.items()
+    ))
+    _add_histogram_family(lines, "yon_code_deser_seconds", (
+        ({"code": code}, m["deser_time"]) for code, m in codes.items()
+    ))
+    _add_histogram_family(lines, "yon_subfn_latency_seconds", (
+        ({"subfn": name}, h)
+        for name, h in snapshot.get("subfns", {}).items()
+    ))
+
+    transports = snapshot.get("transports", {})
+    _add_family(lines, "yon_inp_queue_size", "gauge", (
+        ({"transport": name, "shard": str(shard)}, size)
+        for name, t in transports.items()
+        for shard, size in enumerate(t["inp_queue_sizes"])
+    ))
+    _add_family(lines, "yon_out_queue_size", "gauge", (
+        ({"transport": name}, t["out_queue_size"])
+        for name, t in transports.items()
+    ))
+    _add_family(lines, "yon_cons", "gauge", (
+        ({"transport": name}, t["cons_count"])
+        for name, t in transports.items()
+    ))
+    return "\n".join(lines) + "\n"
+
+def _add_family(
+    lines: list[str],
+    name: str,
+    kind: str,
+    samples: Iterable[tuple[dict[str, str], float]]
+):
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{_fmt_labels(labels)} {value}")
+
+def _add_histogram_family(
+    lines: list[str],
+    name: str,
+    samples: Iterable[tuple[dict[str, str], dict[str, Any]]]
+):
+    lines.append(f"# TYPE {name} histogram")
+    for labels, h in samples:
+        cumulative = 0
+        for bound, count in zip(
+            [*h["bounds"], "+Inf"], h["counts"], strict=True
+        ):
+            cumulative += count
+            bucket_labels = {**labels, "le": str(bound)}
+            lines.append(
+                f"{name}_bucket{_fmt_labels(bucket_labels)} {cumulative}"
+            )
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {h['sum']}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {h['count']}")
+
+def _fmt_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for k, v in labels.items():
+        escaped = v \
+            .replace("\\", "\\\\") \
+            .replace("\"", "\\\"") \
+            .replace("\n", "\\n")
+        parts.append(f"{k}=\"{escaped}\"")
+    return "{" + ",".join(parts) + "}"
@@ -1,9 +1,12 @@
-from typing import Any, Callable, Self, TypeVar
+from typing import Any, Self, Sequence, TypeVar
 
 from pydantic import BaseModel
 from ryz import log
-from ryz.core import Code, Err, Ok, Res, resultify
-from ryz.uuid import uuid4
+from ryz.core import Err, Ok, Res
+
+from orwynn.yon.server.sid import SidStrategy, gen_sid
+from orwynn.yon.server.tracing import SpanCtx
+from orwynn.yon.server.wire import WireFmt
 
 Msg = Any
 TMsg = TypeVar("TMsg", bound=Msg)
@@ -41,6 +44,11 @@ class Bmsg(BaseModel):
     Otherwise it is always set to consid.
     """
 
+    skip__span_ctx: SpanCtx | None = None
+    """
+    Trace span ctx of the msg, if tracing is enabled.
+    """
+
     skip__target_consids: list[str] | None = None
     """
     To which consids the published msg should be addressed.
@@ -64,7 +72,7 @@ class Bmsg(BaseModel):
 
     def __init__(self, **data):
         if "sid" not in data:
-            data["sid"] = uuid4()
+            data["sid"] = gen_sid()
         super().__init__(**data)
 
     def __hash__(self) -> int:
@@ -72,26 +80,102 @@ class Bmsg(BaseModel):
         return hash(self.sid)
 
     async def serialize_to_net(self, codeid: int) -> Res[dict]:
-        final = self.model_dump()
+        return Envelope.from_bmsg(self).serialize_to_net(codeid)
 
-        msg = final["msg"]
-        # don't include empty collections in serialization
-        if getattr(msg, "__len__", None) is not None and len(msg) == 0:
-            msg = None
+    @classmethod
+    async def deserialize_from_net(cls, rbmsg: dict) -> Res[Self]:
+        """Recovers model of this class using dictionary."""
+        envelope = await Envelope.deserialize_from_net(rbmsg)
+        if isinstance(envelope, Err):
+            return envelope
+        return Ok(envelope.ok.to_bmsg(cls))
 
-        # serialize exception to errdto
-        if isinstance(msg, Exception):
-            if not isinstance(msg, Err):
-                # traceback won't be a thing here so we ignore how many frames
-                # we skip
-                msg = Err.from_native(msg)
-            # to not duplicate code in two places, we omit it in the msg, and
-            # specify it at the bmsg (which is done at [`Bus::_new_bmsg`])
-            msg = {"msg": msg.msg}
+TBmsg = TypeVar("TBmsg", bound=Bmsg)
+
+class Envelope:
+    """
+    Slotted counterpart of [`Bmsg`] for the bus internal traffic.
+
+    Envelopes are created by the bus itself from trusted values, so unlike
+    bmsgs they aren't validated. Bmsgs passed to the bus are converted to
+    envelopes, and back once a bmsg is required, see [`Envelope.from_bmsg`]
+    and [`Envelope.to_bmsg`].
+
+    Fields are the same as of [`Bmsg`].
+    """
+    __slots__ = (
+        "is_err",
+        "lsid",
+        "msg",
+        "sid",
+        "skip__code",
+        "skip__consid",
+        "skip__span_ctx",
+        "skip__target_consids"
+    )
+
+    def __init__(
+        self,
+        skip__code: str,
+        msg: Msg,
+        *,
+        sid: str | None = None,
+        lsid: str | None = None,
+        is_err: bool | None = None,
+        skip__consid: str | None = None,
+        skip__target_consids: Sequence[str] | None = None,
+        skip__span_ctx: SpanCtx | None = None
+    ) -> None:
+        self.sid = sid or gen_sid()
+        self.lsid = lsid
+        self.skip__consid = skip__consid
+        self.skip__span_ctx = skip__span_ctx
+        self.skip__target_consids = skip__target_consids
+        self.skip__code = skip__code
+        self.is_err = is_err
+        self.msg = msg
+
+    def __hash__(self) -> int:
+        return hash(self.sid)
 
-        final["codeid"] = codeid
+    def __repr__(self) -> str:
+        return \
+            f"Envelope(sid={self.sid}, lsid={self.lsid}," \
+            f" code={self.skip__code}, msg={self.msg!r})"
 
-        if "skip__consid" in final and final["skip__consid"] is not None:
+    @classmethod
+    def from_bmsg(cls, bmsg: Bmsg) -> "Envelope":
+        return cls(
+            skip__code=bmsg.skip__code,
+            msg=bmsg.msg,
+            sid=bmsg.sid,
+            lsid=bmsg.lsid,
+            is_err=bmsg.is_err,
+            skip__consid=bmsg.skip__consid,
+            skip__target_consids=bmsg.skip__target_consids,
+            skip__span_ctx=bmsg.skip__span_ctx
+        )
+
+    def to_bmsg(self, bmsg_type: type[TBmsg] = Bmsg) -> TBmsg:
+        # fields are already valid, so validation is skipped
+        return bmsg_type.model_construct(
+            sid=self.sid,
+            lsid=self.lsid,
+            skip__consid=self.skip__consid,
+            skip__span_ctx=self.skip__span_ctx,
+            skip__target_consids=self.skip__target_consids,
+            skip__code=self.skip__code,
+            is_err=self.is_err,
+            msg=self.msg
+        )
+
+    def serialize_to_net(self, codeid: int) -> Res[dict]:
+        """
+        Serializes the envelope to rbmsg.
+
+        Fields set to None, and fields prefixed with "skip__" are omitted.
+        """
+        if self.skip__consid is not None:
             # consids must exist only inside server bus, it's probably an err
             # if a msg is tried to be serialized with consid, but we will
             # throw a warning for now, and ofcourse del the field
@@ -100,115 +184,55 @@ class Bmsg(BaseModel):
                 f" to serialize msg {self} with consid != None => ignore"
             )
 
-        keys_to_del = self._get_keys_to_del_from_serialized(final)
-
-        for k in keys_to_del:
-            del final[k]
-
-        final["msg"] = msg
-        if msg is None and "msg" in final:
-            del final["msg"]
-        return Ok(final)
+        rbmsg: dict[str, Any] = {"sid": self.sid, "codeid": codeid}
+        if self.lsid is not None:
+            rbmsg["lsid"] = self.lsid
+        if self.is_err is not None:
+            rbmsg["is_err"] = self.is_err
 
-    @classmethod
-    async def _parse_rbmsg_code(cls, rbmsg: dict) -> Res[str]:
-        if "codeid" not in rbmsg:
-            return Err(f"rbmsg {rbmsg} must have \"codeid\" field")
-        codeid = rbmsg["codeid"]
-        del rbmsg["codeid"]
-        if not isinstance(codeid, int):
-            return Err(
-                f"invalid type of codeid {codeid}, expected int"
-            )
-
-        if "is_err" in rbmsg and rbmsg["is_err"] is not None:
-            # client cannot send error messages
-            return Err("must not deserialize error messages")
-        # so here we know we won't be dealing with ecodes
-        r = await Code.get_regd_code_by_id(codeid)
-        if isinstance(r, Err):
-            return r
-        code = r.ok
-        if not Code.has_code(code):
-            return Err(f"unregd code {code}")
-
-        return Ok(code)
-
-    @classmethod
-    def _get_keys_to_del_from_serialized(cls, body: dict) -> list[str]:
-        keys_to_del: list[str] = []
-        is_msid_found = False
-        for k, v in body.items():
-            if k == "sid":
-                is_msid_found = True
-                continue
-            # all internal or skipped keys are deleted from the final
-            # serialization
-            if (
-                    v is None
-                    or k.startswith(("internal__", "skip__"))):
-                keys_to_del.append(k)
-        if not is_msid_found:
-            raise ValueError(f"no sid field for rbmsg {body}")
-        return keys_to_del
-
-    @classmethod
-    async def _parse_rbmsg(cls, rbmsg: dict) -> Res[Msg]:
-        msg = rbmsg.get("msg", None)
-
-        r = await cls._parse_rbmsg_code(rbmsg)
-        if isinstance(r, Err):
-            return r
-        code = r.ok
-
-        rbmsg["skip__code"] = code
-
-        custom_type_res = await Code.get_regd_type_by_code(code)
-        if isinstance(custom_type_res, Err):
-            return custom_type_res
-        custom_type = custom_type_res.ok
-
-        deserialize_custom = getattr(custom_type, "deserialize", None)
-        final_deserialize_fn: Callable[[], Any]
-        if issubclass(custom_type, BaseModel):
-            # for case of rbmsg with empty body field, we'll try to initialize
-            # the type without any fields (empty dict)
-            if msg is None:
-                msg = {}
-            elif not isinstance(msg, dict):
-                return Err(
-                    f"if custom type ({custom_type}) is a BaseModel, body"
-                    f" {msg} must be a dict, got type {type(msg)}"
-                )
-            final_deserialize_fn = lambda: custom_type(**msg)
-        elif deserialize_custom is not None:
-            final_deserialize_fn = lambda: deserialize_custom(msg)
+        msg = self.msg
+        # serialize exception to errdto
+        if isinstance(msg, Exception):
+            if not isinstance(msg, Err):
+                # traceback won't be a thing here so we ignore how many frames
+                # we skip
+                msg = Err.from_native(msg)
+            # to not duplicate code in two places, we omit it in the msg, and
+            # specify it at the bmsg (which is done at [`Bus::_new_bmsg`])
+            msg = {"msg": msg.msg}
         else:
-            # for arbitrary types: just pass body as init first arg
-            final_deserialize_fn = lambda: custom_type(msg)
-
-        return resultify(final_deserialize_fn)
+            msg = _dump_msg(msg)
+        # don't include empty collections in serialization
+        if msg is not None and not (
+            getattr(msg, "__len__", None) is not None and len(msg) == 0
+        ):
+            rbmsg["msg"] = msg
+        return Ok(rbmsg)
 
     @classmethod
-    async def deserialize_from_net(cls, rbmsg: dict) -> Res[Self]:
-        """Recovers model of this class using dictionary."""
-        # parse body separately according to it's regd type
-        msg = await cls._parse_rbmsg(rbmsg)
-        if isinstance(msg, Err):
-            return msg
-        msg = msg.ok
-
-        if "lsid" not in rbmsg:
-            rbmsg["lsid"] = None
-
-        rbmsg = rbmsg.copy()
-        # don't do redundant serialization of Any type
-        rbmsg["msg"] = None
-        bmsg = cls.model_validate(rbmsg.copy())
-        bmsg.msg = msg
-        return Ok(bmsg)
+    async def deserialize_from_net(cls, rbmsg: dict) -> Res["Envelope"]:
+        """
+        Recovers envelope from rbmsg the same way as the bus does for
+        received rbmsgs, see [`decode::decode_rbmsg`].
+
+        Raw msg bodies are decoded as json.
+        """
+        # decode module builds envelopes, so it's imported only on call
+        from orwynn.yon.server.codec import JsonCodec
+        from orwynn.yon.server.decode import decode_rbmsg_by_regd_code
+        return await decode_rbmsg_by_regd_code(
+            rbmsg, JsonCodec(), rbmsg.get("skip__consid", None)
+        )
+
+def _dump_msg(msg: Msg) -> Any:
+    if isinstance(msg, BaseModel):
+        return msg.model_dump()
+    if isinstance(msg, dict):
+        return {k: _dump_msg(v) for k, v in msg.items()}
+    if isinstance(msg, (list, tuple)):
+        return [_dump_msg(v) for v in msg]
+    return msg
 
-TBmsg = TypeVar("TBmsg", bound=Bmsg)
 # lowercase to not conflict with res.Ok
 class ok(BaseModel):
     def __str__(self) -> str:
@@ -224,7 +248,59 @@ class Welcome(BaseModel):
     Welcome evt sent to every conected client.
     """
     codes: list[str]
+    fmts: list[str] = list(WireFmt.All)
+    """
+    Wire formats the client can switch to using [`SetWireFmt`].
+    """
+    sid_strategy: str = SidStrategy.Uuid
+    """
+    How the server generates sids, see [`sid::SidStrategy`].
+    """
 
     @staticmethod
     def code() -> str:
         return "yon::server::welcome"
+
+class SetWireFmt(BaseModel):
+    """
+    Sent by a client to switch wire format of its conection.
+
+    Once accepted, all further msgs to the client, including the ok response
+    to this msg, are sent in the new format.
+    """
+    fmt: str
+    is_sid_int: bool = False
+    """
+    Whether sids and lsids which are decimal integers are sent to the client
+    as integers. Int sids sent by clients are accepted regardless.
+    """
+
+    @staticmethod
+    def code() -> str:
+        return "yon::set_wire_fmt"
+
+class InpQueueHigh(BaseModel):
+    """
+    Published to the inner bus once an inp queue shard of a transport
+    reaches its high watermark.
+    """
+    con_type: str
+    shard: int
+    size: int
+
+    @staticmethod
+    def code() -> str:
+        return "yon::server::inp_queue_high"
+
+class InpQueueLow(BaseModel):
+    """
+    Published to the inner bus once an inp queue shard of a transport, which
+    has reached its high watermark, drains to its low watermark.
+    """
+    con_type: str
+    shard: int
+    size: int
+
+    @staticmethod
+    def code() -> str:
+        return "yon::server::inp_queue_low"
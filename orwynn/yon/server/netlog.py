@@ -0,0 +1,105 @@
+"""
+Logging of rbmsgs sent and received over the net.
+
+Net logging sits on the hot path of every rbmsg, so nothing is looked up or
+formatted unless the rbmsg is actually going to be logged, and the writing
+itself is done by a background thread, not blocking the event loop.
+"""
+import contextlib
+import reprlib
+from typing import TYPE_CHECKING, Callable
+
+from ryz import log
+
+from orwynn.yon.server.linesink import LineSink
+
+if TYPE_CHECKING:
+    from orwynn.yon.server.transport import Con
+
+
+class NetLogSink(LineSink):
+    """
+    Writes net log lines, by default to the info log, see [`LineSink`].
+    """
+    def __init__(
+        self,
+        write: Callable[[str], None] = log.info,
+        max_queue_size: int = 10000,
+        thread_name: str = "yon-netlog"
+    ) -> None:
+        super().__init__(write, max_queue_size, thread_name)
+
+class NetLogger:
+    """
+    Decides which net rbmsgs are logged, and formats them.
+
+    Each code can be sampled at its own rate, from 0 (never logged) to 1
+    (always logged). Sampling is deterministic: with rate 0.1 every 10th
+    rbmsg of the code is logged.
+
+    Payloads are formatted with bounded depth and length, and the formatted
+    rbmsg is truncated to "max_payload_len" chars.
+    """
+    def __init__(
+        self,
+        sink: NetLogSink,
+        get_code: Callable[[int], str | None],
+        code_to_sample_rate: dict[str, float] | None = None,
+        max_payload_len: int = 512
+    ) -> None:
+        self._sink = sink
+        self._get_code = get_code
+        self._code_to_sample_rate = code_to_sample_rate or {}
+        self._code_to_count: dict[str, int] = {}
+        self._max_payload_len = max_payload_len
+        self._repr = reprlib.Repr()
+        self._repr.maxlevel = 4
+        self._repr.maxstring = max_payload_len
+        self._repr.maxother = max_payload_len
+        self._repr.maxlong = max_payload_len
+
+    def recv(self, con: "Con", rbmsg: dict):
+        self._log("NET::RECV", "from", con, rbmsg)
+
+    def send(self, con: "Con", rbmsg: dict):
+        self._log("NET::SEND", "to", con, rbmsg)
+
+    def close(self):
+        self._sink.close()
+
+    async def aclose(self):
+        await self._sink.aclose()
+
+    def _log(self, prefix: str, preposition: str, con: "Con", rbmsg: dict):
+        if log.std_verbosity < 1:
+            return
+        code = self._get_code(rbmsg.get("codeid", -1))
+        if not self._is_sampled(code):
+            return
+        body = rbmsg.get("msg", None)
+        if isinstance(body, (bytes, memoryview)):
+            # bodies of received bin rbmsgs are left encoded until the msg
+            # type decodes them, so here they are decoded only for the log
+            with contextlib.suppress(Exception):
+                rbmsg = {**rbmsg, "msg": con.get_codec().decode(bytes(body))}
+        payload = self._repr.repr(rbmsg)
+        if len(payload) > self._max_payload_len:
+            payload = payload[:self._max_payload_len] + "..."
+        self._sink.put(
+            f"{prefix} | \"{code or 'unknown'}\" {preposition}"
+            f" {con.get_display()} | {payload}"
+        )
+
+    def _is_sampled(self, code: str | None) -> bool:
+        if not self._code_to_sample_rate or code is None:
+            return True
+        rate = self._code_to_sample_rate.get(code, 1.0)
+        if rate >= 1:
+            return True
+        if rate <= 0:
+            return False
+        count = self._code_to_count.get(code, 0) + 1
+        self._code_to_count[code] = count
+        # the rbmsg is logged each time the count crosses the next multiple
+        # of 1/rate
+        return int(count * rate) != int((count - 1) * rate)
@@ -0,0 +1,114 @@
+"""
+Registry of published msgs awaiting linked responses.
+"""
+from typing import Callable, Iterable
+
+from orwynn.yon.server.timer import Timer, TimerWheel
+
+
+class PendingReq:
+    __slots__ = ("consids", "sid", "subfn", "timer")
+
+    def __init__(
+        self,
+        sid: str,
+        subfn: Callable,
+        consids: set[str],
+        timer: Timer | None
+    ) -> None:
+        self.sid = sid
+        self.subfn = subfn
+        self.consids = consids
+        """
+        Target cons which haven't disconnected yet.
+        """
+        self.timer = timer
+
+class PendingReqs:
+    """
+    Pending reqs indexed by msg sid and by target consids.
+
+    Each req is removed once its response arrives, its timeout expires, or
+    all of its target cons disconnect, whichever happens first.
+    """
+    def __init__(self, wheel: TimerWheel) -> None:
+        self._wheel = wheel
+        self._sid_to_req: dict[str, PendingReq] = {}
+        self._consid_to_sids: dict[str, set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._sid_to_req)
+
+    def __contains__(self, sid: str) -> bool:
+        return sid in self._sid_to_req
+
+    def add(
+        self,
+        sid: str,
+        subfn: Callable,
+        consids: Iterable[str] | None,
+        timeout: float | None,
+        on_expire: Callable[[PendingReq], None]
+    ) -> PendingReq:
+        timer = None
+        if timeout is not None:
+            timer = self._wheel.add(
+                timeout, lambda: self._expire(sid, on_expire)
+            )
+        req = PendingReq(sid, subfn, set(consids or ()), timer)
+        self._sid_to_req[sid] = req
+        for consid in req.consids:
+            if consid not in self._consid_to_sids:
+                self._consid_to_sids[consid] = set()
+            self._consid_to_sids[consid].add(sid)
+        return req
+
+    def pop(
+        self, sid: str, consid: str | None = None
+    ) -> PendingReq | None:
+        """
+        Removes the req with the given sid.
+
+        If consid of the responding con is given, the req is removed only if
+        it was sent to this con, or to no cons in particular. Sids may be
+        predictable, so a con cannot respond to reqs of other cons.
+        """
+        req = self._sid_to_req.get(sid, None)
+        if req is None:
+            return None
+        if consid is not None and req.consids and consid not in req.consids:
+            return None
+        del self._sid_to_req[sid]
+        if req.timer is not None:
+            req.timer.cancel()
+        for consid in req.consids:
+            sids = self._consid_to_sids.get(consid, None)
+            if sids is None:
+                continue
+            sids.discard(sid)
+            if not sids:
+                del self._consid_to_sids[consid]
+        return req
+
+    def pop_for_con(self, consid: str) -> list[PendingReq]:
+        """
+        Unlinks the disconnected con from its reqs.
+
+        Returns reqs left without any target con, which are removed.
+        """
+        popped: list[PendingReq] = []
+        for sid in self._consid_to_sids.pop(consid, set()):
+            req = self._sid_to_req.get(sid, None)
+            if req is None:
+                continue
+            req.consids.discard(consid)
+            if not req.consids:
+                popped.append(req)
+        for req in popped:
+            self.pop(req.sid)
+        return popped
+
+    def _expire(self, sid: str, on_expire: Callable[[PendingReq], None]):
+        req = self.pop(sid)
+        if req is not None:
+            on_expire(req)
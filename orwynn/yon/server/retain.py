@@ -0,0 +1,153 @@
+"""
+Cache of last published msgs, delivered to new subscribers which set
+`SubOpts.recv_last_msg`.
+"""
+import sys
+from collections import OrderedDict
+from typing import Any
+
+from pydantic import BaseModel
+from ryz.core import Err, Ok, Res
+
+from orwynn.yon.server.codec import JsonCodec
+from orwynn.yon.server.msg import Envelope
+from orwynn.yon.server.timer import Timer, TimerWheel
+
+
+class RetainOpts(BaseModel):
+    """
+    How last msgs of a code are retained.
+    """
+    ttl: float | None = None
+    """
+    Time in seconds a msg is retained for. None means until evicted.
+    """
+    key_field: str | None = None
+    """
+    Field of the msg by which values the msgs are retained.
+
+    For example, "id" means that the last msg is retained for each distinct
+    id. None means a single last msg is retained for the code.
+    """
+
+_JSON_CODEC = JsonCodec()
+
+class _Entry:
+    __slots__ = ("bmsg", "size", "timer")
+
+    def __init__(self, bmsg: Envelope, size: int, timer: Timer | None) -> None:
+        self.bmsg = bmsg
+        self.size = size
+        self.timer = timer
+
+class RetainCache:
+    """
+    Retains last msgs of opted-in codes within a total byte budget.
+
+    Once the budget is exceeded, least recently used msgs are evicted first.
+    Msg sizes are taken from their net encoding, if the msg was encoded, and
+    from their json encoding otherwise.
+    """
+    def __init__(self, wheel: TimerWheel, max_bytes: int) -> None:
+        self._wheel = wheel
+        self._max_bytes = max_bytes
+        self._code_to_opts: dict[str, RetainOpts] = {}
+        self._entries: OrderedDict[tuple[str, Any], _Entry] = OrderedDict()
+        self._code_to_keys: dict[str, dict[Any, None]] = {}
+        self._size = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def set_opts(self, code: str, opts: RetainOpts | None):
+        """
+        Sets retention opts of the code. None disables the retention and
+        drops already retained msgs.
+        """
+        if opts is None:
+            self._code_to_opts.pop(code, None)
+            for key in list(self._code_to_keys.get(code, {})):
+                self._del((code, key))
+            return
+        self._code_to_opts[code] = opts
+
+    def put(
+        self, code: str, bmsg: Envelope, size: int | None = None
+    ) -> Res[None]:
+        """
+        Retains the msg if its code is opted in.
+
+        Size of the already encoded msg can be given to not estimate it.
+        """
+        opts = self._code_to_opts.get(code, None)
+        if opts is None:
+            return Ok()
+
+        key = (
+            code,
+            getattr(bmsg.msg, opts.key_field, None)
+            if opts.key_field else None
+        )
+        try:
+            self._del(key)
+        except TypeError:
+            return Err(
+                f"retain key field \"{opts.key_field}\" value of {bmsg}"
+                " is unhashable"
+            )
+
+        if size is None:
+            size = self._estimate_size(bmsg.msg)
+        if size > self._max_bytes:
+            return Ok()
+        timer = None
+        if opts.ttl is not None:
+            timer = self._wheel.add(opts.ttl, lambda: self._del(key))
+        self._entries[key] = _Entry(bmsg, size, timer)
+        if code not in self._code_to_keys:
+            self._code_to_keys[code] = {}
+        self._code_to_keys[code][key[1]] = None
+        self._size += size
+
+        while self._size > self._max_bytes:
+            self._del(next(iter(self._entries)))
+        return Ok()
+
+    def get(self, code: str) -> list[Envelope]:
+        """
+        Gets retained msgs of the code, oldest first.
+        """
+        bmsgs: list[Envelope] = []
+        for k in self._code_to_keys.get(code, {}):
+            key = (code, k)
+            self._entries.move_to_end(key)
+            bmsgs.append(self._entries[key].bmsg)
+        return bmsgs
+
+    def _del(self, key: tuple[str, Any]):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        if entry.timer is not None:
+            entry.timer.cancel()
+        self._size -= entry.size
+        keys = self._code_to_keys[key[0]]
+        del keys[key[1]]
+        if not keys:
+            del self._code_to_keys[key[0]]
+
+    def _estimate_size(self, msg: Any) -> int:
+        # only msgs of opted-in codes are encoded here, so other pubs don't
+        # pay for it
+        if isinstance(msg, BaseModel):
+            return len(msg.model_dump_json().encode())
+        if isinstance(msg, bytes):
+            return len(msg)
+        if isinstance(msg, (str, Exception)):
+            return len(str(msg).encode())
+        try:
+            return len(_JSON_CODEC.encode(msg))
+        except (TypeError, ValueError):
+            # msgs which never go to the net may be not json serializable
+            return sys.getsizeof(msg)
@@ -0,0 +1,94 @@
+"""
+Generation of msg sids.
+
+Sids are strings inside the bus. Depending on the strategy they are either
+uuid4 strings, or decimal strings of a per-process monotonic counter. The
+latter are cheaper to generate, and can be sent over the net as integers to
+the cons which support that, see [`msg::SetWireFmt`].
+"""
+import itertools
+
+from ryz.core import Err, Ok, Res
+from ryz.uuid import uuid4
+
+_MAX_INT_SID = 2**64 - 1
+
+MAX_SID_SIZE = 255
+"""
+Max size of a string sid in utf-8 bytes, limited by the bin wire format.
+"""
+
+class SidStrategy:
+    Uuid = "uuid"
+    """
+    Uuid4 strings, the default, kept for compatibility with clients relying
+    on sids being globally unique.
+    """
+    Counter = "counter"
+    """
+    Decimal strings of a per-process monotonic counter.
+    """
+
+    All = (Uuid, Counter)
+
+# the counter is never reset, so sids stay unique within the process even if
+# the strategy is changed back and forth
+_counter = itertools.count(1)
+
+def _gen_counter_sid() -> str:
+    return str(next(_counter))
+
+_gen = uuid4
+
+def gen_sid() -> str:
+    """
+    Generates a new sid according to the current strategy.
+    """
+    return _gen()
+
+def set_sid_strategy(strategy: str) -> Res[None]:
+    global _gen  # noqa: PLW0603
+    if strategy == SidStrategy.Uuid:
+        _gen = uuid4
+    elif strategy == SidStrategy.Counter:
+        _gen = _gen_counter_sid
+    else:
+        return Err(f"unsupported sid strategy {strategy}")
+    return Ok()
+
+def to_int_sid(sid: str) -> int | None:
+    """
+    Converts a sid to int, if it is a canonical decimal of an unsigned
+    64-bit integer, so the conversion back gives the same sid.
+    """
+    if (
+        not sid.isascii()
+        or not sid.isdecimal()
+        or (len(sid) > 1 and sid[0] == "0")
+    ):
+        return None
+    value = int(sid)
+    if value > _MAX_INT_SID:
+        return None
+    return value
+
+def from_net_sid(sid: object) -> str | None:
+    """
+    Converts a sid received from the net to the bus representation.
+
+    Returns None if the sid is invalid.
+    """
+    if isinstance(sid, str):
+        # sids may be resent as lsids to cons of any wire fmt, so the limit
+        # is checked regardless of the fmt they came in
+        if not sid or len(sid.encode()) > MAX_SID_SIZE:
+            return None
+        return sid
+    # bool is an int subclass, but never a valid sid
+    if (
+        isinstance(sid, int)
+        and not isinstance(sid, bool)
+        and 0 <= sid <= _MAX_INT_SID
+    ):
+        return str(sid)
+    return None
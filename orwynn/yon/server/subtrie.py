@@ -0,0 +1,188 @@
+"""
+Index of subscriptions to code patterns.
+
+Codes are namespaced by "::", e.g. "myapp::telemetry::cpu". A pattern is a
+code which segments may be wildcards:
+    * "*" - matches exactly one segment
+    * "**" - matches any number of segments, including zero
+
+For example, "myapp::telemetry::*" matches "myapp::telemetry::cpu", but not
+"myapp::telemetry::cpu::load", while "myapp::**" matches both of them, and
+"myapp" itself.
+"""
+from typing import Callable
+
+from ryz.core import Err, Ok, Res
+
+Sep = "::"
+Star = "*"
+Globstar = "**"
+
+def is_pattern(code: str) -> bool:
+    return Star in code
+
+def parse_pattern(pattern: str) -> Res[list[str]]:
+    segs = pattern.split(Sep)
+    for seg in segs:
+        if not seg:
+            return Err(f"pattern \"{pattern}\" has empty segment")
+        if Star in seg and seg not in (Star, Globstar):
+            return Err(
+                f"pattern \"{pattern}\" wildcards must take whole segments"
+            )
+    return Ok(segs)
+
+def match_pattern(pattern: str, code: str) -> bool:
+    """
+    Checks if the code matches the pattern, without building an index.
+    """
+    return _match_segs(pattern.split(Sep), code.split(Sep))
+
+def _match_segs(pattern_segs: list[str], code_segs: list[str]) -> bool:
+    if not pattern_segs:
+        return not code_segs
+    head = pattern_segs[0]
+    if head == Globstar:
+        return any(
+            _match_segs(pattern_segs[1:], code_segs[i:])
+            for i in range(len(code_segs) + 1)
+        )
+    if not code_segs:
+        return False
+    if head not in (Star, code_segs[0]):
+        return False
+    return _match_segs(pattern_segs[1:], code_segs[1:])
+
+class _Entry:
+    __slots__ = ("order", "subfn", "subsid")
+
+    def __init__(self, order: int, subsid: str, subfn: Callable) -> None:
+        self.order = order
+        self.subsid = subsid
+        self.subfn = subfn
+
+class _Node:
+    __slots__ = ("children", "entries", "is_globstar")
+
+    def __init__(self, is_globstar: bool = False) -> None:
+        self.children: dict[str, _Node] = {}
+        self.entries: list[_Entry] = []
+        self.is_globstar = is_globstar
+
+class SubTrie:
+    """
+    Trie of pattern subscriptions, keyed by pattern segments.
+
+    Matching of a code walks the trie segment by segment, so its cost
+    depends on the code depth and the number of wildcard branches, and not
+    on the total number of patterns. Matches are cached per code until the
+    trie is changed, or [`SubTrie.clear_cache`] is called.
+    """
+    def __init__(self) -> None:
+        self._root = _Node()
+        self._subsid_to_segs: dict[str, list[str]] = {}
+        self._next_order = 0
+        self._code_to_subfns: dict[str, list[Callable]] = {}
+
+    def __len__(self) -> int:
+        return len(self._subsid_to_segs)
+
+    def __contains__(self, subsid: str) -> bool:
+        return subsid in self._subsid_to_segs
+
+    def add(self, pattern: str, subsid: str, subfn: Callable) -> Res[None]:
+        segs = parse_pattern(pattern)
+        if isinstance(segs, Err):
+            return segs
+        node = self._root
+        for seg in segs.ok:
+            child = node.children.get(seg, None)
+            if child is None:
+                child = _Node(seg == Globstar)
+                node.children[seg] = child
+            node = child
+        node.entries.append(_Entry(self._next_order, subsid, subfn))
+        self._next_order += 1
+        self._subsid_to_segs[subsid] = segs.ok
+        self.clear_cache()
+        return Ok()
+
+    def remove(self, subsid: str) -> bool:
+        segs = self._subsid_to_segs.pop(subsid, None)
+        if segs is None:
+            return False
+        self._remove(self._root, segs, subsid)
+        self.clear_cache()
+        return True
+
+    def match(self, code: str) -> list[Callable]:
+        """
+        Gets subfns of patterns matching the code, in order of subscription.
+
+        The returned list must not be modified.
+        """
+        subfns = self._code_to_subfns.get(code, None)
+        if subfns is not None:
+            return subfns
+
+        nodes = self._expand([self._root])
+        for seg in code.split(Sep):
+            next_nodes: list[_Node] = []
+            for node in nodes:
+                for key in (seg, Star):
+                    child = node.children.get(key, None)
+                    if child is not None:
+                        next_nodes.append(child)
+                # globstar consumes the segment and stays active
+                if node.is_globstar:
+                    next_nodes.append(node)
+            nodes = self._expand(next_nodes)
+            if not nodes:
+                break
+
+        # a node may be reached by several paths, e.g. via "**" and "*"
+        entries = {
+            id(entry): entry for node in nodes for entry in node.entries
+        }
+        subfns = [
+            entry.subfn
+            for entry in sorted(entries.values(), key=lambda e: e.order)
+        ]
+        self._code_to_subfns[code] = subfns
+        return subfns
+
+    def clear_cache(self):
+        self._code_to_subfns = {}
+
+    def _expand(self, nodes: list[_Node]) -> list[_Node]:
+        """
+        Adds globstar children of the nodes, since a globstar may match zero
+        segments. Each node is returned once.
+        """
+        expanded: dict[int, _Node] = {}
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
+            if id(node) in expanded:
+                continue
+            expanded[id(node)] = node
+            globstar = node.children.get(Globstar, None)
+            if globstar is not None:
+                stack.append(globstar)
+        return list(expanded.values())
+
+    def _remove(self, node: _Node, segs: list[str], subsid: str) -> bool:
+        """
+        Removes the entry under the node's path, pruning emptied nodes.
+
+        Returns whether the node became empty.
+        """
+        if segs:
+            child = node.children.get(segs[0], None)
+            if child is not None and self._remove(child, segs[1:], subsid):
+                del node.children[segs[0]]
+        else:
+            node.entries = [
+                entry for entry in node.entries if entry.subsid != subsid
+            ]
+        return not node.entries and not node.children
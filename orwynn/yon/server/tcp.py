@@ -0,0 +1,184 @@
+"""
+Raw tcp transport.
+
+Each rbmsg, encoded in the con's wire format, is sent as a frame prefixed
+with its length:
+
+    u32     size of the encoded rbmsg
+    bytes   encoded rbmsg
+
+Unlike [`ws`], there is no http upgrade and no websocket framing, so it's
+suited for service-to-service traffic. Several rbmsgs ready for a con are
+written as separate frames at once, and the writer is drained after, so
+slow peers apply backpressure to the con's outbox. All integers are
+big-endian.
+"""
+import asyncio
+import contextlib
+import struct
+from typing import Any, Awaitable, Callable, Self
+
+from ryz import log
+
+from orwynn.yon.server import wire
+from orwynn.yon.server.transport import Con, ConArgs, Transport
+
+_SIZE = struct.Struct("!I")
+
+class TcpStream:
+    """
+    Core of a [`Tcp`] con: the asyncio stream pair of the conection.
+    """
+    __slots__ = ("max_frame_size", "reader", "writer")
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        max_frame_size: int = 1024 * 1024
+    ) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.max_frame_size = max_frame_size
+        """
+        Max size of a received frame. Once exceeded, the conection is
+        closed.
+        """
+
+class Tcp(Con[TcpStream]):
+    def __init__(self, args: ConArgs[TcpStream]) -> None:
+        super().__init__(args)
+
+    def __aiter__(self) -> Self:
+        return self
+
+    async def __anext__(self) -> dict:
+        try:
+            data = await self._read_frame()
+        except (asyncio.IncompleteReadError, ConnectionError) as err:
+            raise StopAsyncIteration from err
+        # bin msg bodies are decoded by the bus straight to their types
+        return wire.decode(data, self._codec, is_msg_raw=True)
+
+    @classmethod
+    async def connect(
+        cls, host: str, port: int, **kwargs: Any
+    ) -> Self:
+        """
+        Opens a conection to a tcp server.
+        """
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(ConArgs(core=TcpStream(reader, writer, **kwargs)))
+
+    async def recv(self) -> dict:
+        return wire.decode(
+            await self._read_frame(), self._codec, is_msg_raw=True
+        )
+
+    async def send(self, data: dict):
+        return await self.send_raw(wire.encode(
+            data,
+            self._codec,
+            self._wire_fmt,
+            is_sid_int=self._is_sid_int
+        ))
+
+    async def send_raw(self, data: bytes, fmt: str | None = None):
+        self._sent_bytes += len(data)
+        writer = self._core.writer
+        writer.writelines((_SIZE.pack(len(data)), data))
+        await writer.drain()
+
+    async def send_raw_batch(
+        self, datas: list[bytes], fmt: str | None = None
+    ):
+        # frames already delimit rbmsgs, so no batch envelope is needed
+        bufs: list[bytes] = []
+        for data in datas:
+            self._sent_bytes += len(data)
+            bufs.append(_SIZE.pack(len(data)))
+            bufs.append(data)
+        writer = self._core.writer
+        writer.writelines(bufs)
+        await writer.drain()
+
+    async def close(self):
+        if self._is_closed:
+            return
+        self._is_closed = True
+        writer = self._core.writer
+        writer.close()
+        with contextlib.suppress(ConnectionError):
+            await writer.wait_closed()
+
+    async def _read_frame(self) -> bytes:
+        reader = self._core.reader
+        (size,) = _SIZE.unpack(await reader.readexactly(_SIZE.size))
+        if size > self._core.max_frame_size:
+            raise ConnectionError(
+                f"frame of {size} bytes from {self} is too large"
+            )
+        data = await reader.readexactly(size)
+        self._recv_bytes += _SIZE.size + size
+        return data
+
+class TcpServer:
+    """
+    Tcp server passing each accepted [`Tcp`] con to "on_con", which
+    typically runs `Bus.con` for it. The con is served until "on_con"
+    returns.
+    """
+    con_type: type[Tcp] = Tcp
+
+    def __init__(
+        self,
+        on_con: Callable[[Tcp], Awaitable[Any]],
+        max_frame_size: int = 1024 * 1024
+    ) -> None:
+        self.max_frame_size = max_frame_size
+        self._on_con = on_con
+        self._server: asyncio.Server | None = None
+
+    @classmethod
+    async def serve(
+        cls,
+        transport: Transport,
+        on_con: Callable[[Tcp], Awaitable[Any]],
+        **kwargs: Any
+    ) -> Self:
+        """
+        Creates a server and binds it to the transport, see [`listen`].
+        """
+        server = cls(on_con, **kwargs)
+        await server.listen(transport)
+        return server
+
+    async def listen(self, transport: Transport):
+        """
+        Binds the server to the transport's host and port.
+        """
+        self._server = await asyncio.start_server(
+            self._accept, transport.host, transport.port
+        )
+
+    @property
+    def addr(self) -> Any:
+        if self._server is None or not self._server.sockets:
+            return None
+        return self._server.sockets[0].getsockname()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+    async def _accept(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        con = self.con_type(ConArgs(
+            core=TcpStream(reader, writer, self.max_frame_size)
+        ))
+        try:
+            await self._on_con(con)
+        except Exception as err:
+            await log.atrack(err, f"during tcp con {con} accept")
+            await con.close()
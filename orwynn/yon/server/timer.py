@@ -0,0 +1,159 @@
+"""
+Shared timers of the bus.
+
+Instead of a separate asyncio timer per awaited event or con, timers are kept
+in a wheel advanced by a single task, so adding and cancelling a timer is
+O(1).
+"""
+import asyncio
+import math
+from typing import Callable
+
+from ryz import log
+
+
+class Timer:
+    __slots__ = ("expires", "fn", "is_cancelled")
+
+    def __init__(self, fn: Callable[[], None], expires: int) -> None:
+        self.fn = fn
+        self.expires = expires
+        """
+        Tick the timer fires on.
+        """
+        self.is_cancelled = False
+
+    def cancel(self):
+        """
+        Cancels the timer.
+
+        The timer is removed from the wheel lazily, once its slot is reached.
+        """
+        self.is_cancelled = True
+
+class TimerWheel:
+    """
+    Hierarchical timer wheel.
+
+    Time is divided into ticks. The wheel has several levels of slots, where
+    each slot of a level spans all slots of the level below. A timer is
+    placed into the lowest level able to hold its expiration tick, and moves
+    down a level each time the wheel reaches its slot, until it fires from
+    the lowest level. So adding, cancelling and firing a timer is O(1),
+    regardless of the number of timers and their delays.
+
+    Timers fire with tick precision, never earlier than requested. Delays
+    beyond the range of all levels are held at the top level until they
+    come into range.
+    """
+    def __init__(
+        self,
+        tick: float = 0.1,
+        size: int = 64,
+        levels: int = 4
+    ) -> None:
+        self._tick = tick
+        self._size = size
+        self._levels: list[list[list[Timer]]] = [
+            [[] for _ in range(size)] for _ in range(levels)
+        ]
+        self._now = 0
+
+    @property
+    def tick(self) -> float:
+        return self._tick
+
+    @property
+    def now(self) -> int:
+        """
+        Number of ticks passed since the wheel start.
+
+        Cheap to read, so can be used as a coarse clock on hot paths.
+        """
+        return self._now
+
+    def to_ticks(self, delay: float) -> int:
+        return max(math.ceil(delay / self._tick), 1)
+
+    def add(self, delay: float, fn: Callable[[], None]) -> Timer:
+        """
+        Adds a timer calling fn after delay seconds.
+        """
+        return self.add_at(self._now + self.to_ticks(delay), fn)
+
+    def add_at(self, expires: int, fn: Callable[[], None]) -> Timer:
+        """
+        Adds a timer calling fn on the given tick.
+
+        Ticks already passed fire on the next tick.
+        """
+        timer = Timer(fn, max(expires, self._now + 1))
+        self._place(timer)
+        return timer
+
+    def advance(self, ticks: int = 1):
+        """
+        Moves the wheel forward, firing the timers expired on the way.
+        """
+        for _ in range(ticks):
+            self._now += 1
+            self._cascade()
+            slot_index = self._now % self._size
+            slot = self._levels[0][slot_index]
+            if not slot:
+                continue
+            self._levels[0][slot_index] = []
+            for timer in slot:
+                if not timer.is_cancelled:
+                    self._fire(timer)
+
+    async def run(self):
+        """
+        Advances the wheel in real time. Runs until cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        next_tick_time = loop.time() + self._tick
+        while True:
+            await asyncio.sleep(max(next_tick_time - loop.time(), 0))
+            # on a busy loop we may wake up late, so all missed ticks are
+            # processed at once
+            ticks = int((loop.time() - next_tick_time) / self._tick) + 1
+            self.advance(ticks)
+            next_tick_time += ticks * self._tick
+
+    def _place(self, timer: Timer):
+        delta = timer.expires - self._now
+        unit = 1
+        for level, slots in enumerate(self._levels):
+            span = unit * self._size
+            if delta < span:
+                slots[(timer.expires // unit) % self._size].append(timer)
+                return
+            if level == len(self._levels) - 1:
+                # out of range, held at the top level slot reached last,
+                # and re-placed from there
+                slots[(self._now // unit) % self._size].append(timer)
+                return
+            unit = span
+
+    def _cascade(self):
+        """
+        Moves timers of upper level slots reached at this tick down.
+        """
+        span = self._size
+        for level in range(1, len(self._levels)):
+            if self._now % span != 0:
+                return
+            index = (self._now // span) % self._size
+            slot = self._levels[level][index]
+            self._levels[level][index] = []
+            for timer in slot:
+                if not timer.is_cancelled:
+                    self._place(timer)
+            span *= self._size
+
+    def _fire(self, timer: Timer):
+        try:
+            timer.fn()
+        except Exception as err:
+            log.track(err, "during timer fire")
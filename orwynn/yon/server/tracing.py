@@ -0,0 +1,236 @@
+"""
+Tracing of msgs flowing through the bus.
+
+A trace starts once a msg is received from the net, or published outside
+of any span. Handling of the msg is covered by child spans: publication,
+subfn calls, middlewares, serialization and net send. Span ctx is carried
+by bmsgs and by the yon ctx, so msgs published by a subfn belong to the
+trace of the msg which triggered the subfn.
+
+Finished spans are passed to an exporter, see [`MemorySpanExporter`] and
+[`FileSpanExporter`], which represent them in OpenTelemetry (OTLP) json
+format.
+"""
+import json
+import random
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Iterable, NamedTuple, Protocol, runtime_checkable
+
+from orwynn.yon.server.linesink import LineSink
+
+
+class SpanKind:
+    """
+    OpenTelemetry span kinds.
+    """
+    Internal = 1
+    Server = 2
+    Client = 3
+
+class SpanCtx(NamedTuple):
+    trace_id: int
+    span_id: int
+    is_sampled: bool
+
+class Span:
+    __slots__ = (
+        "attrs",
+        "end_time",
+        "is_err",
+        "is_sampled",
+        "kind",
+        "name",
+        "parent_span_id",
+        "span_id",
+        "start_time",
+        "trace_id"
+    )
+
+    def __init__(
+        self,
+        name: str,
+        kind: int,
+        trace_id: int,
+        *,
+        parent_span_id: int | None,
+        is_sampled: bool,
+        attrs: dict[str, Any] | None
+    ) -> None:
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = random.getrandbits(64)
+        self.parent_span_id = parent_span_id
+        self.is_sampled = is_sampled
+        # unsampled spans are only carriers of the trace ctx, so they don't
+        # spend on time measurement
+        self.start_time = time.time_ns() if is_sampled else 0
+        self.end_time = 0
+        self.attrs = attrs
+        self.is_err = False
+
+    @property
+    def ctx(self) -> SpanCtx:
+        return SpanCtx(self.trace_id, self.span_id, self.is_sampled)
+
+    def set_attr(self, key: str, value: Any):
+        if not self.is_sampled:
+            return
+        if self.attrs is None:
+            self.attrs = {}
+        self.attrs[key] = value
+
+    def to_otlp(self) -> dict[str, Any]:
+        otlp: dict[str, Any] = {
+            "traceId": f"{self.trace_id:032x}",
+            "spanId": f"{self.span_id:016x}",
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_time),
+            "endTimeUnixNano": str(self.end_time),
+            "attributes": [
+                {"key": k, "value": _to_otlp_value(v)}
+                for k, v in (self.attrs or {}).items()
+            ],
+            "status": {"code": 2 if self.is_err else 0}
+        }
+        if self.parent_span_id is not None:
+            otlp["parentSpanId"] = f"{self.parent_span_id:016x}"
+        return otlp
+
+@runtime_checkable
+class SpanExporter(Protocol):
+    def export(self, span: Span): ...
+    def close(self): ...
+
+class MemorySpanExporter:
+    """
+    Keeps up to "max_spans" last finished spans in memory.
+    """
+    def __init__(self, max_spans: int = 10000) -> None:
+        self._spans: deque[Span] = deque(maxlen=max_spans)
+
+    def export(self, span: Span):
+        self._spans.append(span)
+
+    def close(self):
+        return
+
+    def get_spans(self) -> list[Span]:
+        return list(self._spans)
+
+    def clear(self):
+        self._spans.clear()
+
+    def to_otlp(self) -> dict[str, Any]:
+        return to_otlp(self._spans)
+
+class FileSpanExporter:
+    """
+    Appends finished spans to a file.
+
+    Spans are written in batches of "batch_size", each batch as a single
+    line of OTLP json, by a background thread.
+    """
+    def __init__(self, path: Path | str, batch_size: int = 100) -> None:
+        self._path = Path(path)
+        self._batch_size = batch_size
+        self._batch: list[Span] = []
+        self._sink = LineSink(self._write, thread_name="yon-tracing")
+
+    def export(self, span: Span):
+        self._batch.append(span)
+        if len(self._batch) >= self._batch_size:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        self._sink.close()
+
+    def _flush(self):
+        if not self._batch:
+            return
+        self._sink.put(json.dumps(to_otlp(self._batch)))
+        self._batch = []
+
+    def _write(self, line: str):
+        with self._path.open("a") as f:
+            f.write(line + "\n")
+
+class Tracer:
+    """
+    Creates spans and passes finished ones to the exporter.
+
+    Sampling is decided once per trace, at its root span: with
+    "sample_rate" 0.1 one of ten traces is recorded. Spans of unsampled
+    traces are still created to carry the trace ctx, but aren't timed nor
+    exported.
+    """
+    def __init__(self, exporter: SpanExporter, sample_rate: float = 1.0):
+        self._exporter = exporter
+        self._sample_rate = sample_rate
+
+    def start(
+        self,
+        name: str,
+        parent: SpanCtx | None = None,
+        kind: int = SpanKind.Internal,
+        attrs: dict[str, Any] | None = None
+    ) -> Span:
+        if parent is None:
+            return Span(
+                name,
+                kind,
+                random.getrandbits(128),
+                parent_span_id=None,
+                is_sampled=random.random() < self._sample_rate,
+                attrs=attrs
+            )
+        return Span(
+            name,
+            kind,
+            parent.trace_id,
+            parent_span_id=parent.span_id,
+            is_sampled=parent.is_sampled,
+            attrs=attrs if parent.is_sampled else None
+        )
+
+    def end(self, span: Span, *, is_err: bool = False):
+        if not span.is_sampled:
+            return
+        span.end_time = time.time_ns()
+        span.is_err = is_err
+        self._exporter.export(span)
+
+    def close(self):
+        self._exporter.close()
+
+def to_otlp(spans: Iterable[Span]) -> dict[str, Any]:
+    """
+    Packs spans into OTLP json export request.
+    """
+    return {
+        "resourceSpans": [{
+            "resource": {
+                "attributes": [{
+                    "key": "service.name",
+                    "value": {"stringValue": "orwynn"}
+                }]
+            },
+            "scopeSpans": [{
+                "scope": {"name": "orwynn.yon"},
+                "spans": [span.to_otlp() for span in spans]
+            }]
+        }]
+    }
+
+def _to_otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
@@ -8,13 +8,20 @@ For a server general guideline would be to setup external conection manager,
 and pass new established conections to ServerBus.con method, where
 conection processing further relies on ServerBus.
 """
+import asyncio
 from asyncio import Queue, Task
+from collections import deque
 from typing import Generic, Protocol, Self, TypeVar, runtime_checkable
 
 from pydantic import BaseModel
 from ryz.core import Err, Ok, Res
 from ryz.uuid import uuid4
 
+from orwynn.yon.server import wire
+from orwynn.yon.server.codec import Codec, JsonCodec
+from orwynn.yon.server.tracing import SpanCtx
+from orwynn.yon.server.wire import WireFmt
+
 TConCore = TypeVar("TConCore")
 
 # we pass consid to OnSend and OnRecv functions instead of Con to
@@ -44,6 +51,10 @@ class Con(Generic[TConCore]):
     and outcoming data to transport layer's default structure (typically
     bytes). This is dictated by the need to product yon.Msg objects, which
     can be conveniently done only through parsed dict object.
+
+    Method "send_raw" accepts already encoded data, which allows the bus to
+    encode a msg once and send the same buffer to many conections.
+    Implementations should override it to write the bytes as they are.
     """
     def __init__(self, args: ConArgs[TConCore]) -> None:
         self._sid = uuid4()
@@ -53,6 +64,13 @@ class Con(Generic[TConCore]):
 
         self._tokens: list[str] = []
 
+        self._codec: Codec = JsonCodec()
+        self._wire_fmt: str = WireFmt.Json
+        self._is_sid_int = False
+
+        self._sent_bytes = 0
+        self._recv_bytes = 0
+
     def __aiter__(self) -> Self:
         raise NotImplementedError
 
@@ -85,6 +103,47 @@ class Con(Generic[TConCore]):
         """
         self._name = name
 
+    def get_codec(self) -> Codec:
+        return self._codec
+
+    def set_codec(self, codec: Codec):
+        """
+        Sets a codec used to encode and decode data of the conection.
+
+        Called by the bus once the conection is accepted, with the codec of
+        the conection's transport.
+        """
+        self._codec = codec
+
+    def get_wire_fmt(self) -> str:
+        return self._wire_fmt
+
+    def set_wire_fmt(self, fmt: str):
+        """
+        Sets a wire format in which raw data is sent to the conection.
+        """
+        self._wire_fmt = fmt
+
+    def is_sid_int(self) -> bool:
+        return self._is_sid_int
+
+    def set_is_sid_int(self, flag: bool):
+        """
+        Sets whether integer-like sids are sent to the conection as integers.
+        """
+        self._is_sid_int = flag
+
+    def get_sent_bytes(self) -> int:
+        return self._sent_bytes
+
+    def get_recv_bytes(self) -> int:
+        """
+        Number of bytes received by the conection.
+
+        Counted by conections which receive raw data, zero otherwise.
+        """
+        return self._recv_bytes
+
     def get_name(self) -> Res[str]:
         return Ok(self._name) if self._name else Err(f"undefined {self} name")
 
@@ -97,9 +156,146 @@ class Con(Generic[TConCore]):
     async def send(self, data: dict):
         raise NotImplementedError
 
+    async def send_raw(self, data: bytes, fmt: str | None = None):
+        """
+        Sends rbmsg encoded in the given wire format.
+
+        The format is given by the bus, since rbmsgs queued before
+        [`msg::SetWireFmt`] are still in the previous one. None means the
+        conection's current format.
+
+        By default decodes the data back and passes it to "send", so
+        conections not aware of raw data keep working.
+        """
+        self._sent_bytes += len(data)
+        await self.send(wire.decode(data, self._codec))
+
+    async def send_raw_batch(
+        self, datas: list[bytes], fmt: str | None = None
+    ):
+        """
+        Sends several rbmsgs encoded in the given wire format as one batch.
+
+        By default packs them into a single batch envelope, see
+        [`wire::encode_batch`], and sends it with "send_raw". Conections
+        able to write many buffers at once may override it.
+        """
+        fmt = fmt or self._wire_fmt
+        await self.send_raw(wire.encode_batch(datas, fmt), fmt)
+
+    async def send_raw_unreliable(self, data: bytes, fmt: str | None = None):
+        """
+        Sends rbmsg which may be lost, see [`Transport.unreliable_codes`].
+
+        By default sends it with "send_raw", for transports which are
+        always reliable.
+        """
+        await self.send_raw(data, fmt)
+
+    async def ping(self):
+        """
+        Sends a transport-level heartbeat to the conection.
+
+        Does nothing by default, for transports without heartbeats.
+        """
+
     async def close(self):
         raise NotImplementedError
 
+class SlowConPolicy:
+    """
+    What to do once a conection's outbox is full.
+    """
+    DropOldest = "drop_oldest"
+    """
+    Drop the oldest queued rbmsg to free space for the new one.
+    """
+    Disconnect = "disconnect"
+    """
+    Close the conection, dropping all its queued rbmsgs.
+    """
+    Block = "block"
+    """
+    Make the publisher wait until the conection's outbox has free space.
+    """
+
+    All = (DropOldest, Disconnect, Block)
+
+class InpOverloadPolicy:
+    """
+    What to do with a received rbmsg once a conection's inp queue shard is
+    overloaded.
+    """
+    Pause = "pause"
+    """
+    Stop reading from the conection until the shard has free space.
+    """
+    Reject = "reject"
+    """
+    Drop the rbmsg if the shard is full, and reply with an overload err.
+    """
+    Shed = "shed"
+    """
+    Once the shard is above the high watermark, drop rbmsgs of codes with
+    priority lower than "Transport.inp_shed_min_priority", replying with an
+    overload err. Other rbmsgs wait for free space, as for "Pause".
+    """
+
+    All = (Pause, Reject, Shed)
+
+OutboxItem = tuple[dict, bytes, str, SpanCtx | None]
+
+class Outbox:
+    """
+    Outgoing rbmsgs queued for a conection.
+
+    Each conection has its own outbox, so a slow conection only fills its own
+    queue, while transport writers keep serving other conections.
+    """
+    def __init__(self, con: Con, max_size: int) -> None:
+        self.con = con
+        self.max_size = max_size
+        """
+        If less or equal than zero, no limitation is applied.
+        """
+        self.items: deque[OutboxItem] = deque()
+        """
+        Queued rbmsgs with their encoded data, its wire fmt and trace span
+        ctx.
+        """
+        self.is_scheduled = False
+        """
+        Whether the outbox is waiting for a writer or being written.
+
+        Scheduled outbox is never passed to the writers' queue again, so
+        rbmsgs of a conection are written by one writer at a time, in order.
+        """
+        self.is_closed = False
+        self._space_evt = asyncio.Event()
+        self._space_evt.set()
+
+    def is_full(self) -> bool:
+        return self.max_size > 0 and len(self.items) >= self.max_size
+
+    def pop_many(self, count: int) -> list[OutboxItem]:
+        popped = []
+        while self.items and len(popped) < count:
+            popped.append(self.items.popleft())
+        if not self.is_full():
+            self._space_evt.set()
+        return popped
+
+    async def wait_space(self):
+        while self.is_full() and not self.is_closed:
+            self._space_evt.clear()
+            await self._space_evt.wait()
+
+    def close(self):
+        self.is_closed = True
+        self.items.clear()
+        # release blocked publishers
+        self._space_evt.set()
+
 class Transport(BaseModel):
     is_server: bool
     con_type: type[Con]
@@ -108,14 +304,89 @@ class Transport(BaseModel):
     host: str = ""
     port: int = 0
     route: str = ""
+    path: str = ""
+    """
+    Filesystem path of a socket, for unix domain socket transports.
+    """
 
     max_inp_queue_size: int = 10000
     """
+    Max number of received rbmsgs queued for processing, per inp shard.
+
     If less or equal than zero, no limitation is applied.
     """
+    inp_shards: int = 1
+    """
+    Number of queues received rbmsgs are distributed to, by conection sid.
+
+    Each shard is processed separately, so rbmsgs of different conections
+    may be processed concurrently, while rbmsgs of the same conection are
+    always processed in order of arrival.
+    """
+    inp_overload_policy: str = InpOverloadPolicy.Pause
+    """
+    What to do once a shard is overloaded, see [`InpOverloadPolicy`].
+
+    Only applied if "max_inp_queue_size" is limited.
+    """
+    inp_high_watermark: float = 0.8
+    """
+    Fraction of "max_inp_queue_size" at which a shard is considered
+    overloaded, and [`msg::InpQueueHigh`] is published to the inner bus.
+    """
+    inp_low_watermark: float = 0.5
+    """
+    Fraction of "max_inp_queue_size" to which an overloaded shard should
+    drain to be considered normal again, after which [`msg::InpQueueLow`] is
+    published to the inner bus.
+    """
+    inp_code_priorities: dict[str, int] = {}
+    """
+    Priorities of received codes used by [`InpOverloadPolicy.Shed`].
+
+    Unlisted codes have priority 0.
+    """
+    inp_shed_min_priority: int = 1
+    """
+    Min priority of a code which rbmsgs are not shed.
+    """
+    inp_workers: int = 0
+    """
+    Max number of shards processing rbmsgs at the same time.
+
+    Zero or less, or a number not less than "inp_shards", means all shards
+    may process rbmsgs at the same time.
+    """
     max_out_queue_size: int = 10000
     """
-    If less or equal than zero, no limitation is applied.
+    Max number of rbmsgs queued for a single conection.
+
+    Once reached, "slow_con_policy" is applied. If less or equal than zero,
+    no limitation is applied.
+    """
+    slow_con_policy: str = SlowConPolicy.Block
+    """
+    What to do with a conection which out queue is full, see
+    [`SlowConPolicy`].
+    """
+    out_writers: int = 1
+    """
+    Number of conections written to concurrently.
+
+    A conection stalled on send occupies one writer until
+    "out_send_timeout", so with several writers other conections are still
+    served meanwhile.
+    """
+    out_send_timeout: float | None = 1.0
+    """
+    Time in seconds a writer waits for a send to a conection.
+
+    Once exceeded, the send goes on in the background while the writer
+    serves other conections. The conection's outbox isn't written until the
+    send is done, so its rbmsgs are queued under "slow_con_policy". With
+    [`SlowConPolicy.Disconnect`], the conection is closed instead.
+
+    None means writers wait for sends as long as they take.
     """
 
     # TODO: add "max_msgs_per_minute" to limit conection's activity
@@ -129,6 +400,17 @@ class Transport(BaseModel):
 
     None means no timeout applied.
     """
+    ping_interval: float | None = None
+    """
+    Interval of pings sent to a silent conection, see [`Con::ping`].
+
+    Pings keep intermediaries from dropping idle conections, and reveal
+    conections broken without closing. Transport-level pongs don't count as
+    activity, so clients meant to stay connected still have to send rbmsgs
+    more often than "inactivity_timeout".
+
+    None means no pings sent.
+    """
     mtu: int = 1400
     """
     Max size of a packet that can be sent by the transport.
@@ -136,9 +418,52 @@ class Transport(BaseModel):
     Note that this is total size including any headers that could be added
     by the transport.
     """
+    unreliable_codes: set[str] = set()
+    """
+    Codes which rbmsgs tolerate loss, such as frequent position updates.
+
+    Such rbmsgs are sent one by one with [`Con::send_raw_unreliable`], never
+    batched, so transports supporting it can skip delivery guarantees for
+    them.
+    """
+
+    out_batch_max_count: int = 1
+    """
+    Max number of rbmsgs ready for a conection sent as one batch.
+
+    Batches are delivered to clients as array envelopes, see [`wire`], so
+    clients must be able to unpack them. One or less disables batching.
+    """
+    out_batch_max_bytes: int = 65536
+    """
+    Max total size of encoded rbmsgs in one batch.
+
+    A single rbmsg exceeding it is still sent, but alone.
+    """
+    out_batch_flush_delay: float = 0.0
+    """
+    Time in seconds to wait for more rbmsgs before sending a batch, counted
+    from the first rbmsg queued for a conection.
+
+    Zero means only already ready rbmsgs are batched.
+    """
 
     on_send: OnSendFn | None = None
     on_recv: OnRecvFn | None = None
+    """
+    Called with each received rbmsg before it's decoded.
+
+    For conections in bin wire format, "msg" field of the rbmsg is still
+    codec-encoded bytes, see [`wire::decode`].
+    """
+
+    codec: Codec | None = None
+    """
+    Codec used to encode and decode rbmsgs of the transport's conections.
+
+    None means stdlib json codec, see [`codec::get_default_codec`]. Faster
+    codecs can be set with [`codec::get_fastest_codec`].
+    """
 
     class Config:
         arbitrary_types_allowed = True
@@ -156,10 +481,37 @@ class Transport(BaseModel):
 
 class ActiveTransport(BaseModel):
     transport: Transport
-    inp_queue: Queue[tuple[Con, dict]]
-    out_queue: Queue[tuple[Con, dict]]
-    inp_queue_processor: Task
-    out_queue_processor: Task
+    codec: Codec
+    inp_queues: list[Queue[tuple[Con, dict]]]
+    """
+    Inp shards, see [`Transport.inp_shards`].
+    """
+    out_queue: Queue[Outbox]
+    """
+    Outboxes with rbmsgs ready to be sent, waiting for a writer.
+    """
+    inp_high_shards: set[int] = set()
+    """
+    Shards which have reached the high watermark and haven't yet drained to
+    the low one.
+    """
+    inp_queue_processors: list[Task]
+    out_queue_processors: list[Task]
 
     class Config:
         arbitrary_types_allowed = True
+
+    def get_inp_shard(self, consid: str) -> int:
+        return hash(consid) % len(self.inp_queues)
+
+    def get_inp_high_size(self) -> int:
+        return int(
+            self.transport.max_inp_queue_size
+            * self.transport.inp_high_watermark
+        )
+
+    def get_inp_low_size(self) -> int:
+        return int(
+            self.transport.max_inp_queue_size
+            * self.transport.inp_low_watermark
+        )
@@ -1,25 +1,690 @@
-# from aiohttp.web import WebSocketResponse as AiohttpWebsocket
+"""
+Udp transport.
 
-# from yon.server._transport import Con, ConArgs
+Udp has no conections, so they are emulated by a [`UdpEndpoint`], which
+tracks a session per peer address. Each session is a [`Udp`] con, passed to
+the bus as any other con.
 
+Since source addresses of datagrams can be spoofed, a session is only
+opened once the peer proves it receives datagrams sent to its address, by
+echoing a cookie. Until then the endpoint keeps no state for the peer, and
+never replies with more bytes than it received:
 
-class Udp:
-    pass
-# class Udp(Con[TConMsg]):
-#     def __init__(self, args: ConArgs[AiohttpWebsocket]) -> None:
-#         super().__init__(args)
+    u8      kind, always `Kind.Hello`
+    bytes   cookie          (16 bytes, zeroed in the first hello)
+    bytes   nonce           (8 random bytes, same for all hellos of a
+                             connect)
 
-#     async def receive_json(self) -> WsMsg:
-#         return await self._core.receive()
+    u8      kind, always `Kind.Cookie`
+    bytes   cookie          (16 bytes, to be echoed in the next hello)
 
-#     async def send_bytes(self, data: bytes):
-#         return await self._core.send_bytes(data)
+    u8      kind, always `Kind.Accept`, once the session is opened
 
-#     async def send_json(self, data: dict):
-#         return await self._core.send_json(data)
+Datagrams of other kinds from peers without a session are dropped. A hello
+with a new nonce from a peer with a session means the peer has restarted,
+so the old session is replaced by a new one.
 
-#     async def send_str(self, data: str):
-#         return await self._core.send_str(data)
+Sessions are closed by either side with:
 
-#     async def close(self):
-#         return await self._core.close()
+    u8      kind, always `Kind.Close`
+    bytes   cookie          (16 bytes, the one the session was opened with)
+
+Sessions which receive nothing for `UdpEndpoint.idle_timeout` are closed
+too, so peers keep them alive by sending pings.
+
+Each rbmsg, encoded in the con's wire format, is sent as one or more
+datagrams, fragmented to fit `Transport.mtu`:
+
+    u8      kind, always `Kind.Data`
+    u8      flags, see `Flag`
+    u32     seq             (per session number of the rbmsg)
+    u16     frag index
+    u16     frag count      (1 for rbmsgs fitting one datagram)
+    bytes   frag of the encoded rbmsg
+
+Rbmsgs are reliable by default: once all frags of a rbmsg are received, the
+receiver replies with an ack, and the sender resends the frags until the
+ack arrives or retries are exhausted. Duplicates are dropped by the
+receiver. Rbmsgs of codes listed in `Transport.unreliable_codes` are sent
+once, without acks, and lost ones are not recovered.
+
+    u8      kind, always `Kind.Ack`
+    u32     seq             (of the received rbmsg)
+
+Pings are a single `Kind.Ping` byte, and are ignored by the receiver.
+
+Order of rbmsgs isn't guaranteed. All integers are big-endian.
+"""
+import asyncio
+import hashlib
+import hmac
+import secrets
+import struct
+import time
+from typing import Any, Awaitable, Callable, Self
+
+from ryz import log
+
+from orwynn.yon.server import wire
+from orwynn.yon.server.transport import Con, ConArgs, Transport
+
+Addr = Any
+"""
+Peer address as given by asyncio datagram transport.
+"""
+
+class Kind:
+    Data = 1
+    Ack = 2
+    Ping = 3
+    Hello = 4
+    Cookie = 5
+    Accept = 6
+    Close = 7
+
+class Flag:
+    Reliable = 1
+
+IP_UDP_HEADERS_SIZE = 48
+"""
+Size of ipv6 and udp headers, counted within `Transport.mtu`.
+"""
+
+_DATA_HEAD = struct.Struct("!BBIHH")
+_ACK = struct.Struct("!BI")
+_PING = struct.Struct("!B").pack(Kind.Ping)
+_ACCEPT = struct.Struct("!B").pack(Kind.Accept)
+_COOKIE_SIZE = 16
+_NONCE_SIZE = 8
+_HANDSHAKE = struct.Struct(f"!B{_COOKIE_SIZE}s")
+_HELLO = struct.Struct(f"!B{_COOKIE_SIZE}s{_NONCE_SIZE}s")
+_NO_COOKIE = bytes(_COOKIE_SIZE)
+_MAX_FRAG_COUNT = 2**16 - 1
+_MAX_SEQ = 2**32 - 1
+_DELIVERED_SEQS_SIZE = 1024
+
+class UdpPeer:
+    """
+    Core of a [`Udp`] con: the endpoint and the address of the peer.
+    """
+    __slots__ = ("addr", "cookie", "endpoint", "nonce")
+
+    def __init__(
+        self,
+        endpoint: "UdpEndpoint",
+        addr: Addr,
+        cookie: bytes = _NO_COOKIE,
+        nonce: bytes = b""
+    ) -> None:
+        self.endpoint = endpoint
+        self.addr = addr
+        self.cookie = cookie
+        """
+        Cookie the session was opened with, proving close requests.
+        """
+        self.nonce = nonce
+        """
+        Nonce of the hellos the session was opened by.
+        """
+
+    def sendto(self, data: bytes):
+        self.endpoint.sendto(data, self.addr)
+
+class _Outgoing:
+    __slots__ = ("frags", "handle", "retries")
+
+    def __init__(self, frags: list[bytes]) -> None:
+        self.frags = frags
+        self.retries = 0
+        self.handle: asyncio.TimerHandle | None = None
+
+class _Partial:
+    __slots__ = ("parts", "received", "size", "started")
+
+    def __init__(self, count: int) -> None:
+        self.parts: list[bytes | None] = [None] * count
+        self.received = 0
+        self.size = 0
+        self.started = time.monotonic()
+
+class Udp(Con[UdpPeer]):
+    """
+    Session with a udp peer.
+    """
+    def __init__(self, args: ConArgs[UdpPeer]) -> None:
+        super().__init__(args)
+        self._endpoint = args.core.endpoint
+        self._inp: asyncio.Queue[bytes | None] = asyncio.Queue()
+        self._next_seq = 1
+        self._seq_to_outgoing: dict[int, _Outgoing] = {}
+        self._window_evt = asyncio.Event()
+        self._window_evt.set()
+        self._seq_to_partial: dict[int, _Partial] = {}
+        # dict is used as an ordered set to forget the oldest seqs first
+        self._delivered_seqs: dict[int, None] = {}
+        self._last_recv_time = time.monotonic()
+
+    def __aiter__(self) -> Self:
+        return self
+
+    async def __anext__(self) -> dict:
+        data = await self._inp.get()
+        if data is None:
+            raise StopAsyncIteration
+        # bin msg bodies are decoded by the bus straight to their types
+        return wire.decode(data, self._codec, is_msg_raw=True)
+
+    @property
+    def addr(self) -> Addr:
+        return self._core.addr
+
+    @property
+    def cookie(self) -> bytes:
+        return self._core.cookie
+
+    @property
+    def nonce(self) -> bytes:
+        return self._core.nonce
+
+    async def recv(self) -> dict:
+        data = await self._inp.get()
+        if data is None:
+            raise ConnectionResetError(f"{self} is closed")
+        return wire.decode(data, self._codec, is_msg_raw=True)
+
+    async def send(self, data: dict):
+        return await self.send_raw(wire.encode(
+            data,
+            self._codec,
+            self._wire_fmt,
+            is_sid_int=self._is_sid_int
+        ))
+
+    async def send_raw(self, data: bytes, fmt: str | None = None):
+        self._sent_bytes += len(data)
+        await self._send_msg(data, is_reliable=True)
+
+    async def send_raw_unreliable(self, data: bytes, fmt: str | None = None):
+        self._sent_bytes += len(data)
+        await self._send_msg(data, is_reliable=False)
+
+    async def ping(self):
+        self._core.sendto(_PING)
+
+    @property
+    def last_recv_time(self) -> float:
+        """
+        Monotonic time of the last datagram received from the peer.
+        """
+        return self._last_recv_time
+
+    async def close(self):
+        self.close_nowait()
+
+    def close_nowait(self, *, is_peer_notified: bool = True):
+        """
+        Drops the session, ending iteration over the con.
+
+        The peer is told to drop the session too, unless
+        "is_peer_notified" is false, e.g. if the peer has closed it itself.
+        """
+        if self._is_closed:
+            return
+        self._is_closed = True
+        if is_peer_notified:
+            self._core.sendto(_HANDSHAKE.pack(Kind.Close, self._core.cookie))
+        for outgoing in self._seq_to_outgoing.values():
+            if outgoing.handle is not None:
+                outgoing.handle.cancel()
+        self._seq_to_outgoing.clear()
+        self._seq_to_partial.clear()
+        # release senders waiting for the window
+        self._window_evt.set()
+        self._inp.put_nowait(None)
+        self._endpoint.forget(self)
+
+    def feed_datagram(self, data: bytes):
+        """
+        Processes a datagram received from the peer.
+        """
+        if self._is_closed or not data:
+            return
+        self._recv_bytes += len(data)
+        self._last_recv_time = time.monotonic()
+        kind = data[0]
+        if kind == Kind.Data:
+            self._on_data(data)
+        elif kind == Kind.Ack and len(data) >= _ACK.size:
+            _, seq = _ACK.unpack_from(data)
+            self._on_ack(seq)
+
+    async def _send_msg(self, data: bytes, is_reliable: bool):
+        if is_reliable:
+            while (
+                len(self._seq_to_outgoing) >= self._endpoint.window
+                and not self._is_closed
+            ):
+                self._window_evt.clear()
+                await self._window_evt.wait()
+        if self._is_closed:
+            raise ConnectionResetError(f"{self} is closed")
+
+        seq = self._next_seq
+        self._next_seq = seq % _MAX_SEQ + 1
+        frags = self._fragment(seq, data, is_reliable)
+        for frag in frags:
+            self._core.sendto(frag)
+        if is_reliable:
+            outgoing = _Outgoing(frags)
+            self._seq_to_outgoing[seq] = outgoing
+            self._schedule_resend(seq, outgoing)
+
+    def _fragment(
+        self, seq: int, data: bytes, is_reliable: bool
+    ) -> list[bytes]:
+        size = self._endpoint.max_frag_size
+        count = max(1, -(-len(data) // size))
+        if count > _MAX_FRAG_COUNT:
+            raise ValueError(
+                f"rbmsg of {len(data)} bytes cannot be fragmented to"
+                f" {size} bytes"
+            )
+        flags = Flag.Reliable if is_reliable else 0
+        return [
+            _DATA_HEAD.pack(Kind.Data, flags, seq, i, count)
+            + data[i * size:(i + 1) * size]
+            for i in range(count)
+        ]
+
+    def _schedule_resend(self, seq: int, outgoing: _Outgoing):
+        # resend timeout is doubled on each retry to not flood a congested
+        # network
+        outgoing.handle = asyncio.get_running_loop().call_later(
+            self._endpoint.rto * 2**outgoing.retries, self._resend, seq
+        )
+
+    def _resend(self, seq: int):
+        outgoing = self._seq_to_outgoing.get(seq, None)
+        if outgoing is None:
+            return
+        if outgoing.retries >= self._endpoint.max_retries:
+            log.warn(f"rbmsg {seq} to {self} is not acked => drop")
+            del self._seq_to_outgoing[seq]
+            self._window_evt.set()
+            return
+        outgoing.retries += 1
+        for frag in outgoing.frags:
+            self._core.sendto(frag)
+        self._schedule_resend(seq, outgoing)
+
+    def _on_ack(self, seq: int):
+        outgoing = self._seq_to_outgoing.pop(seq, None)
+        if outgoing is None:
+            return
+        if outgoing.handle is not None:
+            outgoing.handle.cancel()
+        self._window_evt.set()
+
+    def _on_data(self, data: bytes):
+        if len(data) < _DATA_HEAD.size:
+            return
+        _, flags, seq, index, count = _DATA_HEAD.unpack_from(data)
+        is_reliable = bool(flags & Flag.Reliable)
+        if is_reliable and seq in self._delivered_seqs:
+            # the ack was probably lost, so the peer resends
+            self._core.sendto(_ACK.pack(Kind.Ack, seq))
+            return
+
+        frag = data[_DATA_HEAD.size:]
+        msg = frag if count <= 1 else self._reassemble(
+            seq, index, count, frag
+        )
+        if msg is None:
+            return
+        if self._inp.qsize() >= self._endpoint.max_inp_queue_size:
+            # not acked, so reliable rbmsgs are resent later
+            log.warn(f"inp queue of {self} is full => drop rbmsg {seq}")
+            return
+        if is_reliable:
+            self._core.sendto(_ACK.pack(Kind.Ack, seq))
+            self._delivered_seqs[seq] = None
+            if len(self._delivered_seqs) > _DELIVERED_SEQS_SIZE:
+                del self._delivered_seqs[next(iter(self._delivered_seqs))]
+        self._inp.put_nowait(msg)
+
+    def _reassemble(
+        self, seq: int, index: int, count: int, frag: bytes
+    ) -> bytes | None:
+        # checked before allocating parts, so forged counts cost nothing
+        if index >= count or count > self._endpoint.max_frag_count:
+            return None
+        self._drop_expired_partials()
+        partial = self._seq_to_partial.get(seq, None)
+        if partial is None:
+            if len(self._seq_to_partial) >= self._endpoint.max_partials:
+                del self._seq_to_partial[next(iter(self._seq_to_partial))]
+            partial = _Partial(count)
+            self._seq_to_partial[seq] = partial
+        elif len(partial.parts) != count:
+            return None
+        if partial.parts[index] is not None:
+            return None
+
+        partial.size += len(frag)
+        if partial.size > self._endpoint.max_msg_size:
+            log.warn(f"rbmsg {seq} from {self} is too large => drop")
+            del self._seq_to_partial[seq]
+            return None
+        partial.parts[index] = frag
+        partial.received += 1
+        if partial.received < count:
+            return None
+        del self._seq_to_partial[seq]
+        return b"".join(partial.parts)  # type: ignore[arg-type]
+
+    def _drop_expired_partials(self):
+        # partials are ordered by start time, so only the oldest are checked
+        now = time.monotonic()
+        while self._seq_to_partial:
+            seq = next(iter(self._seq_to_partial))
+            partial = self._seq_to_partial[seq]
+            if now - partial.started < self._endpoint.reassembly_timeout:
+                return
+            del self._seq_to_partial[seq]
+
+class _Handshake:
+    __slots__ = ("cookie", "future", "nonce")
+
+    def __init__(self, future: asyncio.Future[Udp]) -> None:
+        self.cookie = _NO_COOKIE
+        self.future = future
+        self.nonce = secrets.token_bytes(_NONCE_SIZE)
+
+class UdpEndpoint(asyncio.DatagramProtocol):
+    """
+    Udp socket with a [`Udp`] session per peer address.
+
+    Sessions are opened for peers completing the hello handshake, and passed
+    to "on_con", which typically runs `Bus.con` for them. The session is
+    served until "on_con" returns, same as for [`tcp::TcpServer`].
+    Endpoints without "on_con" don't accept sessions. Sessions to remote
+    endpoints are opened with [`UdpEndpoint.connect`].
+
+    Sessions are dropped once closed by either side, or once idle for
+    "idle_timeout".
+    """
+    def __init__(
+        self,
+        on_con: Callable[[Udp], Awaitable[Any]] | None = None,
+        *,
+        mtu: int = 1400,
+        max_sessions: int = 10000,
+        window: int = 256,
+        rto: float = 0.2,
+        max_retries: int = 5,
+        max_partials: int = 64,
+        reassembly_timeout: float = 5.0,
+        max_msg_size: int = 1024 * 1024,
+        max_inp_queue_size: int = 10000,
+        cookie_ttl: float = 10.0,
+        idle_timeout: float | None = 60.0
+    ) -> None:
+        self.max_frag_size = mtu - IP_UDP_HEADERS_SIZE - _DATA_HEAD.size
+        if self.max_frag_size <= 0:
+            raise ValueError(f"mtu {mtu} is too small")
+        self.max_sessions = max_sessions
+        self.window = window
+        """
+        Max number of reliable rbmsgs awaiting acks, per session. Once
+        reached, senders wait.
+        """
+        self.rto = rto
+        """
+        Time in seconds before the first resend of a not acked rbmsg or
+        hello.
+        """
+        self.max_retries = max_retries
+        self.max_partials = max_partials
+        """
+        Max number of rbmsgs being reassembled, per session.
+        """
+        self.reassembly_timeout = reassembly_timeout
+        self.max_msg_size = max_msg_size
+        self.max_frag_count = min(
+            _MAX_FRAG_COUNT, -(-max_msg_size // self.max_frag_size)
+        )
+        """
+        Max number of frags of a received rbmsg, derived from
+        "max_msg_size".
+        """
+        self.max_inp_queue_size = max_inp_queue_size
+        self.cookie_ttl = cookie_ttl
+        """
+        Time in seconds for which an issued cookie is accepted at least. At
+        most it's accepted for twice this time.
+        """
+        self.idle_timeout = idle_timeout
+        """
+        Time in seconds after which a session not receiving anything is
+        closed. None disables closing of idle sessions.
+
+        Sessions are checked each half of this time, so an idle session
+        lives for one and a half of it at most.
+        """
+
+        self._on_con = on_con
+        self._transport: asyncio.DatagramTransport | None = None
+        self._addr_to_con: dict[Addr, Udp] = {}
+        self._addr_to_handshake: dict[Addr, _Handshake] = {}
+        self._con_tasks: set[asyncio.Task] = set()
+        self._reap_handle: asyncio.TimerHandle | None = None
+        self._secret = secrets.token_bytes(32)
+
+    @classmethod
+    async def serve(
+        cls,
+        transport: Transport,
+        on_con: Callable[[Udp], Awaitable[Any]] | None = None,
+        **kwargs: Any
+    ) -> Self:
+        """
+        Binds an endpoint to the transport's host and port.
+        """
+        endpoint = cls(on_con, mtu=transport.mtu, **kwargs)
+        await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: endpoint,
+            local_addr=(transport.host, transport.port)
+        )
+        return endpoint
+
+    @property
+    def addr(self) -> Addr:
+        if self._transport is None:
+            return None
+        return self._transport.get_extra_info("sockname")
+
+    def get_sessions_count(self) -> int:
+        return len(self._addr_to_con)
+
+    async def connect(self, addr: Addr, timeout: float = 5.0) -> Udp:
+        """
+        Opens a session with a remote endpoint, or gets the opened one.
+
+        Hellos are resent each "rto" until the remote endpoint accepts the
+        session. Raises TimeoutError if it doesn't within the timeout.
+        """
+        con = self._addr_to_con.get(addr, None)
+        if con is not None:
+            return con
+        handshake = self._addr_to_handshake.get(addr, None)
+        if handshake is None:
+            handshake = _Handshake(
+                asyncio.get_running_loop().create_future()
+            )
+            self._addr_to_handshake[addr] = handshake
+        try:
+            async with asyncio.timeout(timeout):
+                while not handshake.future.done():
+                    self._send_hello(handshake, addr)
+                    await asyncio.wait({handshake.future}, timeout=self.rto)
+            return handshake.future.result()
+        finally:
+            if self._addr_to_handshake.get(addr, None) is handshake:
+                del self._addr_to_handshake[addr]
+
+    def forget(self, con: Udp):
+        if self._addr_to_con.get(con.addr, None) is con:
+            del self._addr_to_con[con.addr]
+
+    def sendto(self, data: bytes, addr: Addr):
+        if self._transport is None or self._transport.is_closing():
+            return
+        self._transport.sendto(data, addr)
+
+    def close(self):
+        for con in list(self._addr_to_con.values()):
+            con.close_nowait()
+        if self._transport is not None:
+            self._transport.close()
+
+    def connection_made(self, transport: asyncio.BaseTransport):
+        # selector datagram transports don't subclass DatagramTransport
+        self._transport = transport  # type: ignore[assignment]
+        self._schedule_reap()
+
+    def connection_lost(self, exc: Exception | None):
+        if self._reap_handle is not None:
+            self._reap_handle.cancel()
+        for con in list(self._addr_to_con.values()):
+            con.close_nowait(is_peer_notified=False)
+        for handshake in self._addr_to_handshake.values():
+            if not handshake.future.done():
+                handshake.future.set_exception(
+                    ConnectionResetError("udp endpoint is closed")
+                )
+
+    def datagram_received(self, data: bytes, addr: Addr):
+        if not data:
+            return
+        kind = data[0]
+        if kind == Kind.Hello:
+            self._on_hello(data, addr)
+        elif kind == Kind.Cookie:
+            self._on_cookie(data, addr)
+        elif kind == Kind.Accept:
+            self._on_accept(addr)
+        elif kind == Kind.Close:
+            self._on_close(data, addr)
+        else:
+            con = self._addr_to_con.get(addr, None)
+            if con is not None:
+                con.feed_datagram(data)
+
+    def error_received(self, exc: Exception):
+        log.track(exc, "during udp endpoint receive")
+
+    def _open(self, addr: Addr, cookie: bytes, nonce: bytes) -> Udp:
+        con = Udp(ConArgs(core=UdpPeer(self, addr, cookie, nonce)))
+        self._addr_to_con[addr] = con
+        return con
+
+    def _send_hello(self, handshake: _Handshake, addr: Addr):
+        self.sendto(
+            _HELLO.pack(Kind.Hello, handshake.cookie, handshake.nonce), addr
+        )
+
+    def _on_hello(self, data: bytes, addr: Addr):
+        if self._on_con is None or len(data) < _HELLO.size:
+            return
+        _, cookie, nonce = _HELLO.unpack_from(data)
+        if not self._is_cookie_valid(cookie, addr):
+            # the cookie reply is smaller than the hello, so spoofed hellos
+            # are not amplified, and no state is kept for them
+            self.sendto(
+                _HANDSHAKE.pack(
+                    Kind.Cookie, self._make_cookie(addr, self._get_epoch())
+                ),
+                addr
+            )
+            return
+        con = self._addr_to_con.get(addr, None)
+        if con is not None:
+            if con.nonce == nonce:
+                # the previous accept was lost
+                self.sendto(_ACCEPT, addr)
+                return
+            # the peer has restarted, so its seqs start over
+            con.close_nowait(is_peer_notified=False)
+        if len(self._addr_to_con) >= self.max_sessions:
+            return
+        con = self._open(addr, cookie, nonce)
+        self.sendto(_ACCEPT, addr)
+        task = asyncio.get_running_loop().create_task(self._serve(con))
+        self._con_tasks.add(task)
+        task.add_done_callback(self._con_tasks.discard)
+
+    async def _serve(self, con: Udp):
+        assert self._on_con is not None
+        try:
+            await self._on_con(con)
+        except Exception as err:
+            await log.atrack(err, f"during udp con {con} accept")
+            con.close_nowait()
+
+    def _on_cookie(self, data: bytes, addr: Addr):
+        handshake = self._addr_to_handshake.get(addr, None)
+        if handshake is None or len(data) < _HANDSHAKE.size:
+            return
+        _, handshake.cookie = _HANDSHAKE.unpack_from(data)
+        self._send_hello(handshake, addr)
+
+    def _on_accept(self, addr: Addr):
+        handshake = self._addr_to_handshake.get(addr, None)
+        if handshake is None or handshake.future.done():
+            return
+        prev_con = self._addr_to_con.get(addr, None)
+        if prev_con is not None:
+            prev_con.close_nowait(is_peer_notified=False)
+        handshake.future.set_result(
+            self._open(addr, handshake.cookie, handshake.nonce)
+        )
+
+    def _on_close(self, data: bytes, addr: Addr):
+        con = self._addr_to_con.get(addr, None)
+        if con is None or len(data) < _HANDSHAKE.size:
+            return
+        _, cookie = _HANDSHAKE.unpack_from(data)
+        # the cookie proves the close comes from the peer, not a spoofer
+        if hmac.compare_digest(cookie, con.cookie):
+            con.close_nowait(is_peer_notified=False)
+
+    def _schedule_reap(self):
+        if self.idle_timeout is None:
+            return
+        self._reap_handle = asyncio.get_running_loop().call_later(
+            self.idle_timeout / 2, self._reap_idle
+        )
+
+    def _reap_idle(self):
+        assert self.idle_timeout is not None
+        now = time.monotonic()
+        for con in list(self._addr_to_con.values()):
+            if now - con.last_recv_time >= self.idle_timeout:
+                log.info(f"udp con {con} is idle => close")
+                con.close_nowait()
+        self._schedule_reap()
+
+    def _get_epoch(self) -> int:
+        return int(time.monotonic() // self.cookie_ttl)
+
+    def _make_cookie(self, addr: Addr, epoch: int) -> bytes:
+        return hmac.digest(
+            self._secret, f"{addr}|{epoch}".encode(), hashlib.sha256
+        )[:_COOKIE_SIZE]
+
+    def _is_cookie_valid(self, cookie: bytes, addr: Addr) -> bool:
+        epoch = self._get_epoch()
+        return any(
+            hmac.compare_digest(cookie, self._make_cookie(addr, e))
+            for e in (epoch, epoch - 1)
+        )
@@ -0,0 +1,86 @@
+"""
+Unix domain socket transport.
+
+Meant for sidecars co-located on the same host, which otherwise would
+connect through tcp on localhost. Rbmsgs are framed same as for [`tcp`].
+The socket is bound to `Transport.path`.
+"""
+import asyncio
+import contextlib
+import errno
+import stat
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Self
+
+from orwynn.yon.server.tcp import Tcp, TcpServer, TcpStream
+from orwynn.yon.server.transport import ConArgs, Transport
+
+
+class Uds(Tcp):
+    @classmethod
+    async def connect_unix(cls, path: str, **kwargs: Any) -> Self:
+        """
+        Opens a conection to a unix domain socket server.
+        """
+        reader, writer = await asyncio.open_unix_connection(path)
+        return cls(ConArgs(core=TcpStream(reader, writer, **kwargs)))
+
+class UdsServer(TcpServer):
+    """
+    Unix domain socket server passing each accepted [`Uds`] con to
+    "on_con", same as [`TcpServer`].
+    """
+    con_type = Uds
+
+    def __init__(
+        self,
+        on_con: Callable[[Tcp], Awaitable[Any]],
+        max_frame_size: int = 1024 * 1024
+    ) -> None:
+        super().__init__(on_con, max_frame_size)
+        self._path: str | None = None
+
+    async def listen(self, transport: Transport):
+        """
+        Binds the server to the transport's path.
+
+        A socket file left at the path by a previous run is replaced. If a
+        server still listens on it, OSError is raised.
+        """
+        if not transport.path:
+            raise ValueError(f"transport {transport} has no path")
+        await _unlink_stale_socket(Path(transport.path))
+        self._server = await asyncio.start_unix_server(
+            self._accept, transport.path
+        )
+        self._path = transport.path
+
+    @property
+    def addr(self) -> Any:
+        return self._path
+
+    def close(self):
+        super().close()
+        if self._path is not None:
+            Path(self._path).unlink(missing_ok=True)
+            self._path = None
+
+async def _unlink_stale_socket(path: Path):
+    try:
+        # only sockets are removed, to not delete a file given by mistake
+        if not stat.S_ISSOCK(path.stat().st_mode):
+            return
+    except FileNotFoundError:
+        return
+    try:
+        _, writer = await asyncio.open_unix_connection(path)
+    except ConnectionRefusedError:
+        # nobody listens on the socket, so it's left by a dead server
+        path.unlink(missing_ok=True)
+        return
+    writer.close()
+    with contextlib.suppress(ConnectionError):
+        await writer.wait_closed()
+    # asyncio would replace any socket file on bind, so a live one is
+    # guarded here
+    raise OSError(errno.EADDRINUSE, f"socket {path} is in use")
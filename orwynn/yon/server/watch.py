@@ -0,0 +1,126 @@
+"""
+Watching of con activity, for inactivity timeouts and heartbeats.
+"""
+from typing import Callable
+
+from orwynn.yon.server.timer import Timer, TimerWheel
+from orwynn.yon.server.transport import Con
+
+
+class _Watch:
+    __slots__ = (
+        "con",
+        "last_activity",
+        "last_ping",
+        "ping_interval",
+        "timeout",
+        "timer"
+    )
+
+    def __init__(
+        self,
+        con: Con,
+        timeout: int | None,
+        ping_interval: int | None,
+        now: int
+    ) -> None:
+        self.con = con
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.last_activity = now
+        self.last_ping = now
+        self.timer: Timer | None = None
+
+class ConWatcher:
+    """
+    Tracks last activity of cons, notifying about idle ones.
+
+    Activity is recorded as the current tick of the wheel, so touching a con
+    on each received rbmsg is a single assignment. Each con has at most one
+    timer, set to its nearest deadline. Once fired, the timer checks the
+    recorded activity, and is set again if the con was active meanwhile.
+    """
+    def __init__(
+        self,
+        wheel: TimerWheel,
+        on_idle: Callable[[Con], None],
+        on_ping: Callable[[Con], None]
+    ) -> None:
+        self._wheel = wheel
+        self._on_idle = on_idle
+        self._on_ping = on_ping
+        self._consid_to_watch: dict[str, _Watch] = {}
+
+    def __len__(self) -> int:
+        return len(self._consid_to_watch)
+
+    def watch(
+        self,
+        con: Con,
+        timeout: float | None,
+        ping_interval: float | None
+    ):
+        """
+        Starts watching the con.
+
+        Once nothing is received from the con for "timeout" seconds, it's
+        passed to "on_idle" and unwatched. Each "ping_interval" seconds of
+        the con silence, it's passed to "on_ping". None disables the
+        corresponding check.
+        """
+        if timeout is None and ping_interval is None:
+            return
+        self.unwatch(con.sid)
+        watch = _Watch(
+            con,
+            None if timeout is None else self._wheel.to_ticks(timeout),
+            None if ping_interval is None
+                else self._wheel.to_ticks(ping_interval),
+            self._wheel.now
+        )
+        self._consid_to_watch[con.sid] = watch
+        self._schedule(watch)
+
+    def unwatch(self, consid: str):
+        watch = self._consid_to_watch.pop(consid, None)
+        if watch is not None and watch.timer is not None:
+            watch.timer.cancel()
+
+    def touch(self, consid: str):
+        """
+        Records activity of the con.
+        """
+        watch = self._consid_to_watch.get(consid, None)
+        if watch is not None:
+            watch.last_activity = self._wheel.now
+
+    def _schedule(self, watch: _Watch):
+        deadlines: list[int] = []
+        if watch.timeout is not None:
+            deadlines.append(watch.last_activity + watch.timeout)
+        if watch.ping_interval is not None:
+            deadlines.append(
+                max(watch.last_activity, watch.last_ping)
+                + watch.ping_interval
+            )
+        watch.timer = self._wheel.add_at(
+            min(deadlines), lambda: self._check(watch)
+        )
+
+    def _check(self, watch: _Watch):
+        now = self._wheel.now
+        if (
+            watch.timeout is not None
+            and now - watch.last_activity >= watch.timeout
+        ):
+            del self._consid_to_watch[watch.con.sid]
+            self._on_idle(watch.con)
+            return
+        if (
+            watch.ping_interval is not None
+            and now - max(watch.last_activity, watch.last_ping)
+                >= watch.ping_interval
+        ):
+            watch.last_ping = now
+            self._on_ping(watch.con)
+        self._schedule(watch)
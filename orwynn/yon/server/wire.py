@@ -0,0 +1,216 @@
+"""
+Wire formats of rbmsgs.
+
+Json format is the default one, where each rbmsg is encoded by the codec as
+a whole.
+
+Bin format is negotiated by a client after the welcome, by sending
+[`msg::SetWireFmt`]. In this format rbmsg fields are written positionally,
+and only the msg body is encoded by the codec:
+
+    u8      kind, always `Kind.Msg` for a single rbmsg
+    u32     codeid
+    u8      flags, see `Flag`
+    u8      sid len         (sids and lsids are limited to 255 bytes,
+                             see `sid::MAX_SID_SIZE`)
+    bytes   sid
+        or
+    u64     sid             (if `Flag.IntSid`)
+    u8      lsid len        (only if `Flag.Lsid`)
+    bytes   lsid            (only if `Flag.Lsid`)
+        or
+    u64     lsid            (only if `Flag.Lsid` and `Flag.IntLsid`)
+    u32     msg len         (only if `Flag.Msg`)
+    bytes   msg             (only if `Flag.Msg`)
+
+Several rbmsgs can be sent as one batch. For json format the batch is an
+array of rbmsgs. For bin format it is:
+
+    u8      kind, always `Kind.Batch`
+    u32     rbmsgs count
+    u32     rbmsg len       (for each rbmsg)
+    bytes   bin rbmsg       (for each rbmsg)
+
+All integers are big-endian.
+
+For cons which negotiated int sids, sids and lsids which are decimal
+integers are written as integers in both formats, see [`sid::to_int_sid`].
+Receivers convert int sids back to strings.
+"""
+import struct
+
+from orwynn.yon.server.codec import Codec
+from orwynn.yon.server.sid import MAX_SID_SIZE, to_int_sid
+
+
+class WireFmt:
+    Json = "json"
+    Bin = "bin"
+
+    All = (Json, Bin)
+
+class Kind:
+    Msg = 1
+    Batch = 2
+
+class Flag:
+    IsErr = 1
+    Lsid = 1 << 1
+    Msg = 1 << 2
+    IntSid = 1 << 3
+    IntLsid = 1 << 4
+
+_HEAD = struct.Struct("!BIB")
+_U8 = struct.Struct("!B")
+_U32 = struct.Struct("!I")
+_U64 = struct.Struct("!Q")
+_KIND_COUNT = struct.Struct("!BI")
+_MSG_KIND = _U8.pack(Kind.Msg)
+_BATCH_KIND = _U8.pack(Kind.Batch)
+
+def encode(
+    rbmsg: dict, codec: Codec, fmt: str, *, is_sid_int: bool = False
+) -> bytes:
+    if fmt == WireFmt.Bin:
+        return encode_bin(rbmsg, codec, is_sid_int=is_sid_int)
+    if is_sid_int:
+        rbmsg = _to_int_sids(rbmsg)
+    return codec.encode(rbmsg)
+
+def encode_batch(raws: list[bytes], fmt: str) -> bytes:
+    """
+    Packs already encoded rbmsgs of the same format into a batch.
+    """
+    if fmt == WireFmt.Bin:
+        parts = [_KIND_COUNT.pack(Kind.Batch, len(raws))]
+        for raw in raws:
+            parts.extend((_U32.pack(len(raw)), raw))
+        return b"".join(parts)
+    return b"[" + b",".join(raws) + b"]"
+
+def decode(
+    data: bytes | str, codec: Codec, *, is_msg_raw: bool = False
+) -> dict | list[dict]:
+    """
+    Decodes data of any format, either a single rbmsg or a batch.
+
+    Bin data is always bytes starting with a kind byte, while json data
+    starts with an object or an array, so the formats are distinguished by
+    the first byte.
+
+    If `is_msg_raw`, msg bodies of bin rbmsgs are left as codec-encoded
+    bytes, to be decoded straight to the msg type by the receiver.
+    """
+    if isinstance(data, bytes):
+        kind = data[:1]
+        if kind == _MSG_KIND:
+            return decode_bin(data, codec, is_msg_raw=is_msg_raw)
+        if kind == _BATCH_KIND:
+            return decode_bin_batch(data, codec, is_msg_raw=is_msg_raw)
+    return codec.decode(data)
+
+def encode_bin(
+    rbmsg: dict, codec: Codec, *, is_sid_int: bool = False
+) -> bytes:
+    sid = rbmsg["sid"]
+    lsid = rbmsg.get("lsid", None)
+    msg = rbmsg.get("msg", None)
+    int_sid = to_int_sid(sid) if is_sid_int else None
+    int_lsid = to_int_sid(lsid) if is_sid_int and lsid is not None else None
+
+    flags = 0
+    if rbmsg.get("is_err", None):
+        flags |= Flag.IsErr
+    if lsid is not None:
+        flags |= Flag.Lsid
+    if msg is not None:
+        flags |= Flag.Msg
+    if int_sid is not None:
+        flags |= Flag.IntSid
+    if int_lsid is not None:
+        flags |= Flag.IntLsid
+
+    parts = [_HEAD.pack(Kind.Msg, rbmsg["codeid"], flags)]
+    _write_sid(parts, sid, int_sid)
+    if lsid is not None:
+        _write_sid(parts, lsid, int_lsid)
+    if msg is not None:
+        msg = codec.encode(msg)
+        parts.extend((_U32.pack(len(msg)), msg))
+    return b"".join(parts)
+
+def decode_bin(
+    data: bytes, codec: Codec, *, is_msg_raw: bool = False
+) -> dict:
+    kind, codeid, flags = _HEAD.unpack_from(data)
+    if kind != Kind.Msg:
+        raise ValueError(f"unrecognized bin rbmsg kind {kind}")
+    offset = _HEAD.size
+    sid, offset = _read_sid(
+        data, offset, bool(flags & Flag.IntSid)
+    )
+    rbmsg: dict = {"sid": sid, "codeid": codeid}
+    if flags & Flag.IsErr:
+        rbmsg["is_err"] = True
+    if flags & Flag.Lsid:
+        rbmsg["lsid"], offset = _read_sid(
+            data, offset, bool(flags & Flag.IntLsid)
+        )
+    if flags & Flag.Msg:
+        (size,) = _U32.unpack_from(data, offset)
+        offset += _U32.size
+        msg = data[offset:offset + size]
+        rbmsg["msg"] = msg if is_msg_raw else codec.decode(msg)
+    return rbmsg
+
+def decode_bin_batch(
+    data: bytes, codec: Codec, *, is_msg_raw: bool = False
+) -> list[dict]:
+    kind, count = _KIND_COUNT.unpack_from(data)
+    if kind != Kind.Batch:
+        raise ValueError(f"unrecognized bin batch kind {kind}")
+    offset = _KIND_COUNT.size
+    rbmsgs: list[dict] = []
+    for _ in range(count):
+        (size,) = _U32.unpack_from(data, offset)
+        offset += _U32.size
+        rbmsgs.append(decode_bin(
+            data[offset:offset + size], codec, is_msg_raw=is_msg_raw
+        ))
+        offset += size
+    return rbmsgs
+
+def _to_int_sids(rbmsg: dict) -> dict:
+    int_sid = to_int_sid(rbmsg["sid"])
+    lsid = rbmsg.get("lsid", None)
+    int_lsid = to_int_sid(lsid) if lsid is not None else None
+    if int_sid is None and int_lsid is None:
+        return rbmsg
+    # the rbmsg may be shared by encodings for other cons, so it's copied
+    rbmsg = rbmsg.copy()
+    if int_sid is not None:
+        rbmsg["sid"] = int_sid
+    if int_lsid is not None:
+        rbmsg["lsid"] = int_lsid
+    return rbmsg
+
+def _write_sid(parts: list[bytes], sid: str, int_sid: int | None):
+    if int_sid is not None:
+        parts.append(_U64.pack(int_sid))
+        return
+    raw = sid.encode()
+    if len(raw) > MAX_SID_SIZE:
+        raise ValueError(f"sid {sid} is longer than {MAX_SID_SIZE} bytes")
+    parts.extend((_U8.pack(len(raw)), raw))
+
+def _read_sid(data: bytes, offset: int, is_int: bool) -> tuple[str, int]:
+    if is_int:
+        (value,) = _U64.unpack_from(data, offset)
+        return str(value), offset + _U64.size
+    raw, offset = _read_short(data, offset)
+    return raw.decode(), offset
+
+def _read_short(data: bytes, offset: int) -> tuple[bytes, int]:
+    (size,) = _U8.unpack_from(data, offset)
+    offset += _U8.size
+    return data[offset:offset + size], offset + size
@@ -3,12 +3,17 @@ from typing import Self
 from aiohttp import WSMsgType
 from aiohttp.web import WebSocketResponse as AiohttpWebsocket
 
+from orwynn.yon.server import wire
 from orwynn.yon.server.transport import Con, ConArgs
+from orwynn.yon.server.wire import WireFmt
 
 
 class Ws(Con[AiohttpWebsocket]):
     def __init__(self, args: ConArgs[AiohttpWebsocket]) -> None:
         super().__init__(args)
+        # frame-level send is available since aiohttp 3.11, and lets json
+        # buffers go as text frames without decoding them to str
+        self._send_frame = getattr(args.core, "send_frame", None)
 
     def __aiter__(self) -> Self:
         return self
@@ -18,13 +23,36 @@ class Ws(Con[AiohttpWebsocket]):
         if conmsg.type in (
                 WSMsgType.CLOSE, WSMsgType.CLOSING, WSMsgType.CLOSED):
             raise StopAsyncIteration
-        return conmsg.json()
+        self._recv_bytes += len(conmsg.data)
+        # bin msg bodies are decoded by the bus straight to their types
+        return wire.decode(conmsg.data, self._codec, is_msg_raw=True)
 
     async def recv(self) -> dict:
-        return await self._core.receive_json()
+        conmsg = await self._core.receive()
+        self._recv_bytes += len(conmsg.data)
+        return wire.decode(conmsg.data, self._codec, is_msg_raw=True)
 
     async def send(self, data: dict):
-        return await self._core.send_json(data)
+        return await self.send_raw(
+            wire.encode(
+                data,
+                self._codec,
+                self._wire_fmt,
+                is_sid_int=self._is_sid_int
+            )
+        )
+
+    async def send_raw(self, data: bytes, fmt: str | None = None):
+        self._sent_bytes += len(data)
+        # bin rbmsgs go as binary frames, json ones as text frames
+        if (fmt or self._wire_fmt) == WireFmt.Bin:
+            return await self._core.send_bytes(data)
+        if self._send_frame is not None:
+            return await self._send_frame(data, WSMsgType.TEXT)
+        return await self._core.send_str(data.decode())
+
+    async def ping(self):
+        return await self._core.ping()
 
     async def close(self):
         return await self._core.close()
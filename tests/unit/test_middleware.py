@@ -4,9 +4,16 @@ from ryz.core import Code, Err, Ok, Res, ecode
 from ryz.uuid import uuid4
 
 from orwynn import App, AppCfg, Plugin
-from orwynn.middleware import Next
+from orwynn.middleware import MiddlewareSpec, Next
 from orwynn.sys import SysInp, SysSpec
-from orwynn.yon.server import Bus, BusCfg, StaticCodeid
+from orwynn.yon.server import (
+    Bus,
+    BusCfg,
+    MemorySpanExporter,
+    PubOpts,
+    StaticCodeid,
+    Tracer,
+)
 from orwynn.yon.server.msg import Msg
 from orwynn.yon.server.transport import Transport
 from tests.conftest import Mock_1, MockCfg, MockCon
@@ -171,3 +178,122 @@ async def test_two_err():
     con_task.cancel()
 
 
+
+async def test_spec_scoped():
+    calls: list[str] = []
+
+    async def mw_all(inp: SysInp, next: Next) -> Res[Msg]:
+        calls.append("all")
+        return await next(inp)
+
+    async def mw_mock_1(inp: SysInp, next: Next) -> Res[Msg]:
+        calls.append("mock_1")
+        return await next(inp)
+
+    async def mw_other(inp: SysInp, next: Next) -> Res[Msg]:
+        calls.append("other")
+        return await next(inp)
+
+    async def sub(inp: SysInp[Mock_1, MockCfg]) -> Res[Msg]:
+        calls.append("sys")
+        return Ok()
+
+    plugin = Plugin(name="test", cfgtype=MockCfg, sys=[SysSpec(Mock_1, sub)])
+    cfg = AppCfg(
+        bus_cfg=BusCfg(
+            transports=[
+                Transport(
+                    is_server=True,
+                    con_type=MockCon
+                )
+            ],
+            reg_regular_codes=[Mock_1]
+        ),
+        extend_cfg_pack={
+            "test": [
+                MockCfg(num=1)
+            ]
+        },
+        middlewares=[
+            mw_all,
+            MiddlewareSpec(mw_mock_1, msgtypes=[Mock_1]),
+            MiddlewareSpec(mw_other, codes=["orwynn_test::other"])
+        ],
+        plugins=[plugin]
+    )
+    await App().init(cfg)
+    for _ in range(2):
+        (await Bus.ie().pubr(
+            Mock_1(key="hello"), PubOpts(pubr_timeout=1))).unwrap()
+    assert calls == ["all", "mock_1", "sys"] * 2
+
+async def test_traced():
+    async def mw_outer(inp: SysInp, next: Next) -> Res[Msg]:
+        return await next(inp)
+
+    async def mw_inner(inp: SysInp, next: Next) -> Res[Msg]:
+        return await next(inp)
+
+    async def sub(inp: SysInp[Mock_1, MockCfg]) -> Res[Msg]:
+        return Ok()
+
+    exporter = MemorySpanExporter()
+    plugin = Plugin(name="test", cfgtype=MockCfg, sys=[SysSpec(Mock_1, sub)])
+    cfg = AppCfg(
+        bus_cfg=BusCfg(
+            reg_regular_codes=[Mock_1],
+            tracer=Tracer(exporter)
+        ),
+        extend_cfg_pack={
+            "test": [
+                MockCfg(num=1)
+            ]
+        },
+        middlewares=[mw_outer, mw_inner],
+        plugins=[plugin]
+    )
+    await App().init(cfg)
+    (await Bus.ie().pubr(
+        Mock_1(key="hello"), PubOpts(pubr_timeout=1))).unwrap()
+
+    name_to_span = {span.name.rsplit(".", 1)[-1]: span
+                    for span in exporter.get_spans()}
+    assert name_to_span["mw_outer"].parent_span_id \
+        == name_to_span["sub"].span_id
+    assert name_to_span["mw_inner"].parent_span_id \
+        == name_to_span["mw_outer"].span_id
+
+async def test_concurrent_calls():
+    both_entered = asyncio.Event()
+    entered_keys: list[str] = []
+    sys_keys: list[str] = []
+
+    async def mw_wait(inp: SysInp, next: Next) -> Res[Msg]:
+        entered_keys.append(inp.msg.key)
+        if len(entered_keys) == 2:
+            both_entered.set()
+        await both_entered.wait()
+        return await next(inp)
+
+    async def sub(inp: SysInp[Mock_1, MockCfg]) -> Res[Msg]:
+        sys_keys.append(inp.msg.key)
+        return Ok()
+
+    plugin = Plugin(name="test", cfgtype=MockCfg, sys=[SysSpec(Mock_1, sub)])
+    cfg = AppCfg(
+        bus_cfg=BusCfg(reg_regular_codes=[Mock_1]),
+        extend_cfg_pack={
+            "test": [
+                MockCfg(num=1)
+            ]
+        },
+        middlewares=[mw_wait],
+        plugins=[plugin]
+    )
+    await App().init(cfg)
+    await asyncio.wait_for(asyncio.gather(
+        Bus.ie().pub(Mock_1(key="a")),
+        Bus.ie().pub(Mock_1(key="b"))
+    ), 1)
+    # each call keeps its own msg, even though both were in flight at once
+    assert sorted(sys_keys) == ["a", "b"]
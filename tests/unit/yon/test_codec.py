@@ -0,0 +1,129 @@
+import asyncio
+import json
+
+import pytest
+from pydantic import BaseModel
+
+from orwynn.yon.server import (
+    Bus,
+    BusCfg,
+    ConArgs,
+    PubOpts,
+    StaticCodeid,
+    Transport,
+    wire,
+)
+from orwynn.yon.server.codec import (
+    Codec,
+    JsonCodec,
+    MsgspecCodec,
+    OrjsonCodec,
+    get_default_codec,
+    get_fastest_codec,
+    msgspec,
+    orjson,
+)
+from orwynn.yon.server.wire import WireFmt
+from tests.unit.yon.conftest import MockCon
+
+RBMSG = {"sid": "hello", "codeid": 3, "msg": {"num": 1, "items": [1, "2"]}}
+
+@pytest.mark.parametrize(
+    "codec_type",
+    [
+        JsonCodec,
+        pytest.param(
+            OrjsonCodec,
+            marks=pytest.mark.skipif(orjson is None, reason="no orjson")
+        ),
+        pytest.param(
+            MsgspecCodec,
+            marks=pytest.mark.skipif(msgspec is None, reason="no msgspec")
+        ),
+    ]
+)
+def test_roundtrip(codec_type: type):
+    codec = codec_type()
+    data = codec.encode(RBMSG)
+    assert isinstance(data, bytes)
+    assert codec.decode(data) == RBMSG
+    assert codec.decode(data.decode()) == RBMSG
+
+def test_default():
+    assert isinstance(get_default_codec(), JsonCodec)
+    codec = get_fastest_codec()
+    if orjson is not None:
+        assert isinstance(codec, OrjsonCodec)
+    elif msgspec is not None:
+        assert isinstance(codec, MsgspecCodec)
+    else:
+        assert isinstance(codec, JsonCodec)
+
+@pytest.mark.parametrize(
+    "codec_type",
+    [
+        JsonCodec,
+        pytest.param(
+            OrjsonCodec,
+            marks=pytest.mark.skipif(orjson is None, reason="no orjson")
+        ),
+        pytest.param(
+            MsgspecCodec,
+            marks=pytest.mark.skipif(msgspec is None, reason="no msgspec")
+        ),
+    ]
+)
+def test_encoded_as_stdlib_json(codec_type: type):
+    # non-str keys and big ints are encoded same as by stdlib json
+    for rbmsg in (
+        {"msg": {"scores": {1: "a", 2: "b"}}},
+        {"msg": {"mixed": {1: "a", "2": "b", None: "c"}}},
+        {"msg": {"num": 2**70}},
+    ):
+        data = wire.encode(rbmsg, codec_type(), WireFmt.Json)
+        assert json.loads(data) == json.loads(json.dumps(rbmsg))
+
+async def test_con_receives_transport_codec(bus: Bus):
+    con = MockCon(ConArgs(core=None))
+    assert isinstance(con.get_codec(), JsonCodec)
+    con_task = asyncio.create_task(bus.con(con))
+    welcome = await asyncio.wait_for(con.client__recv(), 1)
+    assert welcome["codeid"] == StaticCodeid.Welcome
+    assert isinstance(con.get_codec(), type(get_default_codec()))
+    con_task.cancel()
+
+class ScoresMock(BaseModel):
+    scores: dict[int, str]
+
+    @staticmethod
+    def code() -> str:
+        return "yon::scores_mock"
+
+@pytest.mark.parametrize(
+    "codec",
+    [
+        None,
+        pytest.param(
+            OrjsonCodec(),
+            marks=pytest.mark.skipif(orjson is None, reason="no orjson")
+        ),
+    ]
+)
+async def test_pub_non_str_keys(codec: Codec | None):
+    bus = Bus.ie()
+    await bus.init(BusCfg(
+        transports=[
+            Transport(is_server=True, con_type=MockCon, codec=codec)
+        ],
+        reg_regular_codes=[ScoresMock]
+    ))
+    con = MockCon(ConArgs(core=None))
+    con_task = asyncio.create_task(bus.con(con))
+    await asyncio.wait_for(con.client__recv(), 1)
+
+    (await bus.pub(
+        ScoresMock(scores={1: "a"}), PubOpts(target_consids=[con.sid])
+    )).unwrap()
+    rbmsg = await asyncio.wait_for(con.client__recv(), 1)
+    assert rbmsg["msg"] == {"scores": {"1": "a"}}
+    con_task.cancel()
@@ -0,0 +1,62 @@
+import asyncio
+
+from ryz.core import Err, ecode
+
+from orwynn.yon.server import Bus, ConArgs, PubOpts
+from tests.unit.yon.conftest import Mock_1, MockCon
+
+
+async def connect(bus: Bus, count: int) -> tuple[list[MockCon], list]:
+    cons = [MockCon(ConArgs(core=None)) for _ in range(count)]
+    con_tasks = [asyncio.create_task(bus.con(con)) for con in cons]
+    for con in cons:
+        await asyncio.wait_for(con.client__recv(), 1)
+    return cons, con_tasks
+
+async def test_tokens(bus: Bus):
+    cons, con_tasks = await connect(bus, 3)
+    bus.set_con_tokens(cons[0].sid, ["user:1"]).unwrap()
+    bus.set_con_tokens(cons[1].sid, ["user:1", "admin"]).unwrap()
+    bus.set_con_tokens(cons[2].sid, ["user:2"]).unwrap()
+    assert bus.get_token_consids("user:1") == (cons[0].sid, cons[1].sid)
+
+    (await bus.pub(
+        Mock_1(num=1),
+        PubOpts(target_tokens=["user:1"], send_to_inner=False)
+    )).unwrap()
+    for con in cons[:2]:
+        rbmsg = await asyncio.wait_for(con.client__recv(), 1)
+        assert rbmsg["msg"] == {"num": 1}
+    await asyncio.sleep(0.01)
+    assert cons[2].out_queue.empty()
+
+    # resetting tokens reindexes the con
+    bus.set_con_tokens(cons[1].sid, ["user:2"]).unwrap()
+    assert bus.get_token_consids("user:1") == (cons[0].sid,)
+    assert bus.get_token_consids("admin") == ()
+    assert bus.get_token_consids("user:2") == (cons[2].sid, cons[1].sid)
+
+    (await bus.close_con(cons[2].sid)).unwrap()
+    assert bus.get_token_consids("user:2") == (cons[1].sid,)
+
+    for task in con_tasks:
+        task.cancel()
+
+async def test_names(bus: Bus):
+    cons, con_tasks = await connect(bus, 2)
+    bus.set_con_name(cons[0].sid, "alice").unwrap()
+    assert bus.get_consid_by_name("alice").unwrap() == cons[0].sid
+    assert isinstance(bus.set_con_name(cons[1].sid, "alice"), Err)
+
+    bus.set_con_name(cons[0].sid, "bob").unwrap()
+    r = bus.get_consid_by_name("alice")
+    assert isinstance(r, Err)
+    assert r.is_(ecode.NotFound)
+    bus.set_con_name(cons[1].sid, "alice").unwrap()
+
+    (await bus.close_con(cons[0].sid)).unwrap()
+    assert isinstance(bus.get_consid_by_name("bob"), Err)
+    assert bus.get_consid_by_name("alice").unwrap() == cons[1].sid
+
+    for task in con_tasks:
+        task.cancel()
@@ -0,0 +1,94 @@
+import asyncio
+
+from ryz.core import Code, Err
+from ryz.uuid import uuid4
+
+from orwynn.yon.server import Bus, ConArgs, JsonCodec, PubOpts, wire
+from orwynn.yon.server.decode import Decoder, decode_rbmsg
+from orwynn.yon.server.wire import WireFmt
+from tests.unit.yon.conftest import EmptyMock, Mock_1, MockCon
+
+
+class Custom:
+    def __init__(self, value: int) -> None:
+        self.value = value
+
+    @staticmethod
+    def code() -> str:
+        return "yon::custom"
+
+    @classmethod
+    def deserialize(cls, body: dict) -> "Custom":
+        return cls(body["value"] * 2)
+
+def test_decoder():
+    codec = JsonCodec()
+    decoder = Decoder("yon::mock_1", Mock_1)
+    assert decoder.decode({"num": 1}, codec).unwrap() == Mock_1(num=1)
+    assert decoder.decode(b"{\"num\":2}", codec).unwrap() == Mock_1(num=2)
+    assert isinstance(decoder.decode({"num": "x"}, codec), Err)
+    assert isinstance(decoder.decode(b"{\"num\":", codec), Err)
+    assert isinstance(decoder.decode([1], codec), Err)
+
+    decoder = Decoder("yon::empty_mock", EmptyMock)
+    assert decoder.decode(None, codec).unwrap() == EmptyMock()
+
+    decoder = Decoder("yon::custom", Custom)
+    assert decoder.decode({"value": 2}, codec).unwrap().value == 4
+    assert decoder.decode(b"{\"value\":3}", codec).unwrap().value == 6
+
+def test_decode_rbmsg():
+    codec = JsonCodec()
+    decoders = [None, Decoder("yon::mock_1", Mock_1)]
+    rbmsg = {"sid": "s1", "codeid": 1, "lsid": "s0", "msg": {"num": 1}}
+    envelope = decode_rbmsg(rbmsg, decoders, codec, "c1").unwrap()
+    assert envelope.sid == "s1"
+    assert envelope.lsid == "s0"
+    assert envelope.skip__code == "yon::mock_1"
+    assert envelope.skip__consid == "c1"
+    assert envelope.msg == Mock_1(num=1)
+    # rbmsg is left untouched
+    assert rbmsg == {"sid": "s1", "codeid": 1, "lsid": "s0", "msg": {"num": 1}}
+
+    for invalid in (
+        {"sid": "s1", "codeid": 0},
+        {"sid": "s1", "codeid": 2},
+        {"sid": "s1", "codeid": "1"},
+        {"sid": "s1", "codeid": 1, "is_err": True, "msg": {"num": 1}},
+        {"codeid": 1, "msg": {"num": 1}},
+    ):
+        assert isinstance(decode_rbmsg(invalid, decoders, codec, None), Err)
+
+def test_wire_raw_msg():
+    codec = JsonCodec()
+    rbmsg = {"sid": "s1", "codeid": 3, "msg": {"num": 1}}
+    data = wire.encode(rbmsg, codec, WireFmt.Bin)
+    decoded = wire.decode(data, codec, is_msg_raw=True)
+    assert decoded == {"sid": "s1", "codeid": 3, "msg": b"{\"num\":1}"}
+
+async def test_bus_decoders(bus: Bus):
+    ecodeid = bus.get_cached_codes().index(bus.get_ecodes()[0])
+    assert bus._codeid_to_decoder[ecodeid] is None
+    codeid = (await Code.get_regd_codeid_by_type(Mock_1)).unwrap()
+    decoder = bus._codeid_to_decoder[codeid]
+    assert decoder is not None
+    assert decoder.msgtype is Mock_1
+
+    nums: list[int] = []
+    async def sub_test(msg: Mock_1):
+        nums.append(msg.num)
+    await bus.sub(Mock_1, sub_test)
+
+    con = MockCon(ConArgs(core=None))
+    con_task = asyncio.create_task(bus.con(con))
+    await asyncio.wait_for(con.client__recv(), 1)
+    # raw body, as left by bin wire format
+    await con.client__send({
+        "sid": uuid4(), "codeid": codeid, "msg": b"{\"num\":5}"
+    })
+    await asyncio.wait_for(con.client__recv(), 1)
+    assert nums == [5]
+
+    await bus.pub(Mock_1(num=6), PubOpts(send_to_net=False))
+    assert nums == [5, 6]
+    con_task.cancel()
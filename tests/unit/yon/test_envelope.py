@@ -0,0 +1,71 @@
+from ryz.core import Code, Err, Ok
+
+from orwynn.yon.server import Bus, PubOpts
+from orwynn.yon.server.msg import Bmsg, Envelope
+from tests.unit.yon.conftest import EmptyMock, Mock_1
+
+
+def test_serialize():
+    envelope = Envelope(
+        skip__code="yon::mock_1",
+        msg=Mock_1(num=1),
+        sid="s1",
+        lsid="s0",
+        is_err=False,
+        skip__target_consids=["c1"]
+    )
+    assert envelope.serialize_to_net(5).unwrap() == {
+        "sid": "s1",
+        "codeid": 5,
+        "lsid": "s0",
+        "is_err": False,
+        "msg": {"num": 1}
+    }
+
+    # empty and missing msgs aren't serialized
+    envelope = Envelope(skip__code="yon::empty_mock", msg=EmptyMock())
+    rbmsg = envelope.serialize_to_net(7).unwrap()
+    assert rbmsg == {"sid": envelope.sid, "codeid": 7}
+
+    envelope = Envelope(
+        skip__code="val_err", msg=ValueError("hello"), is_err=True
+    )
+    rbmsg = envelope.serialize_to_net(9).unwrap()
+    assert rbmsg["msg"] == {"msg": "hello"}
+    assert rbmsg["is_err"]
+
+async def test_bmsg_compat(bus: Bus):
+    bmsg = Bmsg(skip__code="yon::mock_1", msg=Mock_1(num=1), lsid="s0")
+    envelope = Envelope.from_bmsg(bmsg)
+    assert envelope.sid == bmsg.sid
+    assert envelope.to_bmsg() == bmsg
+
+    codeid = (await Code.get_regd_codeid_by_type(Mock_1)).unwrap()
+    rbmsg = (await bmsg.serialize_to_net(codeid)).unwrap()
+    assert rbmsg == {
+        "sid": bmsg.sid, "codeid": codeid, "lsid": "s0", "msg": {"num": 1}
+    }
+    restored = (await Bmsg.deserialize_from_net(rbmsg)).unwrap()
+    assert restored.sid == bmsg.sid
+    assert restored.msg == Mock_1(num=1)
+
+    # bmsgs are still accepted by the bus
+    nums: list[int] = []
+    async def sub_test(msg: Mock_1):
+        nums.append(msg.num)
+        return Ok()
+    await bus.sub(Mock_1, sub_test)
+    (await bus.pub(bmsg, PubOpts(send_to_net=False))).unwrap()
+    assert nums == [1]
+
+async def test_deserialize_invalid(bus: Bus):
+    codeid = (await Code.get_regd_codeid_by_type(Mock_1)).unwrap()
+    for rbmsg in (
+        {"codeid": codeid, "msg": {"num": 1}},
+        {"sid": True, "codeid": codeid, "msg": {"num": 1}},
+        {"sid": -1, "codeid": codeid, "msg": {"num": 1}},
+        {"sid": "s1", "lsid": 2.5, "codeid": codeid, "msg": {"num": 1}},
+        {"sid": "s1", "codeid": codeid, "msg": {"num": "x"}},
+        {"sid": "s1", "codeid": 1000, "msg": {"num": 1}},
+    ):
+        assert isinstance(await Envelope.deserialize_from_net(rbmsg), Err)
@@ -0,0 +1,97 @@
+from ryz.core import Err, Ok, ecode
+
+from orwynn.yon.server import Bus, In, PubOpts, RetainOpts, SubOpts
+from orwynn.yon.server.fieldfilter import FieldFilter, FilterIndex
+from tests.unit.yon.conftest import Mock_1, Mock_2
+
+
+def test_field_filter():
+    f = FieldFilter.compile({"num": In([1, 2]), "name": "a"}).unwrap()
+    assert f.match({"num": 1, "name": "a"})
+    assert f.match(Mock_1(num=2)) is False
+    assert not f.match({"num": 3, "name": "a"})
+    assert not f.match({"num": [1], "name": "a"})
+
+    assert isinstance(FieldFilter.compile({}), Err)
+    assert isinstance(FieldFilter.compile({"num": [1]}), Err)
+    assert isinstance(FieldFilter.compile({"num": In([[1]])}), Err)
+
+def test_filter_index():
+    index = FilterIndex()
+    for i in range(1000):
+        index.add(
+            str(i), i, FieldFilter.compile({"num": i % 100}).unwrap()
+        )
+    index.add("even", "even", FieldFilter.compile({
+        "num": In(range(0, 100, 2))
+    }).unwrap())
+    index.add("name", "name", FieldFilter.compile({"name": "a"}).unwrap())
+
+    assert index.match(Mock_1(num=5)) == list(range(5, 1000, 100))
+    assert index.match(Mock_1(num=4)) == [*range(4, 1000, 100), "even"]
+    assert index.match({"num": 4, "name": "a"}) == [
+        *range(4, 1000, 100), "even", "name"
+    ]
+    assert index.match(Mock_1(num=100)) == []
+
+    assert index.remove("even")
+    assert not index.remove("even")
+    for i in range(1000):
+        assert index.remove(str(i))
+    assert index.match(Mock_1(num=4)) == []
+    assert len(index) == 1
+
+async def test_sub_filtered(bus: Bus):
+    calls: list[str] = []
+    def make_subfn(name: str):
+        async def subfn(msg: Mock_1):
+            # the pattern subfn also receives ok responses
+            if isinstance(msg, Mock_1):
+                calls.append(name)
+            return Ok()
+        return subfn
+
+    (await bus.sub(Mock_1, make_subfn("all"))).unwrap()
+    unsub_1 = (await bus.sub(
+        Mock_1, make_subfn("1"), SubOpts(field_filters={"num": 1})
+    )).unwrap()
+    (await bus.sub(
+        Mock_1,
+        make_subfn("1 or 2"),
+        SubOpts(field_filters={"num": In([1, 2])})
+    )).unwrap()
+    (await bus.sub("yon::*", make_subfn("pattern"))).unwrap()
+
+    (await bus.pub(Mock_1(num=1), PubOpts(send_to_net=False))).unwrap()
+    assert calls == ["all", "1", "1 or 2", "pattern"]
+
+    calls.clear()
+    (await bus.pub(Mock_1(num=3), PubOpts(send_to_net=False))).unwrap()
+    assert calls == ["all", "pattern"]
+
+    calls.clear()
+    unsub_1()
+    (await bus.pub(Mock_1(num=1), PubOpts(send_to_net=False))).unwrap()
+    assert calls == ["all", "1 or 2", "pattern"]
+
+    r = await bus.sub(
+        "yon::*", make_subfn("x"), SubOpts(field_filters={"num": 1})
+    )
+    assert isinstance(r, Err)
+    assert r.is_(ecode.Unsupported)
+
+async def test_filtered_recv_last_msg(bus: Bus):
+    bus.set_code_retention(Mock_2.code(), RetainOpts(key_field="num"))
+    for num in range(3):
+        (await bus.pub(Mock_2(num=num), PubOpts(send_to_net=False))).unwrap()
+
+    nums: list[int] = []
+    async def sub_test(msg: Mock_2):
+        nums.append(msg.num)
+        return Ok()
+    (await bus.sub(
+        Mock_2,
+        sub_test,
+        SubOpts(recv_last_msg=True, field_filters={"num": In([0, 2])})
+    )).unwrap()
+    assert sorted(nums) == [0, 2]
@@ -0,0 +1,68 @@
+import asyncio
+
+from ryz.core import Err
+
+from orwynn.yon.server import Bus, ConArgs, PubOpts
+from orwynn.yon.server.groups import GroupIndex
+from tests.unit.yon.conftest import Mock_1, MockCon
+
+
+def test_group_index():
+    groups = GroupIndex()
+    groups.join("c1", "room")
+    groups.join("c2", "room")
+    groups.join("c2", "room")
+    groups.join("c2", "other")
+
+    snapshot = groups.get_consids("room")
+    assert snapshot == ("c1", "c2")
+    # the snapshot is reused until the group changes
+    assert groups.get_consids("room") is snapshot
+    groups.join("c3", "room")
+    assert groups.get_consids("room") == ("c1", "c2", "c3")
+    assert snapshot == ("c1", "c2")
+
+    assert groups.resolve(["room", "other"], ["c4", "c2"]) == (
+        "c4", "c2", "c1", "c3"
+    )
+    assert groups.get_consids("unknown") == ()
+
+    assert groups.leave("c1", "room")
+    assert not groups.leave("c1", "room")
+    groups.leave_all("c2")
+    assert groups.get_groups("c2") == []
+    assert groups.get_consids("room") == ("c3",)
+    assert groups.get_consids("other") == ()
+
+async def test_pub_to_groups(bus: Bus):
+    cons = [MockCon(ConArgs(core=None)) for _ in range(3)]
+    con_tasks = [asyncio.create_task(bus.con(con)) for con in cons]
+    for con in cons:
+        await asyncio.wait_for(con.client__recv(), 1)
+
+    bus.join_group(cons[0].sid, "room").unwrap()
+    bus.join_group(cons[1].sid, "room").unwrap()
+    bus.join_group(cons[1].sid, "other").unwrap()
+    assert isinstance(bus.join_group("unknown", "room"), Err)
+    assert sorted(bus.get_con_groups(cons[1].sid)) == ["other", "room"]
+
+    (await bus.pub(
+        Mock_1(num=1),
+        PubOpts(target_groups=["room", "other"], send_to_inner=False)
+    )).unwrap()
+    for con in cons[:2]:
+        rbmsg = await asyncio.wait_for(con.client__recv(), 1)
+        assert rbmsg["msg"] == {"num": 1}
+    await asyncio.sleep(0.01)
+    assert cons[2].out_queue.empty()
+    assert cons[1].out_queue.empty()
+
+    # group members leave on disconnect
+    (await bus.close_con(cons[0].sid)).unwrap()
+    assert bus.get_group_consids("room") == (cons[1].sid,)
+    bus.leave_group(cons[1].sid, "room").unwrap()
+    assert bus.get_group_consids("room") == ()
+    assert isinstance(bus.leave_group(cons[1].sid, "room"), Err)
+
+    for task in con_tasks:
+        task.cancel()
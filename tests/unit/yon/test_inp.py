@@ -0,0 +1,234 @@
+import asyncio
+
+from ryz.core import Code, Ok
+from ryz.uuid import uuid4
+
+from orwynn.yon.server import (
+    Bus,
+    BusCfg,
+    BusEcode,
+    ConArgs,
+    InpOverloadPolicy,
+    InpQueueHigh,
+    InpQueueLow,
+    Transport,
+)
+from tests.unit.yon.conftest import Mock_1, Mock_2, MockCon
+
+
+async def init_bus(**transport_kwargs) -> Bus:
+    bus = Bus.ie()
+    await bus.init(BusCfg(
+        transports=[
+            Transport(
+                is_server=True,
+                con_type=MockCon,
+                **transport_kwargs
+            )
+        ],
+        reg_regular_codes=[Mock_1, Mock_2]
+    ))
+    return bus
+
+async def connect(bus: Bus) -> tuple[MockCon, asyncio.Task]:
+    con = MockCon(ConArgs(core=None))
+    con_task = asyncio.create_task(bus.con(con))
+    await asyncio.wait_for(con.client__recv(), 1)
+    return con, con_task
+
+async def send_num(
+    con: MockCon, num: int, msgtype: type = Mock_1
+) -> str:
+    sid = uuid4()
+    await con.client__send({
+        "sid": sid,
+        "codeid": (await Code.get_regd_codeid_by_type(msgtype)).unwrap(),
+        "msg": {"num": num}
+    })
+    return sid
+
+async def test_shards():
+    bus = await init_bus(inp_shards=8)
+    atransport = bus._con_type_to_atransport[MockCon]
+    slow, slow_task = await connect(bus)
+    fast, fast_task = await connect(bus)
+    while atransport.get_inp_shard(fast.sid) \
+            == atransport.get_inp_shard(slow.sid):
+        fast_task.cancel()
+        fast, fast_task = await connect(bus)
+
+    release_evt = asyncio.Event()
+    nums: list[int] = []
+    async def sub_test(msg: Mock_1):
+        if msg.num == 0:
+            await release_evt.wait()
+        nums.append(msg.num)
+        return Ok()
+    await bus.sub(Mock_1, sub_test)
+
+    await send_num(slow, 0)
+    await send_num(slow, 1)
+    await send_num(fast, 2)
+    await asyncio.wait_for(fast.client__recv(), 1)
+    assert nums == [2]
+
+    # the slow con's rbmsgs are still processed in order
+    release_evt.set()
+    await asyncio.wait_for(slow.client__recv(), 1)
+    await asyncio.wait_for(slow.client__recv(), 1)
+    assert nums == [2, 0, 1]
+
+    slow_task.cancel()
+    fast_task.cancel()
+
+async def test_reject():
+    bus = await init_bus(
+        max_inp_queue_size=1,
+        inp_overload_policy=InpOverloadPolicy.Reject
+    )
+    release_evt = asyncio.Event()
+    nums: list[int] = []
+    async def sub_test(msg: Mock_1):
+        await release_evt.wait()
+        nums.append(msg.num)
+        return Ok()
+    await bus.sub(Mock_1, sub_test)
+    con, con_task = await connect(bus)
+
+    await send_num(con, 0)
+    await asyncio.sleep(0.01)
+    await send_num(con, 1)
+    rejected_sid = await send_num(con, 2)
+    response = await asyncio.wait_for(con.client__recv(), 1)
+    assert response["lsid"] == rejected_sid
+    assert response["codeid"] == \
+        bus.get_cached_codeid_by_code(BusEcode.Overload).unwrap()
+
+    release_evt.set()
+    await asyncio.wait_for(con.client__recv(), 1)
+    await asyncio.wait_for(con.client__recv(), 1)
+    assert nums == [0, 1]
+
+    con_task.cancel()
+
+async def test_reject_int_sid():
+    bus = await init_bus(
+        max_inp_queue_size=1,
+        inp_overload_policy=InpOverloadPolicy.Reject
+    )
+    release_evt = asyncio.Event()
+    async def sub_test(msg: Mock_1):
+        await release_evt.wait()
+        return Ok()
+    await bus.sub(Mock_1, sub_test)
+    con, con_task = await connect(bus)
+
+    await send_num(con, 0)
+    await asyncio.sleep(0.01)
+    await send_num(con, 1)
+    await con.client__send({
+        "sid": 42,
+        "codeid": (await Code.get_regd_codeid_by_type(Mock_1)).unwrap(),
+        "msg": {"num": 2}
+    })
+    response = await asyncio.wait_for(con.client__recv(), 1)
+    assert response["lsid"] == "42"
+    assert response["codeid"] == \
+        bus.get_cached_codeid_by_code(BusEcode.Overload).unwrap()
+
+    release_evt.set()
+    con_task.cancel()
+
+async def test_shed_and_watermarks():
+    bus = await init_bus(
+        max_inp_queue_size=2,
+        inp_overload_policy=InpOverloadPolicy.Shed,
+        inp_high_watermark=0.5,
+        inp_low_watermark=0,
+        inp_code_priorities={Mock_2.code(): 1}
+    )
+    release_evt = asyncio.Event()
+    watermarks: list[type] = []
+    async def sub_watermark(msg: InpQueueHigh | InpQueueLow):
+        watermarks.append(type(msg))
+        # slow watermark subfns must not block reading of the con
+        await release_evt.wait()
+        return Ok()
+    await bus.sub(InpQueueHigh, sub_watermark)
+    await bus.sub(InpQueueLow, sub_watermark)
+
+    nums: list[int] = []
+    async def sub_test(msg: Mock_1 | Mock_2):
+        await release_evt.wait()
+        nums.append(msg.num)
+        return Ok()
+    await bus.sub(Mock_1, sub_test)
+    await bus.sub(Mock_2, sub_test)
+    con, con_task = await connect(bus)
+
+    await send_num(con, 0)
+    await asyncio.sleep(0.01)
+    await send_num(con, 1)
+    shed_sid = await send_num(con, 2)
+    await send_num(con, 3, Mock_2)
+    response = await asyncio.wait_for(con.client__recv(), 1)
+    assert response["lsid"] == shed_sid
+    assert watermarks == [InpQueueHigh]
+
+    release_evt.set()
+    for _ in range(3):
+        await asyncio.wait_for(con.client__recv(), 1)
+    assert nums == [0, 1, 3]
+    assert watermarks == [InpQueueHigh, InpQueueLow]
+
+    con_task.cancel()
+
+async def test_forged_watermark():
+    bus = await init_bus()
+    watermarks: list[type] = []
+    async def sub_watermark(msg: InpQueueHigh):
+        watermarks.append(type(msg))
+        return Ok()
+    await bus.sub(InpQueueHigh, sub_watermark)
+    async def sub_test(msg: Mock_1):
+        return Ok()
+    await bus.sub(Mock_1, sub_test)
+    con, con_task = await connect(bus)
+
+    await con.client__send({
+        "sid": uuid4(),
+        "codeid": (await Code.get_regd_codeid_by_type(InpQueueHigh)).unwrap(),
+        "msg": {"con_type": "MockCon", "shard": 0, "size": 0}
+    })
+    # rbmsgs of a con are processed in order, so the forged one is done
+    # once the next one is responded
+    await send_num(con, 0)
+    await asyncio.wait_for(con.client__recv(), 1)
+    assert not watermarks
+
+    con_task.cancel()
+
+async def test_pause():
+    bus = await init_bus(max_inp_queue_size=1)
+    release_evt = asyncio.Event()
+    nums: list[int] = []
+    async def sub_test(msg: Mock_1):
+        await release_evt.wait()
+        nums.append(msg.num)
+        return Ok()
+    await bus.sub(Mock_1, sub_test)
+    con, con_task = await connect(bus)
+
+    for num in range(4):
+        await send_num(con, num)
+    await asyncio.sleep(0.01)
+    # one rbmsg is processed, one is queued and one waits to be queued, so
+    # reading is paused, and the rest is left unread in the con
+    assert con.inp_queue.qsize() == 1
+
+    release_evt.set()
+    for _ in range(4):
+        await asyncio.wait_for(con.client__recv(), 1)
+    assert nums == [0, 1, 2, 3]
+
+    con_task.cancel()
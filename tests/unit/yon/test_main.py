@@ -1,5 +1,6 @@
 import asyncio
 
+from aiohttp import WSMsgType
 from ryz.core import Code, Err, Ok, Res, ecode
 from ryz.uuid import uuid4
 
@@ -8,6 +9,7 @@ from orwynn.yon.server import (
     ConArgs,
     PubOpts,
     StaticCodeid,
+    Ws,
 )
 from tests.unit.yon.conftest import (
     EmptyMock,
@@ -157,3 +159,104 @@ async def test_set_con_name_normal_ok(bus: Bus):
     assert con._name == "hello"
     assert con.get_display() == "hello"
     con_task.cancel()
+
+async def test_concurrent_code_fanout(bus: Bus):
+    bus.set_code_concurrency(Mock_1.code(), 0)
+    order: list[int] = []
+    is_2_called = asyncio.Event()
+
+    async def slow_1(msg: Mock_1):
+        # would never be set if subfns were called one by one
+        await is_2_called.wait()
+        order.append(1)
+        return Ok()
+
+    async def slow_2(msg: Mock_1):
+        is_2_called.set()
+        order.append(2)
+        return Ok()
+
+    async def failing(msg: Mock_1):
+        raise ValueError("hello")
+
+    await bus.sub(Mock_1, slow_1)
+    await bus.sub(Mock_1, slow_2)
+    await bus.sub(Mock_1, failing)
+
+    (await asyncio.wait_for(bus.pub(Mock_1(num=1)), 1)).unwrap()
+    assert order == [2, 1]
+
+async def test_concurrent_code_fanout_limit(bus: Bus):
+    bus.set_code_concurrency(Mock_1.code(), 1)
+    running = 0
+    max_running = 0
+
+    async def sub_test(msg: Mock_1):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(running, max_running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return Ok()
+
+    await bus.sub(Mock_1, sub_test)
+    await bus.sub(Mock_1, sub_test)
+    (await bus.pub(Mock_1(num=1))).unwrap()
+    assert max_running == 1
+
+class MockWsCore:
+    def __init__(self) -> None:
+        self.strs: list[str] = []
+
+    async def send_str(self, data: str):
+        self.strs.append(data)
+
+class MockFrameWsCore(MockWsCore):
+    def __init__(self) -> None:
+        super().__init__()
+        self.frames: list[tuple[bytes, WSMsgType]] = []
+
+    async def send_frame(self, data: bytes, opcode: WSMsgType):
+        self.frames.append((data, opcode))
+
+async def test_ws_sends_json_as_text():
+    raw = b'{"codeid":1}'
+    con = Ws(ConArgs(core=MockFrameWsCore()))
+    await con.send_raw(raw)
+    # the shared buffer is sent as is, without decoding it per con
+    assert con._core.frames == [(raw, WSMsgType.TEXT)]
+    assert con._core.frames[0][0] is raw
+    assert not con._core.strs
+
+    # cores without frame-level send get the decoded text
+    con = Ws(ConArgs(core=MockWsCore()))
+    await con.send_raw(raw)
+    assert con._core.strs == ['{"codeid":1}']
+
+async def test_pub_to_many_cons_encodes_once(bus: Bus):
+    raws: list[bytes] = []
+    cons = [MockCon(ConArgs(core=None)) for _ in range(3)]
+    con_tasks = [asyncio.create_task(bus.con(con)) for con in cons]
+    for con in cons:
+        await asyncio.wait_for(con.client__recv(), 1)
+
+        def record(con: MockCon):
+            send_raw = con.send_raw
+            async def inner(data: bytes, fmt: str | None = None):
+                raws.append(data)
+                await send_raw(data, fmt)
+            return inner
+        con.send_raw = record(con)
+
+    (await bus.pub(
+        Mock_1(num=1),
+        PubOpts(target_consids=[con.sid for con in cons])
+    )).unwrap()
+    for con in cons:
+        response = await asyncio.wait_for(con.client__recv(), 1)
+        assert response["msg"]["num"] == 1
+    assert len(raws) == 3
+    assert all(raw is raws[0] for raw in raws)
+
+    for con_task in con_tasks:
+        con_task.cancel()
@@ -0,0 +1,102 @@
+import asyncio
+
+from ryz.core import Code, Ok
+from ryz.uuid import uuid4
+
+from orwynn.yon.server import Bus, BusCfg, ConArgs, PubOpts, Transport
+from orwynn.yon.server.metrics import Histogram, Metrics
+from tests.unit.yon.conftest import Mock_1, Mock_2, MockCon
+
+
+def test_histogram():
+    h = Histogram((1, 2))
+    for value in (0.5, 1, 1.5, 3):
+        h.observe(value)
+    assert h.snapshot() == {
+        "bounds": [1, 2],
+        "counts": [2, 1, 1],
+        "sum": 6,
+        "count": 4
+    }
+
+def test_subfn_latency_by_name():
+    def make_subfn():
+        async def subfn(msg): ...
+        return subfn
+
+    metrics = Metrics()
+    # closures recreated per sub share the histogram
+    assert metrics.get_subfn_latency(make_subfn()) \
+        is metrics.get_subfn_latency(make_subfn())
+    assert len(metrics.snapshot()["subfns"]) == 1
+
+async def test_snapshot():
+    bus = Bus.ie()
+    await bus.init(BusCfg(
+        transports=[Transport(is_server=True, con_type=MockCon)],
+        reg_regular_codes=[Mock_1, Mock_2],
+        collect_metrics=True
+    ))
+
+    async def sub_test(msg: Mock_1):
+        return Ok(Mock_2(num=msg.num))
+    await bus.sub(Mock_1, sub_test)
+
+    con = MockCon(ConArgs(core=None))
+    con_task = asyncio.create_task(bus.con(con))
+    await asyncio.wait_for(con.client__recv(), 1)
+
+    await con.client__send({
+        "sid": uuid4(),
+        "codeid": (await Code.get_regd_codeid_by_type(Mock_1)).unwrap(),
+        "msg": {"num": 1}
+    })
+    await asyncio.wait_for(con.client__recv(), 1)
+    await bus.pub(Mock_1(num=2), PubOpts(send_to_net=False))
+
+    metrics = bus.get_metrics()
+    mock_1 = metrics["codes"]["yon::mock_1"]
+    assert mock_1["pub_count"] == 2
+    assert mock_1["recv_count"] == 1
+    assert mock_1["deser_time"]["count"] == 1
+    mock_2 = metrics["codes"]["yon::mock_2"]
+    assert mock_2["pub_count"] == 2
+    assert mock_2["ser_time"]["count"] == 1
+
+    subfn_name = f"{__name__}.test_snapshot.<locals>.sub_test"
+    assert metrics["subfns"][subfn_name]["count"] == 2
+
+    assert metrics["transports"]["MockCon"] == {
+        "inp_queue_sizes": [0],
+        "out_queue_size": 0,
+        "cons_count": 1
+    }
+    con_metrics = metrics["cons"][con.sid]
+    assert con_metrics["outbox_size"] == 0
+    # welcome and the response
+    assert con_metrics["sent_bytes"] > 0
+
+    text = bus.get_metrics_prometheus()
+    assert "# TYPE yon_code_pub_total counter" in text
+    assert "yon_code_pub_total{code=\"yon::mock_1\"} 2" in text
+    assert "yon_code_recv_total{code=\"yon::mock_1\"} 1" in text
+    assert (
+        f"yon_subfn_latency_seconds_bucket{{subfn=\"{subfn_name}\""
+        ",le=\"+Inf\"} 2"
+    ) in text
+    assert "yon_inp_queue_size{transport=\"MockCon\",shard=\"0\"} 0" in text
+    assert "yon_cons{transport=\"MockCon\"} 1" in text
+    assert con.sid not in text
+
+    con_task.cancel()
+
+async def test_disabled():
+    bus = Bus.ie()
+    await bus.init(BusCfg(reg_regular_codes=[Mock_1]))
+
+    async def sub_test(msg: Mock_1): ...
+    await bus.sub(Mock_1, sub_test)
+    await bus.pub(Mock_1(num=1))
+    assert bus.get_metrics() == {}
+    # untimed subfns are stored as is
+    assert bus._code_to_subfns["yon::mock_1"] == [sub_test]
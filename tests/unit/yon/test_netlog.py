@@ -0,0 +1,101 @@
+import asyncio
+import threading
+
+from ryz import log
+
+from orwynn.yon.server import ConArgs
+from orwynn.yon.server.netlog import NetLogger, NetLogSink
+from tests.unit.yon.conftest import MockCon
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.lines: list[str] = []
+        self.threads: set[str] = set()
+
+    def write(self, line: str):
+        self.lines.append(line)
+        self.threads.add(threading.current_thread().name)
+
+def get_code(codeid: int) -> str | None:
+    return {0: "yon::welcome", 1: "mock_1"}.get(codeid)
+
+def test_sampled():
+    recorder = Recorder()
+    logger = NetLogger(
+        NetLogSink(recorder.write),
+        get_code,
+        {"mock_1": 0.25, "yon::welcome": 0}
+    )
+    con = MockCon(ConArgs(core=None))
+    for i in range(8):
+        logger.send(con, {"sid": str(i), "codeid": 1})
+        logger.send(con, {"sid": str(i), "codeid": 0})
+    logger.recv(con, {"sid": "x", "codeid": 5})
+    logger.close()
+
+    assert len(recorder.lines) == 3
+    assert recorder.lines[0].startswith("NET::SEND | \"mock_1\" to")
+    assert "'sid': '3'" in recorder.lines[0]
+    assert "'sid': '7'" in recorder.lines[1]
+    assert recorder.lines[2].startswith("NET::RECV | \"unknown\" from")
+    assert recorder.threads == {"yon-netlog"}
+
+def test_truncated():
+    recorder = Recorder()
+    logger = NetLogger(NetLogSink(recorder.write), get_code, None, 50)
+    con = MockCon(ConArgs(core=None))
+    logger.recv(con, {"sid": "1", "codeid": 1, "msg": {"text": "a" * 1000}})
+    logger.close()
+
+    assert len(recorder.lines) == 1
+    payload = recorder.lines[0].split(" | ")[-1]
+    assert len(payload) == 53
+    assert payload.endswith("...")
+
+def test_raw_body_decoded():
+    recorder = Recorder()
+    logger = NetLogger(NetLogSink(recorder.write), get_code)
+    con = MockCon(ConArgs(core=None))
+    logger.recv(con, {"sid": "1", "codeid": 1, "msg": b'{"num":1}'})
+    logger.close()
+    assert "'msg': {'num': 1}" in recorder.lines[0]
+
+def test_disabled_verbosity():
+    recorder = Recorder()
+    logger = NetLogger(NetLogSink(recorder.write), get_code)
+    con = MockCon(ConArgs(core=None))
+    prev_verbosity = log.std_verbosity
+    log.std_verbosity = 0
+    try:
+        logger.recv(con, {"sid": "1", "codeid": 1})
+    finally:
+        log.std_verbosity = prev_verbosity
+    logger.close()
+    assert recorder.lines == []
+
+def test_sink_overflow():
+    release_evt = threading.Event()
+    sink = NetLogSink(lambda _: release_evt.wait(), 2)
+    for i in range(10):
+        sink.put(str(i))
+    # one line may have been taken by the thread already
+    assert sink.dropped_count in (7, 8)
+    release_evt.set()
+    sink.close()
+
+async def test_aclose_not_blocking_loop():
+    release_evt = threading.Event()
+    recorder = Recorder()
+    def write(line: str):
+        release_evt.wait()
+        recorder.write(line)
+    sink = NetLogSink(write)
+    sink.put("1")
+    aclose_task = asyncio.create_task(sink.aclose())
+    # the loop keeps running while the thread is still writing
+    await asyncio.sleep(0.05)
+    assert not aclose_task.done()
+    release_evt.set()
+    await asyncio.wait_for(aclose_task, 1)
+    assert recorder.lines == ["1"]
@@ -0,0 +1,165 @@
+import asyncio
+
+from orwynn.yon.server import (
+    Bus,
+    BusCfg,
+    ConArgs,
+    PubOpts,
+    SlowConPolicy,
+    Transport,
+)
+from tests.unit.yon.conftest import Mock_1, MockCon
+
+
+class StallMockCon(MockCon):
+    """
+    Con which send hangs once stalled, until released.
+    """
+    def __init__(self, args: ConArgs[None]) -> None:
+        super().__init__(args)
+        self.release_evt = asyncio.Event()
+        self.release_evt.set()
+
+    async def send(self, data: dict):
+        await self.release_evt.wait()
+        await super().send(data)
+
+async def init_bus(**transport_kwargs) -> Bus:
+    bus = Bus.ie()
+    await bus.init(BusCfg(
+        transports=[
+            Transport(
+                is_server=True,
+                con_type=StallMockCon,
+                **transport_kwargs
+            )
+        ],
+        reg_regular_codes=[Mock_1]
+    ))
+    return bus
+
+async def connect(bus: Bus) -> tuple[StallMockCon, asyncio.Task]:
+    con = StallMockCon(ConArgs(core=None))
+    con_task = asyncio.create_task(bus.con(con))
+    await asyncio.wait_for(con.client__recv(), 1)
+    return con, con_task
+
+async def pub_nums(bus: Bus, con: StallMockCon, nums: range):
+    for num in nums:
+        (await bus.pub(
+            Mock_1(num=num), PubOpts(target_consids=[con.sid])
+        )).unwrap()
+
+async def test_stalled_con_not_blocks_others():
+    bus = await init_bus(out_writers=2)
+    stalled, stalled_task = await connect(bus)
+    healthy, healthy_task = await connect(bus)
+    stalled.release_evt.clear()
+
+    await pub_nums(bus, stalled, range(1))
+    await pub_nums(bus, healthy, range(1))
+    response = await asyncio.wait_for(healthy.client__recv(), 1)
+    assert response["msg"]["num"] == 0
+
+    stalled.release_evt.set()
+    response = await asyncio.wait_for(stalled.client__recv(), 1)
+    assert response["msg"]["num"] == 0
+
+    stalled_task.cancel()
+    healthy_task.cancel()
+
+async def test_send_timeout_frees_writer():
+    bus = await init_bus(out_send_timeout=0.05)
+    stalled, stalled_task = await connect(bus)
+    healthy, healthy_task = await connect(bus)
+    stalled.release_evt.clear()
+
+    await pub_nums(bus, stalled, range(2))
+    await pub_nums(bus, healthy, range(1))
+    response = await asyncio.wait_for(healthy.client__recv(), 1)
+    assert response["msg"]["num"] == 0
+
+    # rbmsgs queued meanwhile are sent once the stalled send is done
+    stalled.release_evt.set()
+    nums = [
+        (await asyncio.wait_for(stalled.client__recv(), 1))["msg"]["num"]
+        for _ in range(2)
+    ]
+    assert nums == [0, 1]
+
+    stalled_task.cancel()
+    healthy_task.cancel()
+
+async def test_send_timeout_disconnect():
+    bus = await init_bus(
+        out_send_timeout=0.05,
+        slow_con_policy=SlowConPolicy.Disconnect
+    )
+    con, con_task = await connect(bus)
+    con.release_evt.clear()
+
+    await pub_nums(bus, con, range(1))
+    await asyncio.sleep(0.1)
+    assert con.is_closed()
+
+    con_task.cancel()
+
+async def test_drop_oldest():
+    bus = await init_bus(
+        max_out_queue_size=2,
+        slow_con_policy=SlowConPolicy.DropOldest
+    )
+    con, con_task = await connect(bus)
+    con.release_evt.clear()
+
+    # first msg is taken by the writer, next ones stay in the outbox
+    await pub_nums(bus, con, range(1))
+    await asyncio.sleep(0)
+    await pub_nums(bus, con, range(1, 5))
+    con.release_evt.set()
+
+    nums = [
+        (await asyncio.wait_for(con.client__recv(), 1))["msg"]["num"]
+        for _ in range(3)
+    ]
+    assert nums == [0, 3, 4]
+
+    con_task.cancel()
+
+async def test_disconnect():
+    bus = await init_bus(
+        max_out_queue_size=1,
+        slow_con_policy=SlowConPolicy.Disconnect
+    )
+    con, con_task = await connect(bus)
+    con.release_evt.clear()
+
+    await pub_nums(bus, con, range(1))
+    await asyncio.sleep(0)
+    await pub_nums(bus, con, range(1, 3))
+    await asyncio.sleep(0.01)
+    assert con.is_closed()
+    assert bus.get_con_name(con.sid).is_err()
+
+    con_task.cancel()
+
+async def test_block():
+    bus = await init_bus(max_out_queue_size=1)
+    con, con_task = await connect(bus)
+    con.release_evt.clear()
+
+    await pub_nums(bus, con, range(2))
+    await asyncio.sleep(0)
+    pub_task = asyncio.create_task(pub_nums(bus, con, range(2, 3)))
+    await asyncio.sleep(0.01)
+    assert not pub_task.done()
+
+    con.release_evt.set()
+    await asyncio.wait_for(pub_task, 1)
+    nums = [
+        (await asyncio.wait_for(con.client__recv(), 1))["msg"]["num"]
+        for _ in range(3)
+    ]
+    assert nums == [0, 1, 2]
+
+    con_task.cancel()
@@ -0,0 +1,63 @@
+import asyncio
+
+from ryz.core import Err, Ok, ecode
+
+from orwynn.yon.server import Bus, BusEcode, ConArgs, PubOpts
+from orwynn.yon.server.timer import TimerWheel
+from tests.unit.yon.conftest import Mock_1, Mock_2, MockCon
+
+
+def test_timer_wheel():
+    wheel = TimerWheel(tick=1, size=4)
+    fired: list[int] = []
+    wheel.add(1, lambda: fired.append(1))
+    wheel.add(4, lambda: fired.append(4))
+    wheel.add(9, lambda: fired.append(9))
+    wheel.add(2, lambda: fired.append(2)).cancel()
+
+    wheel.advance()
+    assert fired == [1]
+    wheel.advance(3)
+    assert fired == [1, 4]
+    wheel.advance(4)
+    assert fired == [1, 4]
+    wheel.advance()
+    assert fired == [1, 4, 9]
+
+async def test_removed_on_response(bus: Bus):
+    async def sub_test(msg: Mock_1):
+        return Ok(Mock_2(num=2))
+    await bus.sub(Mock_1, sub_test)
+
+    for _ in range(3):
+        r = (await bus.pubr(Mock_1(num=1))).unwrap()
+        assert r.num == 2
+    assert bus.get_pending_reqs_count() == 0
+
+async def test_timeout(bus: Bus):
+    r = await asyncio.wait_for(
+        bus.pubr(Mock_1(num=1), PubOpts(pubr_timeout=0.1)), 1
+    )
+    assert isinstance(r, Err)
+    assert r.is_(BusEcode.Timeout)
+    assert bus.get_pending_reqs_count() == 0
+
+async def test_cancel_on_disconnect(bus: Bus):
+    con = MockCon(ConArgs(core=None))
+    con_task = asyncio.create_task(bus.con(con))
+    await asyncio.wait_for(con.client__recv(), 1)
+
+    pubr_task = asyncio.create_task(bus.pubr(
+        Mock_1(num=1),
+        PubOpts(target_consids=[con.sid], send_to_inner=False)
+    ))
+    await asyncio.wait_for(con.client__recv(), 1)
+    assert bus.get_pending_reqs_count() == 1
+
+    (await bus.close_con(con.sid)).unwrap()
+    r = await asyncio.wait_for(pubr_task, 1)
+    assert isinstance(r, Err)
+    assert r.is_(ecode.NotFound)
+    assert bus.get_pending_reqs_count() == 0
+
+    con_task.cancel()
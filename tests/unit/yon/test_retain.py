@@ -0,0 +1,104 @@
+import asyncio
+
+from pydantic import BaseModel
+from ryz.core import Err, Ok
+
+from orwynn.yon.server import Bus, RetainOpts, SubOpts
+from orwynn.yon.server.msg import Envelope
+from orwynn.yon.server.retain import RetainCache
+from orwynn.yon.server.timer import TimerWheel
+from tests.unit.yon.conftest import Mock_1, Mock_2
+
+
+class DictMsg(BaseModel):
+    nums: list[int]
+
+async def collect(bus: Bus, msgtype: type, opts: SubOpts = SubOpts()):
+    nums: list[int] = []
+    async def sub_test(msg):
+        nums.append(msg.num)
+        return Ok()
+    await bus.sub(msgtype, sub_test, opts)
+    return nums
+
+async def test_opt_in(bus: Bus):
+    bus.set_code_retention(Mock_1.code(), RetainOpts())
+    for num in range(3):
+        (await bus.pub(Mock_1(num=num))).unwrap()
+        (await bus.pub(Mock_2(num=num))).unwrap()
+
+    assert await collect(bus, Mock_1) == [2]
+    assert await collect(bus, Mock_2) == []
+    assert await collect(bus, Mock_1, SubOpts(recv_last_msg=False)) == []
+
+async def test_key_field(bus: Bus):
+    bus.set_code_retention(Mock_1.code(), RetainOpts(key_field="num"))
+    for num in [1, 2, 1, 3]:
+        (await bus.pub(Mock_1(num=num))).unwrap()
+    assert await collect(bus, Mock_1) == [2, 1, 3]
+
+async def test_ttl(bus: Bus):
+    bus.set_code_retention(Mock_1.code(), RetainOpts(ttl=0.1))
+    (await bus.pub(Mock_1(num=1))).unwrap()
+    await asyncio.sleep(0.3)
+    assert await collect(bus, Mock_1) == []
+
+def test_lru_budget():
+    size = 10
+    cache = RetainCache(TimerWheel(), size * 2)
+    cache.set_opts(Mock_1.code(), RetainOpts(key_field="num"))
+    cache.set_opts(Mock_2.code(), RetainOpts())
+    bmsgs = [
+        Envelope(skip__code=Mock_1.code(), msg=Mock_1(num=num))
+        for num in range(2)
+    ]
+
+    cache.put(Mock_1.code(), bmsgs[0], size).unwrap()
+    cache.put(
+        Mock_2.code(),
+        Envelope(skip__code=Mock_2.code(), msg=Mock_2(num=2)),
+        size
+    ).unwrap()
+    # access makes mock_1 recently used, so mock_2 is evicted on overflow
+    cache.get(Mock_1.code())
+    cache.put(Mock_1.code(), bmsgs[1], size).unwrap()
+    assert cache.size == size * 2
+    assert cache.get(Mock_1.code()) == bmsgs
+    assert cache.get(Mock_2.code()) == []
+
+def test_unhashable_key():
+    cache = RetainCache(TimerWheel(), 1024)
+    cache.set_opts("dict_msg", RetainOpts(key_field="nums"))
+    r = cache.put(
+        "dict_msg",
+        Envelope(skip__code="dict_msg", msg=DictMsg(nums=[1]))
+    )
+    assert isinstance(r, Err)
+    assert cache.get("dict_msg") == []
+
+def test_estimated_size():
+    cache = RetainCache(TimerWheel(), 1024 * 1024)
+    cache.set_opts("dict_msg", RetainOpts())
+    cache.set_opts("nested", RetainOpts())
+
+    msg = DictMsg(nums=list(range(1000)))
+    cache.put("dict_msg", Envelope(skip__code="dict_msg", msg=msg)).unwrap()
+    assert cache.size == len(msg.model_dump_json())
+
+    # nested values are counted too, not only the top-level container
+    cache.put(
+        "nested",
+        Envelope(skip__code="nested", msg={"a": {"b": "x" * 1000}})
+    ).unwrap()
+    assert cache.size > len(msg.model_dump_json()) + 1000
+
+async def test_retained_in_subfn_ctx(bus: Bus):
+    bus.set_code_retention(Mock_1.code(), RetainOpts())
+    (await bus.pub(Mock_1(num=1))).unwrap()
+
+    msids: list[str] = []
+    async def sub_test(msg: Mock_1):
+        msids.append(bus.get_ctx_key("msid").unwrap())
+        return Err("retained")
+    (await bus.sub(Mock_1, sub_test)).unwrap()
+    assert len(msids) == 1
@@ -0,0 +1,140 @@
+import asyncio
+
+from ryz.core import Code, Err, Ok
+from ryz.uuid import uuid4
+
+from orwynn.yon.server import (
+    Bus,
+    BusCfg,
+    ConArgs,
+    PubOpts,
+    SidStrategy,
+    StaticCodeid,
+    Transport,
+    WireFmt,
+    wire,
+)
+from orwynn.yon.server.codec import JsonCodec
+from orwynn.yon.server.msg import Envelope
+from orwynn.yon.server.sid import (
+    from_net_sid,
+    gen_sid,
+    set_sid_strategy,
+    to_int_sid,
+)
+from tests.unit.yon.conftest import Mock_1, Mock_2, MockCon
+
+
+def test_strategies():
+    set_sid_strategy(SidStrategy.Counter).unwrap()
+    first = int(gen_sid())
+    assert int(gen_sid()) == first + 1
+    assert int(Envelope(skip__code="yon::mock_1", msg=None).sid) == first + 2
+
+    set_sid_strategy(SidStrategy.Uuid).unwrap()
+    assert len(gen_sid()) == 32
+    # the counter continues, never repeating sids
+    set_sid_strategy(SidStrategy.Counter).unwrap()
+    assert int(gen_sid()) == first + 3
+
+    set_sid_strategy(SidStrategy.Uuid).unwrap()
+    assert isinstance(set_sid_strategy("xml"), Err)
+
+def test_int_sid_conversion():
+    assert to_int_sid("0") == 0
+    assert to_int_sid("123") == 123
+    assert to_int_sid(str(2**64 - 1)) == 2**64 - 1
+    for sid in ("", "01", "-1", "1.5", "abc", "١٢", str(2**64), uuid4()):
+        assert to_int_sid(sid) is None
+
+    assert from_net_sid(5) == "5"
+    assert from_net_sid("s1") == "s1"
+    for sid in (None, "", True, -1, 2**64, 1.5):
+        assert from_net_sid(sid) is None
+
+def test_wire_int_sids():
+    codec = JsonCodec()
+    for rbmsg in [
+        {"sid": "12", "codeid": 5, "lsid": "7", "msg": {"num": 1}},
+        {"sid": "12", "codeid": 5, "lsid": uuid4()},
+        {"sid": uuid4(), "codeid": 5, "lsid": "01"},
+    ]:
+        data = wire.encode(rbmsg, codec, WireFmt.Bin, is_sid_int=True)
+        assert wire.decode(data, codec) == rbmsg
+
+    rbmsg = {"sid": "12", "codeid": 5, "lsid": "7"}
+    data = wire.encode(rbmsg, codec, WireFmt.Json, is_sid_int=True)
+    assert wire.decode(data, codec) == {"sid": 12, "codeid": 5, "lsid": 7}
+    # the shared rbmsg isn't modified
+    assert rbmsg == {"sid": "12", "codeid": 5, "lsid": "7"}
+
+async def test_counter_bus():
+    bus = Bus.ie()
+    await bus.init(BusCfg(
+        transports=[Transport(is_server=True, con_type=MockCon)],
+        reg_regular_codes=[Mock_1, Mock_2],
+        sid_strategy=SidStrategy.Counter
+    ))
+    async def sub_test(msg: Mock_1):
+        return Ok(Mock_2(num=msg.num))
+    await bus.sub(Mock_1, sub_test)
+
+    con = MockCon(ConArgs(core=None))
+    con_task = asyncio.create_task(bus.con(con))
+    welcome = await asyncio.wait_for(con.client__recv(), 1)
+    assert welcome["msg"]["sid_strategy"] == SidStrategy.Counter
+
+    await con.client__send({
+        "sid": uuid4(),
+        "codeid": StaticCodeid.SetWireFmt,
+        "msg": {"fmt": WireFmt.Json, "is_sid_int": True}
+    })
+    response = await asyncio.wait_for(con.client__recv(), 1)
+    assert response["codeid"] == StaticCodeid.Ok
+    assert con.is_sid_int()
+
+    # int sids are accepted from the client, and linked back as ints
+    await con.client__send({
+        "sid": 5,
+        "codeid": (await Code.get_regd_codeid_by_type(Mock_1)).unwrap(),
+        "msg": {"num": 1}
+    })
+    response = await asyncio.wait_for(con.client__recv(), 1)
+    assert response["lsid"] == 5
+    assert isinstance(response["sid"], int)
+    assert response["msg"] == {"num": 1}
+
+    con_task.cancel()
+
+async def test_response_from_other_con(bus: Bus):
+    cons = [MockCon(ConArgs(core=None)) for _ in range(2)]
+    con_tasks = [asyncio.create_task(bus.con(con)) for con in cons]
+    for con in cons:
+        await asyncio.wait_for(con.client__recv(), 1)
+
+    pubr_task = asyncio.create_task(bus.pubr(
+        Mock_1(num=1),
+        PubOpts(
+            target_consids=[cons[0].sid],
+            send_to_inner=False,
+            pubr_timeout=0.5
+        )
+    ))
+    req = await asyncio.wait_for(cons[0].client__recv(), 1)
+    codeid = (await Code.get_regd_codeid_by_type(Mock_2)).unwrap()
+
+    # not a target of the req => ignored
+    await cons[1].client__send({
+        "sid": uuid4(), "lsid": req["sid"], "codeid": codeid, "msg": {"num": 2}
+    })
+    await asyncio.sleep(0.05)
+    assert bus.get_pending_reqs_count() == 1
+
+    await cons[0].client__send({
+        "sid": uuid4(), "lsid": req["sid"], "codeid": codeid, "msg": {"num": 3}
+    })
+    r = (await asyncio.wait_for(pubr_task, 1)).unwrap()
+    assert r.num == 3
+
+    for task in con_tasks:
+        task.cancel()
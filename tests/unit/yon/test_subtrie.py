@@ -0,0 +1,119 @@
+from ryz.core import Err, Ok
+
+from orwynn.yon.server import Bus, PubOpts, RetainOpts, SubOpts
+from orwynn.yon.server.subtrie import SubTrie, match_pattern
+from tests.unit.yon.conftest import EmptyMock, Mock_1, Mock_2
+
+
+def test_match():
+    trie = SubTrie()
+    patterns = [
+        "app::telemetry::*",
+        "app::**",
+        "**",
+        "app::*::cpu",
+        "app::**::load",
+        "other::*",
+    ]
+    for i, pattern in enumerate(patterns):
+        trie.add(pattern, str(i), i).unwrap()
+
+    for code, expected in (
+        ("app::telemetry::cpu", [0, 1, 2, 3]),
+        ("app::telemetry::cpu::load", [1, 2, 4]),
+        ("app::load", [1, 2, 4]),
+        ("app", [1, 2]),
+        ("other::x", [2, 5]),
+        ("other::x::y", [2]),
+    ):
+        assert trie.match(code) == expected, code
+        for i, pattern in enumerate(patterns):
+            assert match_pattern(pattern, code) == (i in expected)
+
+def test_remove():
+    trie = SubTrie()
+    trie.add("app::*", "1", 1).unwrap()
+    trie.add("app::*", "2", 2).unwrap()
+    assert trie.match("app::x") == [1, 2]
+
+    assert trie.remove("1")
+    assert not trie.remove("1")
+    assert trie.match("app::x") == [2]
+    assert trie.remove("2")
+    assert trie.match("app::x") == []
+    assert len(trie) == 0
+    # emptied nodes are pruned
+    assert not trie._root.children
+
+def test_invalid():
+    trie = SubTrie()
+    for pattern in ("app::tele*", "app::::*", "*::"):
+        assert isinstance(trie.add(pattern, "1", 1), Err)
+    assert len(trie) == 0
+
+async def test_sub_pattern(bus: Bus):
+    calls: list[str] = []
+    async def sub_exact(msg: Mock_1):
+        calls.append("exact Mock_1")
+        return Ok()
+    async def sub_yon(msg):
+        calls.append(f"yon {type(msg).__name__}")
+        return Ok()
+    async def sub_all(msg):
+        calls.append(f"all {type(msg).__name__}")
+        return Ok()
+
+    assert isinstance(await bus.sub("yon::mock_*", sub_exact), Err)
+    (await bus.sub(Mock_1, sub_exact)).unwrap()
+    unsub_yon = (await bus.sub("yon::*", sub_yon)).unwrap()
+    (await bus.sub("**", sub_all)).unwrap()
+
+    (await bus.pub(Mock_1(num=1), PubOpts(send_to_net=False))).unwrap()
+    # exact subfns go first
+    assert [call for call in calls if call.endswith("Mock_1")] == [
+        "exact Mock_1", "yon Mock_1", "all Mock_1"
+    ]
+    # ok responses of the 3 subfns are received by the pattern subfns, but
+    # not acknowledged, otherwise they would loop
+    assert sorted(calls) == sorted([
+        "exact Mock_1",
+        "yon Mock_1",
+        "all Mock_1",
+        *["yon ok"] * 3,
+        *["all ok"] * 3
+    ])
+
+    calls.clear()
+    unsub_yon()
+    (await bus.pub(Mock_2(num=2), PubOpts(send_to_net=False))).unwrap()
+    assert calls == ["all Mock_2", "all ok"]
+
+async def test_unsub_one_of_code(bus: Bus):
+    nums: list[int] = []
+    async def sub_1(msg: Mock_1):
+        nums.append(1)
+        return Ok()
+    async def sub_2(msg: Mock_1):
+        nums.append(2)
+        return Ok()
+    unsub_1 = (await bus.sub(Mock_1, sub_1)).unwrap()
+    (await bus.sub(Mock_1, sub_2)).unwrap()
+    unsub_1()
+    (await bus.pub(Mock_1(num=1), PubOpts(send_to_net=False))).unwrap()
+    assert nums == [2]
+
+async def test_pattern_recv_last_msg(bus: Bus):
+    bus.set_code_retention(Mock_1.code(), RetainOpts())
+    bus.set_code_retention(EmptyMock.code(), RetainOpts())
+    (await bus.pub(Mock_1(num=1), PubOpts(send_to_net=False))).unwrap()
+    (await bus.pub(EmptyMock(), PubOpts(send_to_net=False))).unwrap()
+
+    msgs: list = []
+    async def sub_test(msg):
+        msgs.append(msg)
+        return Ok()
+    (await bus.sub(
+        "yon::*", sub_test, SubOpts(recv_last_msg=True)
+    )).unwrap()
+    assert Mock_1(num=1) in msgs
+    assert EmptyMock() in msgs
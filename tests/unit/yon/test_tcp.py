@@ -0,0 +1,67 @@
+import asyncio
+
+from ryz.core import Code, Ok, Res
+from ryz.uuid import uuid4
+
+from orwynn.yon.server import Bus, BusCfg, PubOpts, Tcp, TcpServer, Transport
+from tests.unit.yon.conftest import Mock_1
+
+
+async def init(**transport_kwargs) -> tuple[Bus, TcpServer]:
+    bus = Bus.ie()
+    transport = Transport(
+        is_server=True,
+        con_type=Tcp,
+        host="127.0.0.1",
+        **transport_kwargs
+    )
+    await bus.init(BusCfg(transports=[transport], reg_regular_codes=[Mock_1]))
+    server = await TcpServer.serve(transport, bus.con)
+    return bus, server
+
+async def test_send_recv():
+    bus, server = await init()
+    client = await Tcp.connect(*server.addr[:2])
+    welcome = await asyncio.wait_for(client.recv(), 1)
+    assert welcome["msg"]["codes"]
+
+    got: asyncio.Queue[Mock_1] = asyncio.Queue()
+    async def subfn(msg: Mock_1) -> Res[None]:
+        await got.put(msg)
+        return Ok()
+    (await bus.sub(Mock_1, subfn)).unwrap()
+    codeid = (await Code.get_regd_codeid_by_type(Mock_1)).unwrap()
+    await client.send({"sid": uuid4(), "codeid": codeid, "msg": {"num": 1}})
+    assert (await asyncio.wait_for(got.get(), 1)).num == 1
+
+    await client.close()
+    server.close()
+
+async def test_batch_as_frames():
+    bus, server = await init(out_batch_max_count=10)
+    client = await Tcp.connect(*server.addr[:2])
+    await asyncio.wait_for(client.recv(), 1)
+    consid = next(iter(bus._sid_to_con))
+
+    for num in range(3):
+        (await bus.pub(
+            Mock_1(num=num), PubOpts(target_consids=[consid])
+        )).unwrap()
+    # each rbmsg of a batch arrives as its own frame
+    for num in range(3):
+        rbmsg = await asyncio.wait_for(client.recv(), 1)
+        assert rbmsg["msg"] == {"num": num}
+
+    await client.close()
+    server.close()
+
+async def test_closed_by_client():
+    bus, server = await init()
+    client = await Tcp.connect(*server.addr[:2])
+    await asyncio.wait_for(client.recv(), 1)
+    assert len(bus._sid_to_con) == 1
+
+    await client.close()
+    await asyncio.sleep(0.1)
+    assert not bus._sid_to_con
+    server.close()
@@ -0,0 +1,148 @@
+import asyncio
+import json
+from pathlib import Path
+
+from ryz.core import Code, Ok
+from ryz.uuid import uuid4
+
+from orwynn.yon.server import (
+    Bus,
+    BusCfg,
+    ConArgs,
+    FileSpanExporter,
+    MemorySpanExporter,
+    PubOpts,
+    StaticCodeid,
+    Tracer,
+    Transport,
+)
+from orwynn.yon.server.tracing import Span
+from tests.unit.yon.conftest import Mock_1, Mock_2, MockCon
+
+
+async def init_bus(exporter: MemorySpanExporter, sample_rate: float) -> Bus:
+    bus = Bus.ie()
+    await bus.init(BusCfg(
+        transports=[Transport(is_server=True, con_type=MockCon)],
+        reg_regular_codes=[Mock_1, Mock_2],
+        tracer=Tracer(exporter, sample_rate)
+    ))
+    return bus
+
+async def recv_traced(bus: Bus, exporter: MemorySpanExporter):
+    async def sub_mock_1(msg: Mock_1):
+        (await bus.pub(Mock_2(num=msg.num), PubOpts(send_to_net=False))) \
+            .unwrap()
+        return Ok()
+    async def sub_mock_2(msg: Mock_2):
+        return Ok()
+    await bus.sub(Mock_1, sub_mock_1)
+    await bus.sub(Mock_2, sub_mock_2)
+
+    con = MockCon(ConArgs(core=None))
+    con_task = asyncio.create_task(bus.con(con))
+    await asyncio.wait_for(con.client__recv(), 1)
+    exporter.clear()
+
+    await con.client__send({
+        "sid": uuid4(),
+        "codeid": (await Code.get_regd_codeid_by_type(Mock_1)).unwrap(),
+        "msg": {"num": 1}
+    })
+    r = await asyncio.wait_for(con.client__recv(), 1)
+    assert r["codeid"] == StaticCodeid.Ok
+    # let the writer finish the send span
+    await asyncio.sleep(0.01)
+    con_task.cancel()
+
+def find(spans: list[Span], name: str) -> Span:
+    found = [span for span in spans if span.name == name]
+    assert len(found) == 1, (name, [span.name for span in spans])
+    return found[0]
+
+def find_children(spans: list[Span], parent: Span, name: str) -> list[Span]:
+    return [
+        span for span in spans
+        if span.name == name and span.parent_span_id == parent.span_id
+    ]
+
+async def test_trace():
+    exporter = MemorySpanExporter()
+    bus = await init_bus(exporter, 1)
+    await recv_traced(bus, exporter)
+
+    spans = exporter.get_spans()
+    assert len({span.trace_id for span in spans}) == 1
+
+    recv = find(spans, "yon recv yon::mock_1")
+    assert recv.parent_span_id is None
+    deser = find(spans, "yon deser")
+    assert deser.parent_span_id == recv.span_id
+    pub_1 = find(spans, "yon pub yon::mock_1")
+    assert pub_1.parent_span_id == recv.span_id
+    subfn_1 = find(
+        spans,
+        "yon subfn tests.unit.yon.test_tracing.recv_traced.<locals>"
+        ".sub_mock_1"
+    )
+    assert subfn_1.parent_span_id == pub_1.span_id
+
+    # msgs published by the subfn are linked to the msg which triggered it
+    pub_2 = find(spans, "yon pub yon::mock_2")
+    assert pub_2.parent_span_id == subfn_1.span_id
+    pub_ok = find_children(spans, subfn_1, "yon pub yon::ok")
+    assert len(pub_ok) == 1
+
+    # the response is sent to the con
+    assert len(find_children(spans, pub_ok[0], "yon ser")) == 1
+    assert len(find_children(spans, pub_ok[0], "yon send")) == 1
+
+    for span in spans:
+        assert span.start_time <= span.end_time
+        assert not span.is_err
+
+    otlp = exporter.to_otlp()
+    otlp_spans = otlp["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert len(otlp_spans) == len(spans)
+    otlp_recv = next(s for s in otlp_spans if s["name"] == recv.name)
+    assert len(otlp_recv["traceId"]) == 32
+    assert len(otlp_recv["spanId"]) == 16
+    assert "parentSpanId" not in otlp_recv
+    assert {"key": "yon.code", "value": {"stringValue": "yon::mock_1"}} \
+        in otlp_recv["attributes"]
+
+async def test_unsampled():
+    exporter = MemorySpanExporter()
+    bus = await init_bus(exporter, 0)
+    await recv_traced(bus, exporter)
+    assert exporter.get_spans() == []
+
+async def test_ctx_span():
+    exporter = MemorySpanExporter()
+    bus = await init_bus(exporter, 1)
+    with bus.trace_ctx_span("outer") as outer:
+        assert outer is not None
+        assert bus.get_ctx_span_ctx() == outer.ctx
+        await bus.pub(Mock_1(num=1))
+    assert bus.get_ctx_span_ctx() is None
+
+    pub = find(exporter.get_spans(), "yon pub yon::mock_1")
+    assert pub.parent_span_id == outer.span_id
+
+def test_file_exporter(tmp_path: Path):
+    path = Path(tmp_path, "spans.jsonl")
+    tracer = Tracer(FileSpanExporter(path, batch_size=2))
+    for i in range(3):
+        tracer.end(tracer.start(f"span {i}"))
+    tracer.close()
+
+    lines = path.read_text().splitlines()
+    assert len(lines) == 2
+    names = [
+        span["name"]
+        for line in lines
+        for span in json.loads(line)["resourceSpans"][0]["scopeSpans"][0][
+            "spans"
+        ]
+    ]
+    assert names == ["span 0", "span 1", "span 2"]
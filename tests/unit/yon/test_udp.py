@@ -0,0 +1,264 @@
+import asyncio
+import contextlib
+import socket
+import struct
+
+import pytest
+from ryz.core import Code
+
+from orwynn.yon.server import (
+    Bus,
+    BusCfg,
+    PubOpts,
+    Transport,
+    Udp,
+    UdpEndpoint,
+)
+from orwynn.yon.server.udp import IP_UDP_HEADERS_SIZE, Kind
+from tests.unit.yon.conftest import Mock_1, Mock_2
+
+
+class LossyUdpEndpoint(UdpEndpoint):
+    """
+    Endpoint which drops the given number of next received data datagrams.
+    """
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.drop_count = 0
+
+    def datagram_received(self, data, addr):
+        if self.drop_count > 0 and data[0] == Kind.Data:
+            self.drop_count -= 1
+            return
+        super().datagram_received(data, addr)
+
+async def bind(endpoint: UdpEndpoint, port: int = 0) -> UdpEndpoint:
+    await asyncio.get_running_loop().create_datagram_endpoint(
+        lambda: endpoint,
+        local_addr=("127.0.0.1", port)
+    )
+    return endpoint
+
+async def pair(
+    server_type: type[UdpEndpoint] = UdpEndpoint, **kwargs
+) -> tuple[UdpEndpoint, UdpEndpoint, Udp, Udp]:
+    accepted: asyncio.Queue[Udp] = asyncio.Queue()
+    server = await bind(server_type(accepted.put, **kwargs))
+    client = await bind(UdpEndpoint(**kwargs))
+    client_con = await client.connect(server.addr, 1)
+    server_con = await asyncio.wait_for(accepted.get(), 1)
+    return server, client, server_con, client_con
+
+def sendto_raw(addr, data: bytes) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    sock.bind(("127.0.0.1", 0))
+    sock.sendto(data, addr)
+    return sock
+
+async def test_send_recv():
+    server, client, server_con, client_con = await pair()
+
+    await client_con.send({"codeid": 1, "msg": {"num": 1}})
+    assert await asyncio.wait_for(server_con.recv(), 1) == {
+        "codeid": 1, "msg": {"num": 1}
+    }
+    await server_con.send({"codeid": 2, "msg": {"num": 2}})
+    assert await asyncio.wait_for(client_con.recv(), 1) == {
+        "codeid": 2, "msg": {"num": 2}
+    }
+    assert server.get_sessions_count() == 1
+
+    server_con.close_nowait()
+    assert server.get_sessions_count() == 0
+    server.close()
+    client.close()
+
+async def test_no_session_without_cookie():
+    accepted: asyncio.Queue[Udp] = asyncio.Queue()
+    server = await bind(UdpEndpoint(accepted.put))
+
+    # data and hellos without a valid cookie don't open sessions
+    sock = sendto_raw(
+        server.addr, struct.pack("!BBIHH", Kind.Data, 1, 1, 0, 1)
+    )
+    hello = struct.pack("!B16s8s", Kind.Hello, bytes(16), b"n" * 8)
+    sock.sendto(hello, server.addr)
+    sock.sendto(
+        struct.pack("!B16s8s", Kind.Hello, b"x" * 16, b"n" * 8), server.addr
+    )
+    await asyncio.sleep(0.1)
+    assert accepted.empty()
+    assert server.get_sessions_count() == 0
+
+    # only cookie replies, no larger than the hellos, are sent back
+    replies = []
+    with contextlib.suppress(BlockingIOError):
+        while True:
+            replies.append(sock.recv(2048))
+    assert len(replies) == 2
+    assert all(
+        reply[0] == Kind.Cookie and len(reply) <= len(hello)
+        for reply in replies
+    )
+    sock.close()
+    server.close()
+
+async def test_close():
+    server, client, server_con, client_con = await pair()
+
+    # closes without the session cookie are ignored
+    sock = sendto_raw(
+        server.addr, struct.pack("!B16s", Kind.Close, bytes(16))
+    )
+    client.sendto(struct.pack("!B16s", Kind.Close, b"x" * 16), server.addr)
+    await asyncio.sleep(0.1)
+    assert server.get_sessions_count() == 1
+    sock.close()
+
+    await client_con.close()
+    with pytest.raises(ConnectionResetError):
+        await asyncio.wait_for(server_con.recv(), 1)
+    assert server.get_sessions_count() == 0
+    server.close()
+    client.close()
+
+async def test_idle_closed():
+    server, client, server_con, client_con = await pair(idle_timeout=0.1)
+    with pytest.raises(ConnectionResetError):
+        await asyncio.wait_for(server_con.recv(), 1)
+    assert server.get_sessions_count() == 0
+    # the peer is told about the close
+    with pytest.raises(ConnectionResetError):
+        await asyncio.wait_for(client_con.recv(), 1)
+    server.close()
+    client.close()
+
+async def test_restarted_peer():
+    accepted: asyncio.Queue[Udp] = asyncio.Queue()
+    server = await bind(UdpEndpoint(accepted.put))
+    client = await bind(UdpEndpoint())
+    client_con = await client.connect(server.addr, 1)
+    server_con = await asyncio.wait_for(accepted.get(), 1)
+    await client_con.send({"codeid": 1, "msg": {"num": 1}})
+    await asyncio.wait_for(server_con.recv(), 1)
+
+    # the peer crashes without closing the session, then binds the same
+    # addr again, and starts seqs over
+    port = client.addr[1]
+    client._transport.abort()
+    await asyncio.sleep(0)
+    assert server.get_sessions_count() == 1
+    client = await bind(UdpEndpoint(), port)
+    client_con = await client.connect(server.addr, 1)
+    new_server_con = await asyncio.wait_for(accepted.get(), 1)
+    assert new_server_con is not server_con
+    with pytest.raises(ConnectionResetError):
+        await server_con.recv()
+    assert server.get_sessions_count() == 1
+
+    await client_con.send({"codeid": 1, "msg": {"num": 2}})
+    assert (await asyncio.wait_for(new_server_con.recv(), 1))["msg"] == {
+        "num": 2
+    }
+    server.close()
+    client.close()
+
+async def test_fragmentation():
+    server, client, server_con, client_con = await pair(
+        mtu=IP_UDP_HEADERS_SIZE + 10 + 20
+    )
+
+    text = "x" * 500
+    await client_con.send({"codeid": 1, "msg": {"text": text}})
+    assert (await asyncio.wait_for(server_con.recv(), 1))["msg"] == {
+        "text": text
+    }
+    server.close()
+    client.close()
+
+async def test_forged_frag_count():
+    server, client, server_con, client_con = await pair(max_msg_size=1024)
+    assert server.max_frag_count == 1
+
+    client.sendto(
+        struct.pack("!BBIHH", Kind.Data, 0, 1, 0, 2**16 - 1) + b"x",
+        server.addr
+    )
+    await asyncio.sleep(0.1)
+    assert not server_con._seq_to_partial
+    server.close()
+    client.close()
+
+async def test_resend_lost():
+    server, client, server_con, client_con = await pair(
+        LossyUdpEndpoint, rto=0.05
+    )
+    server.drop_count = 1
+
+    await client_con.send({"codeid": 1, "msg": {"num": 1}})
+    assert (await asyncio.wait_for(server_con.recv(), 1))["msg"] == {
+        "num": 1
+    }
+    # wait for the ack
+    await asyncio.sleep(0.05)
+    assert not client_con._seq_to_outgoing
+    server.close()
+    client.close()
+
+async def test_unreliable_not_resent():
+    server, client, server_con, client_con = await pair(
+        LossyUdpEndpoint, rto=0.05
+    )
+    server.drop_count = 1
+
+    await client_con.send_raw_unreliable(b'{"codeid": 1, "msg": {"num": 1}}')
+    await client_con.send_raw_unreliable(b'{"codeid": 1, "msg": {"num": 2}}')
+    assert (await asyncio.wait_for(server_con.recv(), 1))["msg"] == {
+        "num": 2
+    }
+    await asyncio.sleep(0.2)
+    assert server_con._inp.empty()
+    server.close()
+    client.close()
+
+async def test_bus_unreliable_codes():
+    bus = Bus.ie()
+    transport = Transport(
+        is_server=True,
+        con_type=Udp,
+        host="127.0.0.1",
+        unreliable_codes={Mock_2.code()}
+    )
+    await bus.init(BusCfg(
+        transports=[transport],
+        reg_regular_codes=[Mock_1, Mock_2]
+    ))
+    server = await UdpEndpoint.serve(transport, bus.con)
+    client = await bind(UdpEndpoint())
+    client_con = await client.connect(server.addr, 1)
+
+    welcome = await asyncio.wait_for(client_con.recv(), 1)
+    assert welcome["msg"]["codes"]
+    server_con = next(iter(server._addr_to_con.values()))
+    sent: list[tuple[bytes, bool]] = []
+    send_msg = server_con._send_msg
+    async def spy(data: bytes, is_reliable: bool):
+        sent.append((data, is_reliable))
+        await send_msg(data, is_reliable)
+    server_con._send_msg = spy
+
+    opts = PubOpts(target_consids=[server_con.sid])
+    (await bus.pub(Mock_1(num=1), opts)).unwrap()
+    (await bus.pub(Mock_2(num=2), opts)).unwrap()
+    codeids = [
+        (await Code.get_regd_codeid_by_type(t)).unwrap()
+        for t in (Mock_1, Mock_2)
+    ]
+    for codeid in codeids:
+        rbmsg = await asyncio.wait_for(client_con.recv(), 1)
+        assert rbmsg["codeid"] == codeid
+    assert [is_reliable for _, is_reliable in sent] == [True, False]
+
+    server.close()
+    client.close()
@@ -0,0 +1,53 @@
+import asyncio
+import socket
+from pathlib import Path
+
+import pytest
+
+from orwynn.yon.server import Bus, BusCfg, PubOpts, Transport, Uds, UdsServer
+from tests.unit.yon.conftest import Mock_1
+
+
+async def test_send_recv(tmp_path: Path):
+    bus = Bus.ie()
+    transport = Transport(
+        is_server=True,
+        con_type=Uds,
+        path=str(Path(tmp_path, "yon.sock"))
+    )
+    await bus.init(BusCfg(transports=[transport], reg_regular_codes=[Mock_1]))
+    # a stale socket file from a previous run is replaced
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(transport.path)
+    stale.close()
+    server = await UdsServer.serve(transport, bus.con)
+
+    client = await Uds.connect_unix(transport.path)
+    welcome = await asyncio.wait_for(client.recv(), 1)
+    assert welcome["msg"]["codes"]
+    assert isinstance(next(iter(bus._sid_to_con.values())), Uds)
+
+    consid = next(iter(bus._sid_to_con))
+    (await bus.pub(Mock_1(num=1), PubOpts(target_consids=[consid]))).unwrap()
+    assert (await asyncio.wait_for(client.recv(), 1))["msg"] == {"num": 1}
+
+    await client.close()
+    server.close()
+    assert not Path(transport.path).exists()
+
+async def test_live_socket_kept(tmp_path: Path):
+    transport = Transport(
+        is_server=True,
+        con_type=Uds,
+        path=str(Path(tmp_path, "yon.sock"))
+    )
+    live = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    live.bind(transport.path)
+    live.listen()
+
+    async def on_con(con: Uds):
+        await con.close()
+    with pytest.raises(OSError):
+        await UdsServer.serve(transport, on_con)
+    assert Path(transport.path).exists()
+    live.close()
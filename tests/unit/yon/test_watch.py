@@ -0,0 +1,79 @@
+import asyncio
+
+from ryz.core import Code
+from ryz.uuid import uuid4
+
+from orwynn.yon.server import Bus, BusCfg, ConArgs, Transport
+from orwynn.yon.server.timer import TimerWheel
+from orwynn.yon.server.watch import ConWatcher
+from tests.unit.yon.conftest import Mock_1, MockCon
+
+
+def test_timer_wheel_levels():
+    wheel = TimerWheel(tick=1, size=4, levels=2)
+    fired: list[tuple[int, int]] = []
+    # 3 and 4 are at the first level, 5 and 16 at the second, and 100 is
+    # beyond the range of both levels
+    for delay in (100, 16, 5, 4, 3):
+        wheel.add(
+            delay, lambda delay=delay: fired.append((delay, wheel.now))
+        )
+    wheel.advance(200)
+    assert fired == [(3, 3), (4, 4), (5, 5), (16, 16), (100, 100)]
+
+def test_con_watcher():
+    wheel = TimerWheel(tick=1, size=4)
+    idle: list[str] = []
+    pinged: list[tuple[str, int]] = []
+    watcher = ConWatcher(
+        wheel,
+        lambda con: idle.append(con.sid),
+        lambda con: pinged.append((con.sid, wheel.now))
+    )
+    con = MockCon(ConArgs(core=None))
+    watcher.watch(con, 10, 3)
+
+    wheel.advance(2)
+    watcher.touch(con.sid)
+    wheel.advance(4)
+    assert pinged == [(con.sid, 5)]
+    wheel.advance(5)
+    assert pinged == [(con.sid, 5), (con.sid, 8), (con.sid, 11)]
+    assert idle == []
+    wheel.advance()
+    assert idle == [con.sid]
+    assert len(watcher) == 0
+
+    wheel.advance(20)
+    assert len(pinged) == 3
+
+async def test_inactivity_timeout():
+    bus = Bus.ie()
+    await bus.init(BusCfg(
+        timer_tick=0.01,
+        transports=[
+            Transport(
+                is_server=True,
+                con_type=MockCon,
+                inactivity_timeout=0.1
+            )
+        ],
+        reg_regular_codes=[Mock_1]
+    ))
+    con = MockCon(ConArgs(core=None))
+    con_task = asyncio.create_task(bus.con(con))
+    await asyncio.wait_for(con.client__recv(), 1)
+
+    codeid = (await Code.get_regd_codeid_by_type(Mock_1)).unwrap()
+    for _ in range(4):
+        await asyncio.sleep(0.05)
+        await con.client__send({
+            "sid": uuid4(), "codeid": codeid, "msg": {"num": 1}
+        })
+    assert not con.is_closed()
+
+    await asyncio.sleep(0.2)
+    assert con.is_closed()
+    assert con.sid not in bus._sid_to_con
+
+    con_task.cancel()
@@ -0,0 +1,203 @@
+import asyncio
+
+import pytest
+from ryz.core import Code, Ok
+from ryz.uuid import uuid4
+
+from orwynn.yon.server import (
+    Bus,
+    BusCfg,
+    ConArgs,
+    PubOpts,
+    StaticCodeid,
+    Transport,
+    WireFmt,
+    wire,
+)
+from orwynn.yon.server.codec import JsonCodec
+from orwynn.yon.server.sid import MAX_SID_SIZE, from_net_sid
+from tests.unit.yon.conftest import Mock_1, MockCon
+
+
+def test_bin_roundtrip():
+    codec = JsonCodec()
+    for rbmsg in [
+        {"sid": uuid4(), "codeid": 5, "msg": {"num": 1}},
+        {"sid": uuid4(), "codeid": 1, "lsid": uuid4()},
+        {"sid": uuid4(), "codeid": 70000, "is_err": True, "msg": {"msg": "e"}}
+    ]:
+        data = wire.encode(rbmsg, codec, WireFmt.Bin)
+        assert len(data) < len(codec.encode(rbmsg))
+        assert wire.decode(data, codec) == rbmsg
+
+def test_decode_json():
+    codec = JsonCodec()
+    rbmsg = {"sid": uuid4(), "codeid": 5, "msg": {"num": 1}}
+    assert wire.decode(codec.encode(rbmsg), codec) == rbmsg
+    assert wire.decode(codec.encode(rbmsg).decode(), codec) == rbmsg
+
+def test_long_sid():
+    codec = JsonCodec()
+    with pytest.raises(ValueError):
+        wire.encode(
+            {"sid": "a" * (MAX_SID_SIZE + 1), "codeid": 5},
+            codec,
+            WireFmt.Bin
+        )
+    assert from_net_sid("a" * MAX_SID_SIZE) == "a" * MAX_SID_SIZE
+    assert from_net_sid("a" * (MAX_SID_SIZE + 1)) is None
+    # the limit is of utf-8 bytes, not of chars
+    assert from_net_sid("\u044f" * (MAX_SID_SIZE // 2 + 1)) is None
+
+async def test_long_sid_rejected(bus: Bus):
+    async def sub_test(msg: Mock_1):
+        return Ok()
+    await bus.sub(Mock_1, sub_test)
+    con = MockCon(ConArgs(core=None))
+    con_task = asyncio.create_task(bus.con(con))
+    await asyncio.wait_for(con.client__recv(), 1)
+
+    codeid = (await Code.get_regd_codeid_by_type(Mock_1)).unwrap()
+    # such sid couldn't be resent as lsid to bin cons
+    await con.client__send({
+        "sid": "a" * (MAX_SID_SIZE + 1), "codeid": codeid, "msg": {"num": 1}
+    })
+    sid = uuid4()
+    await con.client__send({"sid": sid, "codeid": codeid, "msg": {"num": 2}})
+    # the first rbmsg is dropped, so the response is to the second one
+    response = await asyncio.wait_for(con.client__recv(), 1)
+    assert response["lsid"] == sid
+
+    con_task.cancel()
+
+async def test_negotiate_bin(bus: Bus):
+    async def sub_test(msg: Mock_1):
+        return Ok()
+    await bus.sub(Mock_1, sub_test)
+
+    raws: list[bytes] = []
+    con = MockCon(ConArgs(core=None))
+    send_raw = con.send_raw
+    async def record(data: bytes, fmt: str | None = None):
+        raws.append(data)
+        await send_raw(data, fmt)
+    con.send_raw = record
+
+    con_task = asyncio.create_task(bus.con(con))
+    welcome = await asyncio.wait_for(con.client__recv(), 1)
+    assert WireFmt.Bin in welcome["msg"]["fmts"]
+
+    await con.client__send({
+        "sid": uuid4(),
+        "codeid": StaticCodeid.SetWireFmt,
+        "msg": {"fmt": WireFmt.Bin}
+    })
+    response = await asyncio.wait_for(con.client__recv(), 1)
+    assert response["codeid"] == StaticCodeid.Ok
+    assert con.get_wire_fmt() == WireFmt.Bin
+
+    await con.client__send({
+        "sid": uuid4(),
+        "codeid": (await Code.get_regd_codeid_by_type(Mock_1)).unwrap(),
+        "msg": {"num": 1}
+    })
+    await asyncio.wait_for(con.client__recv(), 1)
+    # welcome is json, everything after the negotiation is bin
+    assert raws[0][:1] == b"{"
+    assert all(raw[:1] == b"\x01" for raw in raws[1:])
+
+    con_task.cancel()
+
+async def test_negotiate_unsupported(bus: Bus):
+    con = MockCon(ConArgs(core=None))
+    con_task = asyncio.create_task(bus.con(con))
+    await asyncio.wait_for(con.client__recv(), 1)
+    await con.client__send({
+        "sid": uuid4(),
+        "codeid": StaticCodeid.SetWireFmt,
+        "msg": {"fmt": "xml"}
+    })
+    response = await asyncio.wait_for(con.client__recv(), 1)
+    assert response["is_err"]
+    assert con.get_wire_fmt() == WireFmt.Json
+    con_task.cancel()
+
+def test_bin_batch_roundtrip():
+    codec = JsonCodec()
+    rbmsgs = [
+        {"sid": uuid4(), "codeid": i, "msg": {"num": i}} for i in range(3)
+    ]
+    for fmt in WireFmt.All:
+        data = wire.encode_batch(
+            [wire.encode(rbmsg, codec, fmt) for rbmsg in rbmsgs], fmt
+        )
+        assert wire.decode(data, codec) == rbmsgs
+
+async def test_out_batch():
+    bus = Bus.ie()
+    await bus.init(BusCfg(
+        transports=[
+            Transport(
+                is_server=True,
+                con_type=MockCon,
+                out_batch_max_count=3,
+                out_batch_flush_delay=0.05
+            )
+        ],
+        reg_regular_codes=[Mock_1]
+    ))
+    con = MockCon(ConArgs(core=None))
+    con_task = asyncio.create_task(bus.con(con))
+    await asyncio.wait_for(con.client__recv(), 1)
+
+    for i in range(5):
+        (await bus.pub(
+            Mock_1(num=i), PubOpts(target_consids=[con.sid])
+        )).unwrap()
+    first = await asyncio.wait_for(con.client__recv(), 1)
+    second = await asyncio.wait_for(con.client__recv(), 1)
+    assert [rbmsg["msg"]["num"] for rbmsg in first] == [0, 1, 2]
+    assert [rbmsg["msg"]["num"] for rbmsg in second] == [3, 4]
+
+    con_task.cancel()
+
+async def test_out_batch_keeps_queued_fmt():
+    bus = Bus.ie()
+    await bus.init(BusCfg(
+        transports=[
+            Transport(
+                is_server=True,
+                con_type=MockCon,
+                out_batch_max_count=3,
+                out_batch_flush_delay=0.05
+            )
+        ],
+        reg_regular_codes=[Mock_1]
+    ))
+    con = MockCon(ConArgs(core=None))
+    con_task = asyncio.create_task(bus.con(con))
+    await asyncio.wait_for(con.client__recv(), 1)
+
+    sent: list[tuple[bytes, str | None]] = []
+    send_raw = con.send_raw
+    async def record(data: bytes, fmt: str | None = None):
+        sent.append((data, fmt))
+        await send_raw(data, fmt)
+    con.send_raw = record
+
+    for i in range(3):
+        if i == 2:
+            # rbmsgs queued before the change stay in json
+            con.set_wire_fmt(WireFmt.Bin)
+        (await bus.pub(
+            Mock_1(num=i), PubOpts(target_consids=[con.sid])
+        )).unwrap()
+    first = await asyncio.wait_for(con.client__recv(), 1)
+    second = await asyncio.wait_for(con.client__recv(), 1)
+    assert [rbmsg["msg"]["num"] for rbmsg in first] == [0, 1]
+    assert second["msg"] == {"num": 2}
+    assert [(data[:1], fmt) for data, fmt in sent] == [
+        (b"[", WireFmt.Json), (b"\x01", WireFmt.Bin)
+    ]
+
+    con_task.cancel()